@@ -51,22 +51,72 @@ def _cfg():
     return None
 
 
-def _has_app():
+_SLOT_FILE = "ota_slot.json"
+_MAX_PENDING_BOOTS = 3
+# Read by ota.py from __main__: this bootstrap boots slots, so updates may be
+# staged into one. Older frozen bootstraps lack it and get updated in place.
+OTA_SLOTS = True
+
+
+def _select_slot():
+    """Return the app slot directory to boot ("" for a pre-slot install).
+
+    A freshly installed slot is "pending" until the app calls ota.mark_ready().
+    Each boot while pending is counted; after _MAX_PENDING_BOOTS the pointer
+    flips back to the previous slot and the failed version is remembered so
+    OTA does not reinstall it.
+    """
     try:
-        os.stat("bilalcast/main.py")
-        return True
+        with open(_SLOT_FILE) as f:
+            s = json.load(f)
     except Exception:
-        return False
+        return ""
+    if s.get("pending"):
+        if s.get("boots", 0) >= _MAX_PENDING_BOOTS and s.get("previous") is not None:
+            print("OTA: slot", s.get("active"), "never became ready, rolling back")
+            s = {
+                "active": s["previous"],
+                "previous": s.get("active"),
+                "version": s.get("prev_version"),
+                "prev_version": s.get("version"),
+                "bad_version": s.get("version"),
+                "pending": False,
+                "boots": 0,
+            }
+        else:
+            s["boots"] = s.get("boots", 0) + 1
+        try:
+            with open(_SLOT_FILE + ".tmp", "w") as f:
+                json.dump(s, f)
+            os.rename(_SLOT_FILE + ".tmp", _SLOT_FILE)
+        except Exception:
+            pass
+    return s.get("active") or ""
+
+
+def _has_app(slot):
+    for name in ("bilalcast/main.py", "bilalcast/main.mpy"):
+        try:
+            os.stat((slot + "/" if slot else "") + name)
+            return True
+        except Exception:
+            pass
+    return False
 
 
 _c = _cfg()
+_slot = _select_slot()
+if _slot:
+    # Must happen before anything imports the bilalcast package
+    import sys
+    sys.path.insert(0, "/" + _slot)
 
 if _c is None:
     import asyncio  # pyright: ignore[reportMissingImports]
     from bilalcast.captive_portal import captive_portal
     asyncio.run(captive_portal())
 
-elif _has_app():
+elif _has_app(_slot):
     try:
         import bilalcast.main
     except Exception as e:
@@ -0,0 +1,224 @@
+"""
+End-to-end cast latency, retries and heap per cast, against a fake receiver.
+
+Runs bilalcast's own receiver.start()/watch() (and with --mdns, its mDNS
+lookup) against fake_cast.py for each scenario below, RUNS times, and prints
+per scenario the median time to a confirmed LOAD, LOAD to PLAYING, the
+whole cast until the watcher lets go, the Cast connections it took (one per
+attempt, plus the volume restore after a failure), how the watcher ended,
+and the heap the cast used.
+
+    python3 bench/cast_latency.py [--plain] [--mdns] [--runs N] [--only SCENARIO]
+
+Heap is measured with tracemalloc under CPython, so its figures are CPython
+object sizes, several times what the same objects take on the Pico; compare
+them between scenarios or commits, not with gc.mem_free() on the device.
+Under the MicroPython unix port (micropython bench/cast_latency.py --port P,
+against a fake_cast.py started separately) only the "ok" scenario runs and
+heap is what gc.mem_alloc() shows retained after each cast.
+"""
+import gc
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hostport  # noqa: E402
+
+hostport.install()
+import asyncio  # noqa: E402
+import utime as time  # noqa: E402  # pyright: ignore[reportMissingImports]
+
+from bilalcast import cast, receiver  # noqa: E402
+
+RUNS = 3
+ITEM_MS = 1000
+URLS = ["https://storage.googleapis.com/athans/Salat_Ibrahimiyya.mp3"]
+
+# (name, fake_cast.py --fail argument)
+SCENARIOS = (
+    ("ok", None),
+    ("refused once", "refuse:1"),
+    ("reset on LAUNCH", "reset:1"),
+    ("LAUNCH unanswered", "launch:1"),
+    ("LOAD_FAILED x3", "load:3"),
+    ("dropped while playing", "drop:1"),
+)
+
+CPYTHON = sys.implementation.name != "micropython"
+connections = 0
+
+
+def _counting(inner):
+    def connect(sock, host, port):
+        global connections
+        connections += 1
+        return inner(sock, host, port)
+
+    return connect
+
+
+def plain(sock, host, port):
+    """Cast over plain TCP, for a fake receiver started with --plain."""
+    sock.connect((host, port))
+    if CPYTHON:
+        return sock.makefile("rwb", buffering=0)
+    return sock
+
+
+def start_fake(fail, tls):
+    """Start fake_cast.py in a process of its own; returns (process, port)."""
+    import subprocess
+
+    args = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_cast.py"),
+            "--host", "127.0.0.1", "--port", "0", "--item-ms", str(ITEM_MS)]
+    if fail:
+        args += ["--fail", fail]
+    if not tls:
+        args.append("--plain")
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    return proc, int(line.split(":")[1].split()[0])
+
+
+class Heap:
+    """Bytes a cast allocated at its peak, and kept once it was over."""
+
+    def __enter__(self):
+        gc.collect()
+        if CPYTHON:
+            import tracemalloc
+
+            tracemalloc.start()
+            self.base = tracemalloc.get_traced_memory()[0]
+        else:
+            self.base = gc.mem_alloc()
+        return self
+
+    def __exit__(self, *exc):
+        gc.collect()
+        if CPYTHON:
+            import tracemalloc
+
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.peak, self.kept = peak - self.base, current - self.base
+        else:
+            self.peak, self.kept = None, gc.mem_alloc() - self.base
+
+
+async def cast_once(host, port):
+    global connections
+    connections = 0
+    t0 = time.ticks_ms()
+    with Heap() as heap:
+        ok, err = await receiver.start(URLS, host, port, vol=0.5)
+        t_load = time.ticks_diff(time.ticks_ms(), t0)
+        reason = await receiver.watch() if ok else "failed: " + str(err)
+        t_end = time.ticks_diff(time.ticks_ms(), t0)
+    return {
+        "load": t_load,
+        "playing": _last_l2p.get("ms"),
+        "total": t_end,
+        "connections": connections,
+        "reason": reason,
+        "peak": heap.peak,
+        "kept": heap.kept,
+    }
+
+
+_last_l2p = {}
+
+
+def _recording_l2p():
+    """Keep each Chromecast's LOAD to PLAYING time where cast_once() can read it."""
+    play_url = cast.Chromecast.play_url
+
+    async def wrapped(self, url):
+        ok = await play_url(self, url)
+        _last_l2p["ms"] = self.load_to_playing_ms
+        return ok
+
+    cast.Chromecast.play_url = wrapped
+
+
+def _median(xs):
+    xs = sorted(x for x in xs if x is not None)
+    return xs[len(xs) // 2] if xs else None
+
+
+def _fmt(v, unit=""):
+    return "-" if v is None else "{}{}".format(v, unit)
+
+
+async def scenario(name, runs, fail=None, tls=True, port=None):
+    """Cast ``runs`` times; each against a fresh fake (failing as ``fail`` says) unless ``port`` is given."""
+    results = []
+    for _ in range(runs):
+        _last_l2p.clear()
+        proc = None
+        if port is None:
+            proc, p = start_fake(fail, tls)
+        try:
+            results.append(await cast_once("127.0.0.1", port or p))
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait()
+    reasons = sorted(set(r["reason"] for r in results))
+    print(
+        "{:<22} {:>7} {:>7} {:>7} {:>5} {:>9} {:>9}  {}".format(
+            name,
+            _fmt(_median([r["load"] for r in results])),
+            _fmt(_median([r["playing"] for r in results])),
+            _fmt(_median([r["total"] for r in results])),
+            _fmt(_median([r["connections"] for r in results])),
+            _fmt(_median([r["peak"] for r in results])),
+            _fmt(_median([r["kept"] for r in results])),
+            ",".join(reasons),
+        )
+    )
+
+
+async def mdns_lookup(port, runs):
+    """Time discovery's mDNS lookup of a fake announced on this host."""
+    import fake_mdns
+    from bilalcast import discovery
+
+    ip = fake_mdns.local_ip()
+    announcer = fake_mdns.Announcer("Bench Cast", ip, port)
+    announcer.start()
+    times = []
+    for _ in range(runs):
+        t0 = time.ticks_ms()
+        # The mDNS client ignores packets from its own address, which on one
+        # host is also the announcer's; 0.0.0.0 joins the group on the same
+        # interface without that
+        found = await discovery._mdns_find("0.0.0.0", "Bench Cast")
+        times.append(time.ticks_diff(time.ticks_ms(), t0) if found == (ip, port) else None)
+    announcer.stop()
+    print("mDNS lookup: median {} ms over {} runs, {} answers sent".format(
+        _fmt(_median(times)), runs, announcer.answers))
+
+
+async def run(args):
+    runs = int(args[args.index("--runs") + 1]) if "--runs" in args else RUNS
+    tls = "--plain" not in args
+    cast.transport = _counting(cast.tls_connect if tls else plain)
+    _recording_l2p()
+    # The retry loop sleeps between attempts; keep the ramp and resume out of it
+    receiver.ramp_s = 0
+    receiver.resume_media = False
+    print("{:<22} {:>7} {:>7} {:>7} {:>5} {:>9} {:>9}  {}".format(
+        "scenario", "load", "l2p", "total", "conn", "peak B", "kept B", "watch"))
+    if not CPYTHON:
+        await scenario("ok", runs, port=int(args[args.index("--port") + 1]))
+        return
+    for name, fail in SCENARIOS:
+        if "--only" not in args or name == args[args.index("--only") + 1]:
+            await scenario(name, runs, fail, tls)
+    if "--mdns" in args:
+        await mdns_lookup(8009, runs)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(sys.argv[1:]))
@@ -0,0 +1,265 @@
+"""
+A fake Chromecast: a Cast receiver on the workstation, for benches.
+
+Speaks the CastMessage framing (see bilalcast/cast.py) over TLS with a
+throwaway self-signed certificate, or over plain TCP. It keeps the state a
+real receiver reports — the running app, volume, the media session — and
+answers GET_STATUS, LAUNCH, STOP, SET_VOLUME, LOAD/QUEUE_LOAD and PING
+with RECEIVER_STATUS/MEDIA_STATUS after the delays in Timing. It sends PINGs
+of its own, as receivers do, and can be told to fail the first few casts.
+
+Run on its own with
+
+    python3 bench/fake_cast.py [--port 8009] [--plain] [--fail launch:2]
+
+and point the device (or the MicroPython unix port) at it, or use Receiver
+from another bench (see cast_latency.py).
+"""
+import asyncio
+import json
+import os
+import ssl
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hostport  # noqa: E402
+
+hostport.install()
+from bilalcast.cast import _frame, _parse  # noqa: E402
+
+NS_CONN = "urn:x-cast:com.google.cast.tp.connection"
+NS_HEARTBEAT = "urn:x-cast:com.google.cast.tp.heartbeat"
+NS_RECV = "urn:x-cast:com.google.cast.receiver"
+NS_MEDIA = "urn:x-cast:com.google.cast.media"
+
+# How a cast can be made to fail:
+#   refuse: close the connection as soon as it is accepted
+#   launch: never answer LAUNCH, so the sender times out on the transport id
+#   reset:  drop the connection on LAUNCH
+#   load:   answer LOAD with LOAD_FAILED
+#   drop:   drop the connection once the media is PLAYING
+FAIL_MODES = ("refuse", "launch", "reset", "load", "drop")
+
+
+class Timing:
+    """Delays, in ms, between a request and the receiver's replies."""
+
+    def __init__(self, launch=300, buffering=150, playing=400, item=2000, ping=5000):
+        self.launch = launch
+        self.buffering = buffering
+        self.playing = playing
+        # How long each queued item "plays" before the next or IDLE FINISHED
+        self.item = item
+        self.ping = ping
+
+
+class Receiver:
+    """The fake receiver; one per port. State is shared by all connections, like a real one."""
+
+    def __init__(self, timing=None, fail=None, fail_count=0, name="Fake Cast"):
+        if fail is not None and fail not in FAIL_MODES:
+            raise ValueError("fail mode must be one of {}".format(", ".join(FAIL_MODES)))
+        self.timing = timing or Timing()
+        self.fail = fail
+        # Casts (LAUNCHes, or connections for "refuse") still to fail
+        self.fail_count = fail_count
+        self.name = name
+        self.volume = 0.3
+        self.muted = False
+        self.app = None
+        self.media = None
+        self._sessions = 0
+        # LOADs and QUEUE_LOADs answered, failed or not
+        self.loads = 0
+        self.port = None
+
+    # Runs the receiver's event loop on a thread of its own, so a bench can
+    # drive bilalcast's asyncio code on the main thread against it
+    def start(self, host="127.0.0.1", port=0, tls=True):
+        ready = threading.Event()
+
+        async def serve():
+            ctx = hostport.server_context() if tls else None
+            server = await asyncio.start_server(self._client, host, port, ssl=ctx)
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            async with server:
+                await server.serve_forever()
+
+        threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+        if not ready.wait(10):
+            raise OSError("fake receiver did not start")
+        return self.port
+
+    def _failing(self, mode):
+        if self.fail == mode and self.fail_count > 0:
+            self.fail_count -= 1
+            return True
+        return False
+
+    def _receiver_status(self, request_id=0):
+        apps = [self.app] if self.app else []
+        return {
+            "type": "RECEIVER_STATUS",
+            "requestId": request_id,
+            "status": {"applications": apps, "volume": {"level": self.volume, "muted": self.muted}},
+        }
+
+    def _media_status(self, state, request_id=0, idle_reason=None):
+        st = {"mediaSessionId": 1, "playerState": state, "currentTime": 0}
+        if self.media is not None:
+            st["media"] = self.media
+        if idle_reason:
+            st["idleReason"] = idle_reason
+        return {"type": "MEDIA_STATUS", "requestId": request_id, "status": [st]}
+
+    async def _client(self, reader, writer):
+        if self._failing("refuse"):
+            writer.close()
+            return
+        conn = _Conn(self, reader, writer)
+        try:
+            await conn.run()
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        finally:
+            conn.close()
+
+
+class _Conn:
+    """One sender's connection."""
+
+    def __init__(self, rx, reader, writer):
+        self.rx = rx
+        self.reader = reader
+        self.writer = writer
+        self.tasks = []
+
+    def send(self, ns, msg, dest=b"sender-0", src=b"receiver-0"):
+        if not self.writer.is_closing():
+            # Compact, as a real receiver sends it; cast.py scans for '"transportId":"'
+            self.writer.write(_frame(ns, json.dumps(msg, separators=(",", ":")), dest=dest, src=src))
+
+    def later(self, ms, fn):
+        async def run():
+            await asyncio.sleep(ms / 1000)
+            fn()
+
+        self.tasks.append(asyncio.create_task(run()))
+
+    def close(self):
+        for t in self.tasks:
+            t.cancel()
+        self.writer.close()
+
+    async def _pings(self):
+        while True:
+            await asyncio.sleep(self.rx.timing.ping / 1000)
+            self.send(NS_HEARTBEAT, {"type": "PING"})
+
+    async def run(self):
+        self.tasks.append(asyncio.create_task(self._pings()))
+        while True:
+            size = int.from_bytes(await self.reader.readexactly(4), "big")
+            ns, src, payload = _parse(await self.reader.readexactly(size))
+            try:
+                msg = json.loads(payload)
+            except ValueError:
+                continue
+            self.handle(ns.decode(), src, msg)
+
+    def handle(self, ns, src, msg):
+        rx = self.rx
+        kind = msg.get("type")
+        rid = msg.get("requestId", 0)
+        if ns == NS_HEARTBEAT:
+            if kind == "PING":
+                self.send(NS_HEARTBEAT, {"type": "PONG"}, dest=src)
+        elif ns == NS_RECV:
+            if kind == "GET_STATUS":
+                self.send(NS_RECV, rx._receiver_status(rid))
+            elif kind == "SET_VOLUME":
+                vol = msg.get("volume", {})
+                rx.volume = vol.get("level", rx.volume)
+                rx.muted = vol.get("muted", rx.muted)
+                self.send(NS_RECV, rx._receiver_status(rid))
+            elif kind == "STOP":
+                rx.app = rx.media = None
+                self.send(NS_RECV, rx._receiver_status(rid))
+            elif kind == "LAUNCH":
+                if rx._failing("launch"):
+                    return
+                if rx._failing("reset"):
+                    self.writer.close()
+                    return
+                self.later(rx.timing.launch, lambda: self._launched(msg.get("appId"), rid))
+        elif ns == NS_MEDIA:
+            tid = rx.app["transportId"].encode() if rx.app else b"receiver-0"
+            if kind == "GET_STATUS":
+                self.send(NS_MEDIA, rx._media_status("PLAYING" if rx.media else "IDLE", rid), src=tid)
+            elif kind in ("LOAD", "QUEUE_LOAD"):
+                rx.loads += 1
+                if rx._failing("load"):
+                    self.send(NS_MEDIA, {"type": "LOAD_FAILED", "requestId": rid}, src=tid)
+                    return
+                items = msg.get("items") or [{"media": msg.get("media")}]
+                rx.media = items[0]["media"]
+                self._play(tid, rid, len(items))
+
+    def _launched(self, app_id, rid):
+        rx = self.rx
+        rx._sessions += 1
+        tid = "web-{}".format(rx._sessions)
+        rx.app = {
+            "appId": app_id,
+            "displayName": "Default Media Receiver",
+            "isIdleScreen": False,
+            "sessionId": tid,
+            "transportId": tid,
+        }
+        self.send(NS_RECV, rx._receiver_status(rid))
+
+    def _play(self, tid, rid, items):
+        t = self.rx.timing
+        at = t.buffering
+        self.later(at, lambda: self.send(NS_MEDIA, self.rx._media_status("BUFFERING", rid), src=tid))
+        at += t.playing
+        self.later(at, lambda: self.send(NS_MEDIA, self.rx._media_status("PLAYING"), src=tid))
+        if self.rx._failing("drop"):
+            self.later(at + 50, self.writer.close)
+            return
+        at += t.item * items
+        self.later(at, lambda: self._finished(tid))
+
+    def _finished(self, tid):
+        self.send(NS_MEDIA, self.rx._media_status("IDLE", idle_reason="FINISHED"), src=tid)
+        self.rx.media = None
+
+
+def main(args):
+    import argparse
+
+    p = argparse.ArgumentParser(description="Fake Cast receiver")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=8009)
+    p.add_argument("--plain", action="store_true", help="plain TCP instead of TLS")
+    p.add_argument("--fail", help="MODE:COUNT, MODE one of " + ", ".join(FAIL_MODES))
+    p.add_argument("--item-ms", type=int, default=2000, help="how long each queued item plays")
+    p.add_argument("--mdns", action="store_true", help="announce it over mDNS too")
+    p.add_argument("--name", default="Fake Cast", help="friendly name to announce")
+    a = p.parse_args(args)
+    mode, count = (a.fail.split(":") + ["1"])[:2] if a.fail else (None, 0)
+    rx = Receiver(Timing(item=a.item_ms), fail=mode, fail_count=int(count), name=a.name)
+    port = rx.start(a.host, a.port, tls=not a.plain)
+    print("fake receiver on {}:{} ({})".format(a.host, port, "TCP" if a.plain else "TLS"), flush=True)
+    if a.mdns:
+        import fake_mdns
+
+        fake_mdns.Announcer(a.name, fake_mdns.local_ip(), port).start()
+        print("announcing '{}' over mDNS".format(a.name))
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,157 @@
+"""
+A fake mDNS announcer for a fake Chromecast (see fake_cast.py).
+
+Answers queries for _googlecast._tcp.local the way a Chromecast does: a PTR
+to its service instance, with the SRV (port), TXT (fn=<friendly name>) and
+A records in the additional section, which is what discovery.py reads.
+It also answers direct SRV, TXT and A queries for those names.
+
+Answers go to the multicast group from ``ip``. bilalcast's mDNS client
+drops packets from its own address, so a sender on the same host has to
+join the group as 0.0.0.0 rather than as ``ip`` (see cast_latency.py).
+"""
+import socket
+import struct
+import threading
+
+MDNS_ADDR = "224.0.0.251"
+MDNS_PORT = 5353
+SERVICE = "_googlecast._tcp.local"
+
+TYPE_A = 1
+TYPE_PTR = 12
+TYPE_TXT = 16
+TYPE_SRV = 33
+TYPE_ANY = 255
+CLASS_IN = 1
+# Cache-flush bit, set on the records only this device owns
+CLASS_UNIQUE = 0x8000
+TTL = 120
+
+
+def local_ip():
+    """Address of the interface the default route goes out of."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("10.255.255.255", 1))
+        return s.getsockname()[0]
+    except OSError:
+        return "127.0.0.1"
+    finally:
+        s.close()
+
+
+def _name(n):
+    out = b""
+    for label in n.split("."):
+        out += bytes([len(label)]) + label.encode()
+    return out + b"\0"
+
+
+def _record(name, rtype, rdata, cls=CLASS_IN):
+    return _name(name) + struct.pack("!HHLH", rtype, cls, TTL, len(rdata)) + rdata
+
+
+def _read_name(buf, i):
+    """(name, index after it); follows compression pointers."""
+    labels = []
+    end = None
+    while True:
+        n = buf[i]
+        if n & 0xC0 == 0xC0:
+            if end is None:
+                end = i + 2
+            i = ((n & 0x3F) << 8) | buf[i + 1]
+            continue
+        i += 1
+        if n == 0:
+            break
+        labels.append(buf[i : i + n].decode())
+        i += n
+    return ".".join(labels), end if end is not None else i
+
+
+def questions(packet):
+    """(name, type) of each question in a query; empty for responses."""
+    _, flags, qd = struct.unpack_from("!HHH", packet)
+    if flags & 0x8000:
+        return []
+    out = []
+    i = 12
+    for _ in range(qd):
+        name, i = _read_name(packet, i)
+        qtype, _ = struct.unpack_from("!HH", packet, i)
+        i += 4
+        out.append((name.lower(), qtype))
+    return out
+
+
+class Announcer:
+    """Answers for one device, friendly name ``name`` at ``ip``:``port``."""
+
+    def __init__(self, name, ip, port, device_id="0123456789abcdef0123456789abcdef"):
+        self.name = name
+        self.ip = ip
+        self.port = port
+        self.instance = "Chromecast-{}.{}".format(device_id, SERVICE)
+        self.target = "{}.local".format(device_id)
+        self.txt = ["id=" + device_id, "md=Chromecast", "fn=" + name]
+        self.answers = 0
+        self._sock = None
+
+    def _records(self):
+        txt = b"".join(bytes([len(t)]) + t.encode() for t in self.txt)
+        srv = struct.pack("!HHH", 0, 0, self.port) + _name(self.target)
+        return {
+            TYPE_PTR: _record(SERVICE, TYPE_PTR, _name(self.instance)),
+            TYPE_SRV: _record(self.instance, TYPE_SRV, srv, CLASS_IN | CLASS_UNIQUE),
+            TYPE_TXT: _record(self.instance, TYPE_TXT, txt, CLASS_IN | CLASS_UNIQUE),
+            TYPE_A: _record(self.target, TYPE_A, socket.inet_aton(self.ip), CLASS_IN | CLASS_UNIQUE),
+        }
+
+    def response(self, packet):
+        """The answer to a query packet, or None if it is not about this device."""
+        rec = self._records()
+        owners = {SERVICE: (TYPE_PTR,), self.instance.lower(): (TYPE_SRV, TYPE_TXT), self.target: (TYPE_A,)}
+        answers = []
+        for name, qtype in questions(packet):
+            for t in owners.get(name, ()):
+                if qtype in (t, TYPE_ANY) and rec[t] not in answers:
+                    answers.append(rec[t])
+        if not answers:
+            return None
+        # Everything else a sender will need next goes along as additional records
+        extra = [r for t, r in rec.items() if r not in answers]
+        return struct.pack("!HHHHHH", 0, 0x8400, 0, len(answers), 0, len(extra)) + b"".join(answers + extra)
+
+    def start(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        s.bind(("", MDNS_PORT))
+        mreq = socket.inet_aton(MDNS_ADDR) + socket.inet_aton(self.ip)
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.ip))
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self._sock = s
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                packet, _ = self._sock.recvfrom(9000)
+            except OSError:
+                return  # stopped
+            try:
+                reply = self.response(packet)
+            except (IndexError, struct.error, UnicodeError):
+                continue
+            if reply is None:
+                continue
+            self._sock.sendto(reply, (MDNS_ADDR, MDNS_PORT))
+            self.answers += 1
+
+    def stop(self):
+        if self._sock:
+            self._sock.close()
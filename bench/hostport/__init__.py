@@ -0,0 +1,225 @@
+"""
+The host port: bilalcast on CPython, for benches and profiling.
+
+    import hostport
+    hostport.install()
+    from bilalcast import cast
+
+install() puts lib/ on sys.path, with stand-ins for the MicroPython-only
+modules (utime, machine, network, rp2, urequests, ujson, ubinascii,
+micropython), aliases uasyncio and usocket to asyncio and socket, and adds
+the MicroPython-only asyncio, time, gc, os, sys and ssl functions. Time is
+virtual (see clock.py) and can run faster than real time.
+
+route() sends the device's internet traffic to local stand-ins (see
+internet.py); run.py boots the whole app against them. Under the
+MicroPython unix port none of this is needed and install() does nothing.
+"""
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib")
+
+# What gc.mem_free() adds to gc.mem_alloc(): roughly the Pico W's heap
+HEAP_BYTES = 192 * 1024
+
+_installed = False
+
+
+def install(speed=1, start=None):
+    """Install the stand-ins; time runs ``speed`` times real time from ``start`` (see clock.configure).
+
+    Only the first call does anything, so modules can call it on import.
+    """
+    global _installed
+    if _installed or sys.implementation.name == "micropython":
+        return
+    _installed = True
+    import asyncio
+    import gc
+    import socket
+    import ssl
+    import time
+    import traceback
+    import tracemalloc
+
+    from hostport import clock
+
+    clock.configure(speed, start)
+    for path in (LIB, ROOT):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import utime
+
+    real_sleep = asyncio.sleep
+
+    async def sleep(secs, result=None):
+        return await real_sleep(clock.real(secs), result)
+
+    async def sleep_ms(ms):
+        await sleep(ms / 1000)
+
+    async def wait_for_ms(aw, ms):
+        return await asyncio.wait_for(aw, ms / 1000)
+
+    asyncio.sleep = sleep
+    asyncio.sleep_ms = sleep_ms
+    asyncio.wait_for_ms = wait_for_ms
+    sys.modules["uasyncio"] = asyncio
+    sys.modules["usocket"] = socket
+
+    # Some modules use plain ``time`` for the ticks functions too
+    for name in ("ticks_ms", "ticks_us", "ticks_diff", "ticks_add", "sleep_ms"):
+        setattr(time, name, getattr(utime, name))
+
+    def mem_alloc():
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    gc.mem_alloc = mem_alloc
+    gc.mem_free = lambda: max(0, HEAP_BYTES - mem_alloc())
+    gc.threshold = lambda *args: -1
+    def ilistdir(path="."):
+        for e in os.scandir(path):
+            yield e.name, 0x4000 if e.is_dir() else 0x8000, e.inode(), e.stat().st_size
+
+    os.ilistdir = ilistdir
+    sys.print_exception = lambda e, file=sys.stdout: traceback.print_exception(e, file=file)
+
+    # MicroPython's ssl checks no certificates unless given a CA
+    def wrap_socket(sock, server_side=False, key=None, cert=None, cert_reqs=ssl.CERT_NONE,
+                    cadata=None, server_hostname=None, do_handshake=True):
+        if server_side:
+            return server_context().wrap_socket(sock, server_side=True)
+        return _SSLStream(client_context().wrap_socket(sock, server_hostname=server_hostname,
+                                                       do_handshake_on_connect=do_handshake))
+
+    ssl.wrap_socket = wrap_socket
+    open_connection = asyncio.open_connection
+
+    async def open_connection_unverified(host=None, port=None, ssl=None, **kwargs):
+        if ssl is True:
+            ssl = client_context()
+        return await open_connection(host, port, ssl=ssl, **kwargs)
+
+    asyncio.open_connection = open_connection_unverified
+    # MicroPython's streams take str as well as bytes
+    write = asyncio.StreamWriter.write
+    asyncio.StreamWriter.write = lambda self, b: write(self, b.encode() if isinstance(b, str) else b)
+    socket._real_getaddrinfo = socket.getaddrinfo
+
+
+def route(connect, listen=None):
+    """Send connections to any host name to 127.0.0.1, on ``connect[port]``.
+
+    IP addresses are left alone. ``listen`` maps ports the device listens
+    on to ports it can have here, e.g. {80: 8080}.
+    """
+    import asyncio
+    import socket
+
+    real = socket._real_getaddrinfo
+
+    def getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+        if host and not _is_ip(host) and host != "localhost":
+            host, port = "127.0.0.1", connect.get(port, port)
+        return real(host, port, family, type, proto, flags)
+
+    socket.getaddrinfo = getaddrinfo
+    if listen:
+        start_server = asyncio.start_server
+
+        async def start_server_remapped(cb, host=None, port=None, **kwargs):
+            return await start_server(cb, host, listen.get(port, port), **kwargs)
+
+        asyncio.start_server = start_server_remapped
+
+
+def _is_ip(host):
+    if isinstance(host, bytes):
+        host = host.decode()
+    parts = host.split(".")
+    return len(parts) == 4 and all(p.isdigit() for p in parts)
+
+
+class _SSLStream:
+    """A TLS socket as MicroPython's ssl returns it: a stream with read,
+    readinto, readline and write."""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._buf = b""
+
+    def _take(self, n):
+        b, self._buf = self._buf[:n], self._buf[n:]
+        return b
+
+    def read(self, n=-1):
+        if self._buf:
+            return self._take(n if n >= 0 else len(self._buf))
+        return self._sock.recv(n if n >= 0 else 4096)
+
+    def readinto(self, buf, n=None):
+        n = len(buf) if n is None else n
+        b = self.read(n)
+        buf[:len(b)] = b
+        return len(b)
+
+    def readline(self):
+        while b"\n" not in self._buf:
+            chunk = self._sock.recv(256)
+            if not chunk:
+                break
+            self._buf += chunk
+        i = self._buf.find(b"\n")
+        return self._take(i + 1 if i >= 0 else len(self._buf))
+
+    def write(self, b):
+        return self._sock.send(b)
+
+    def pending(self):
+        return len(self._buf) + self._sock.pending()
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def setblocking(self, flag):
+        self._sock.setblocking(flag)
+
+    def close(self):
+        self._sock.close()
+
+
+_client_ctx = None
+_server_ctx = None
+
+
+def client_context():
+    global _client_ctx
+    if _client_ctx is None:
+        import ssl
+
+        _client_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        _client_ctx.check_hostname = False
+        _client_ctx.verify_mode = ssl.CERT_NONE
+    return _client_ctx
+
+
+def server_context():
+    """TLS server context with a self-signed certificate made on first use (needs openssl)."""
+    global _server_ctx
+    if _server_ctx is None:
+        import ssl
+        import subprocess
+        import tempfile
+
+        d = tempfile.mkdtemp(prefix="hostport")
+        cert, key = os.path.join(d, "cert.pem"), os.path.join(d, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-subj", "/CN=hostport", "-keyout", key, "-out", cert],
+            check=True, capture_output=True,
+        )
+        _server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        _server_ctx.load_cert_chain(cert, key)
+    return _server_ctx
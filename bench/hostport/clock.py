@@ -0,0 +1,63 @@
+"""
+Virtual time for the host port.
+
+Two clocks run at ``speed`` times real time from configure():
+
+    world: true UTC, what the NTP stand-in serves
+    RTC:   what utime.time() reads; 2021-01-01 at power-on, like the
+           Pico's, until sntp.py sets it through machine.RTC
+
+ticks_ms counts virtual ms from power-on, and every sleep (utime's and
+asyncio's) lasts 1/speed of its virtual length, so a day of the device's
+schedule passes in 86400/speed seconds. Network round trips still take
+real time, i.e. ``speed`` times longer in the device's ticks.
+"""
+import time as _time
+
+# What the Pico's RTC reads when it powers up
+RTC_AT_POWER_ON = 1609459200  # 2021-01-01 00:00:00
+
+speed = 1
+_real0 = _time.monotonic()
+_world0 = _time.time()
+_rtc_offset = RTC_AT_POWER_ON - _world0
+
+
+def configure(speed_=1, start=None):
+    """Restart both clocks; ``start`` is the world's UTC epoch second at power-on (default: now)."""
+    global speed, _real0, _world0, _rtc_offset
+    speed = speed_
+    _real0 = _time.monotonic()
+    _world0 = _time.time() if start is None else start
+    _rtc_offset = RTC_AT_POWER_ON - _world0
+
+
+def reboot():
+    """Power-cycle the Pico: ticks start over and the RTC reads RTC_AT_POWER_ON again."""
+    global _real0, _world0, _rtc_offset
+    _world0 = world()
+    _real0 = _time.monotonic()
+    _rtc_offset = RTC_AT_POWER_ON - _world0
+
+
+def elapsed():
+    """Virtual seconds since power-on."""
+    return (_time.monotonic() - _real0) * speed
+
+
+def world():
+    return _world0 + elapsed()
+
+
+def rtc():
+    return world() + _rtc_offset
+
+
+def set_rtc(secs):
+    global _rtc_offset
+    _rtc_offset = secs - world()
+
+
+def real(secs):
+    """Real seconds a virtual ``secs`` takes."""
+    return secs / speed
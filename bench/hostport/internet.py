@@ -0,0 +1,168 @@
+"""
+Local stand-ins for the services the device talks to.
+
+One HTTP server, on a plain and a TLS port, answers by Host header:
+
+    ip-api.com                 the configured location
+    api.aladhan.com            timings, timingsByAddress, calendar and
+                               calendarByAddress, with the same five times
+                               every day
+    nominatim.openstreetmap.org  the configured location, for any address
+    ntfy.sh                    notifications, kept in ``ntfy`` and printed
+    raw.githubusercontent.com  OTA: version.txt, manifest.json and the
+                               files it lists, from this repo's tree
+    storage.googleapis.com     a made-up MP3 for any /athans/ URL, with an
+                               ETag, for the audio cache
+
+and a UDP server answers NTP with clock.world(). Use with hostport.route().
+"""
+import calendar
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from hostport import ROOT, clock, server_context
+
+NTP_DELTA = 2208988800
+OTA_PREFIX = "/Project-Bilal/bilal-cast/main/"
+MP3_BYTES = 48 * 1024
+
+PRAYERS = ("Fajr", "Dhuhr", "Asr", "Maghrib", "Isha")
+
+
+class Internet:
+    def __init__(self, lat=21.4225, lon=39.8262, timezone="Asia/Riyadh", offset=10800,
+                 times=("05:00", "12:20", "15:40", "18:25", "19:55"), repo=ROOT):
+        self.location = {"lat": lat, "lon": lon, "timezone": timezone, "offset": offset}
+        self.times = list(times)
+        self.repo = repo
+        # (title, message) of each notification posted to ntfy
+        self.ntfy = []
+        # host -> requests served
+        self.requests = {}
+        self.ports = {}
+
+    def start(self):
+        """Start serving; returns the {80: ..., 443: ..., 123: ...} map for hostport.route()."""
+        handler = type("Handler", (_Handler,), {"internet": self})
+        plain = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        tls = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        # Handshakes happen in the handler threads, so one slow client stalls no other
+        tls.socket = server_context().wrap_socket(tls.socket, server_side=True, do_handshake_on_connect=False)
+        ntp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        ntp.bind(("127.0.0.1", 0))
+        for target, arg in ((plain.serve_forever, ()), (tls.serve_forever, ()), (_serve_ntp, (ntp,))):
+            threading.Thread(target=target, args=arg, daemon=True).start()
+        self.ports = {80: plain.server_address[1], 443: tls.server_address[1], 123: ntp.getsockname()[1]}
+        return self.ports
+
+    def _timings(self, date):
+        return {"timings": dict(zip(PRAYERS, self.times)), "date": {"gregorian": {"date": date}}}
+
+    def _month(self, y, m):
+        n = calendar.monthrange(y, m)[1]
+        return [self._timings("{:02d}-{:02d}-{:04d}".format(d, m, y)) for d in range(1, n + 1)]
+
+    def answer(self, host, method, path, query, body):
+        """(status, content type, body bytes, extra headers) for one request."""
+        loc = self.location
+        if host == "ip-api.com":
+            return _json({"status": "success", "lat": loc["lat"], "lon": loc["lon"], "offset": loc["offset"],
+                          "timezone": loc["timezone"], "query": "203.0.113.7"})
+        if host == "api.aladhan.com":
+            parts = path.strip("/").split("/")
+            if parts[1] in ("timings", "timingsByAddress"):
+                return _json({"code": 200, "data": self._timings(parts[2])})
+            if parts[1] in ("calendar", "calendarByAddress"):
+                return _json({"code": 200, "data": self._month(int(parts[2]), int(parts[3]))})
+        if host == "nominatim.openstreetmap.org":
+            return _json([{"lat": str(loc["lat"]), "lon": str(loc["lon"])}])
+        if host == "ntfy.sh" and method == "POST":
+            d = json.loads(body)
+            self.ntfy.append((d.get("title"), d.get("message")))
+            print("ntfy: {}".format(d.get("message")))
+            return _json({"id": str(len(self.ntfy))})
+        if host == "raw.githubusercontent.com" and path.startswith(OTA_PREFIX):
+            f = os.path.normpath(os.path.join(self.repo, path[len(OTA_PREFIX):]))
+            if f.startswith(self.repo + os.sep) and os.path.isfile(f):
+                with open(f, "rb") as fh:
+                    return 200, "application/octet-stream", fh.read(), {}
+        if host == "storage.googleapis.com" and path.endswith(".mp3"):
+            data = _mp3(path)
+            return 200, "audio/mpeg", data, {"ETag": '"{}"'.format(hashlib.sha256(data).hexdigest()[:16])}
+        return 404, "text/plain", b"not found", {}
+
+
+def _json(obj):
+    return 200, "application/json", json.dumps(obj).encode(), {}
+
+
+def _mp3(path):
+    """MPEG frame headers padded to MP3_BYTES, different for each path."""
+    seed = hashlib.sha256(path.encode()).digest()
+    frame = b"\xff\xfb\x90\x64" + seed * 13
+    return (frame * (MP3_BYTES // len(frame) + 1))[:MP3_BYTES]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # ota.py pipelines requests on one kept-alive connection
+    protocol_version = "HTTP/1.1"
+    internet = None
+
+    def _serve(self, method):
+        host = (self.headers.get("Host") or "").split(":")[0]
+        u = urlsplit(self.path)
+        n = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(n) if n else b""
+        inet = self.internet
+        inet.requests[host] = inet.requests.get(host, 0) + 1
+        status, ctype, data, headers = inet.answer(host, method, u.path, parse_qs(u.query), body)
+        etag = headers.get("ETag")
+        if etag and self.headers.get("If-None-Match") == etag:
+            status, data = 304, b""
+        rng = self.headers.get("Range")
+        if status == 200 and rng and rng.startswith("bytes="):
+            start = int(rng[6:].split("-")[0] or 0)
+            if start >= len(data):
+                headers["Content-Range"] = "bytes */{}".format(len(data))
+                status, data = 416, b""
+            else:
+                headers["Content-Range"] = "bytes {}-{}/{}".format(start, len(data) - 1, len(data))
+                status, data = 206, data[start:]
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        if method != "HEAD":
+            self.wfile.write(data)
+
+    def do_GET(self):
+        self._serve("GET")
+
+    def do_HEAD(self):
+        self._serve("HEAD")
+
+    def do_POST(self):
+        self._serve("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve_ntp(sock):
+    while True:
+        msg, addr = sock.recvfrom(48)
+        if len(msg) < 48:
+            continue
+        now = clock.world() + NTP_DELTA
+        ts = struct.pack("!II", int(now), int((now % 1) * (1 << 32)))
+        # LI 0, version 4, mode 4 (server), stratum 2
+        reply = b"\x24\x02\x06\xec" + bytes(20) + msg[40:48] + ts + ts
+        sock.sendto(reply, addr)
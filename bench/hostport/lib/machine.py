@@ -0,0 +1,119 @@
+"""machine for the host port: LED pins, virtual timers and RTC, and reset()."""
+import _thread
+import calendar
+import threading
+import time as _time
+
+from hostport import clock
+
+# Pin name -> value, for whoever wants to look at the LED
+pins = {}
+# Set by a reset() from a timer thread, which can only interrupt the app
+reset_requested = False
+# Timers running, stopped by deinit_all() on a reboot
+_timers = set()
+
+
+class Reset(SystemExit):
+    """Raised by reset(); the runner reboots the app on it."""
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+
+    def __init__(self, id, mode=-1, value=None):
+        self.id = id
+        if value is not None or id not in pins:
+            pins[id] = value or 0
+
+    def value(self, v=None):
+        if v is None:
+            return pins[self.id]
+        pins[self.id] = 1 if v else 0
+
+    def on(self):
+        pins[self.id] = 1
+
+    def off(self):
+        pins[self.id] = 0
+
+    def toggle(self):
+        pins[self.id] ^= 1
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+    # A sped-up LED blink is only noise in a profile
+    MIN_PERIOD_S = 0.05
+
+    def __init__(self, id=-1, **kwargs):
+        self._stop = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, freq=-1, period=-1, callback=None):
+        self.deinit()
+        period_s = 1 / freq if freq > 0 else period / 1000
+        wait = clock.real(period_s)
+        if mode == Timer.PERIODIC:
+            wait = max(wait, Timer.MIN_PERIOD_S)
+        stop = self._stop = threading.Event()
+
+        def run():
+            while not stop.wait(wait):
+                if callback:
+                    callback(self)
+                if mode == Timer.ONE_SHOT:
+                    return
+
+        _timers.add(self)
+        threading.Thread(target=run, daemon=True).start()
+
+    def deinit(self):
+        _timers.discard(self)
+        if self._stop:
+            self._stop.set()
+            self._stop = None
+
+
+def deinit_all():
+    for t in list(_timers):
+        t.deinit()
+
+
+class RTC:
+    def datetime(self, t=None):
+        """(year, month, day, weekday, hours, minutes, seconds, subseconds), as on the Pico."""
+        if t is None:
+            secs = clock.rtc()
+            g = _time.gmtime(secs)
+            return (g[0], g[1], g[2], g[6], g[3], g[4], g[5], 0)
+        clock.set_rtc(calendar.timegm((t[0], t[1], t[2], t[4], t[5], t[6])))
+
+
+def reset():
+    global reset_requested
+    print("machine.reset()")
+    if threading.current_thread() is threading.main_thread():
+        raise Reset()
+    # From a timer callback: stop the app, as the device would
+    reset_requested = True
+    _thread.interrupt_main()
+    raise SystemExit
+
+
+soft_reset = reset
+
+
+def unique_id():
+    return b"\xe6\x61\x40\x00\x0b\x12\x34\x56"
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def idle():
+    pass
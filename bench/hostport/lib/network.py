@@ -0,0 +1,113 @@
+"""
+network for the host port: a Wi-Fi station that joins one simulated AP.
+
+The AP is configured with ap(); joining it takes JOIN_MS of virtual time
+and hands out ``ip``, the host's own address, so the device's servers are
+reachable from the LAN as they would be from the Pico. drop() takes the link
+down to exercise reconnects.
+"""
+from hostport import clock
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_CONNECT_FAIL = -1
+STAT_NO_AP_FOUND = -2
+STAT_WRONG_PASSWORD = -3
+STAT_GOT_IP = 3
+
+JOIN_MS = 1500
+
+_ap = {"ssid": "HostNet", "password": "password", "bssid": b"\x02\x00\x00\xaa\xbb\xcc", "channel": 6}
+ip = "127.0.0.1"
+_hostname = "PicoW"
+_wlans = {}
+
+
+def ap(ssid, password, address=None):
+    """The AP the station can join, and the address it gets there."""
+    global ip
+    _ap.update(ssid=ssid, password=password)
+    if address:
+        ip = address
+
+
+def hostname(name=None):
+    global _hostname
+    if name is None:
+        return _hostname
+    _hostname = name
+
+
+def drop():
+    """Lose the station's link, as when the AP reboots."""
+    w = _wlans.get(STA_IF)
+    if w:
+        w._status = STAT_IDLE
+
+
+class WLAN:
+    def __new__(cls, interface=STA_IF):
+        # One object per interface, as on the Pico
+        if interface not in _wlans:
+            w = _wlans[interface] = object.__new__(cls)
+            w._interface = interface
+            w._active = False
+            w._status = STAT_IDLE
+            w._joined_at = None
+            w._static = None
+            w._config = {"essid": "", "mac": b"\x28\xcd\xc1\x00\x00\x01"}
+        return _wlans[interface]
+
+    def __init__(self, interface=STA_IF):
+        pass
+
+    def active(self, v=None):
+        if v is None:
+            return self._active
+        self._active = bool(v)
+        if not v:
+            self._status = STAT_IDLE
+
+    def connect(self, ssid=None, key=None, bssid=None, channel=None):
+        if not self._active:
+            raise OSError("WLAN not active")
+        if ssid != _ap["ssid"] or (bssid is not None and bssid != _ap["bssid"]):
+            self._status = STAT_NO_AP_FOUND
+        elif key != _ap["password"]:
+            self._status = STAT_WRONG_PASSWORD
+        else:
+            self._status = STAT_CONNECTING
+            self._joined_at = clock.elapsed() + JOIN_MS / 1000
+
+    def disconnect(self):
+        self._status = STAT_IDLE
+
+    def status(self, param=None):
+        if param == "rssi":
+            return -55
+        if self._status == STAT_CONNECTING and clock.elapsed() >= self._joined_at:
+            self._status = STAT_GOT_IP
+        return self._status
+
+    def isconnected(self):
+        return self.status() == STAT_GOT_IP
+
+    def ifconfig(self, config=None):
+        if config is None:
+            if self._static:
+                return self._static
+            gw = ip.rsplit(".", 1)[0] + ".1"
+            return (ip, "255.255.255.0", gw, gw)
+        self._static = None if config == "dhcp" else tuple(config)
+
+    def scan(self):
+        return [(_ap["ssid"].encode(), _ap["bssid"], _ap["channel"], -55, 3, False)]
+
+    def config(self, *args, **kwargs):
+        if kwargs:
+            self._config.update(kwargs)
+            return
+        return self._config.get(args[0]) if args else None
@@ -0,0 +1,15 @@
+"""rp2 for the host port: a BOOTSEL button that can be held for a while."""
+from hostport import clock
+
+_held_until = 0
+
+
+def hold_bootsel(secs):
+    """Hold BOOTSEL for ``secs`` virtual seconds from now."""
+    global _held_until
+    # 0 releases it, whatever clock.reboot() later does to elapsed()
+    _held_until = clock.elapsed() + secs if secs else 0
+
+
+def bootsel_button():
+    return 1 if clock.elapsed() < _held_until else 0
@@ -0,0 +1,53 @@
+"""urequests for the host port, on http.client; HTTPS is not verified, as on the Pico."""
+import http.client
+import json as _json
+import ssl
+
+
+class Response:
+    def __init__(self, status, reason, headers, content):
+        self.status_code = status
+        self.reason = reason.encode()
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return _json.loads(self.content)
+
+    def close(self):
+        pass
+
+
+def request(method, url, data=None, json=None, headers=None, timeout=None, stream=None):
+    scheme, rest = url.split("://", 1)
+    hostport, _, path = rest.partition("/")
+    if scheme == "https":
+        conn = http.client.HTTPSConnection(hostport, timeout=timeout, context=ssl._create_unverified_context())
+    else:
+        conn = http.client.HTTPConnection(hostport, timeout=timeout)
+    headers = dict(headers or {})
+    if json is not None:
+        data = _json.dumps(json)
+        headers.setdefault("Content-Type", "application/json")
+    try:
+        conn.request(method, "/" + path, body=data, headers=headers)
+        r = conn.getresponse()
+        return Response(r.status, r.reason, dict(r.getheaders()), r.read())
+    finally:
+        conn.close()
+
+
+def get(url, **kw):
+    return request("GET", url, **kw)
+
+
+def post(url, **kw):
+    return request("POST", url, **kw)
+
+
+def head(url, **kw):
+    return request("HEAD", url, **kw)
@@ -0,0 +1,55 @@
+import calendar as _calendar
+import time as _time
+
+from hostport import clock as _clock
+
+
+def time():
+    return int(_clock.rtc())
+
+
+def time_ns():
+    return int(_clock.rtc() * 1000000000)
+
+
+def gmtime(secs=None):
+    """MicroPython's 8-tuple; the Pico has no time zone, so localtime is the same."""
+    return tuple(_time.gmtime(time() if secs is None else secs)[:8])
+
+
+localtime = gmtime
+
+
+def mktime(t):
+    return _calendar.timegm(tuple(t[:6]))
+
+
+def ticks_ms():
+    return int(_clock.elapsed() * 1000)
+
+
+def ticks_us():
+    return int(_clock.elapsed() * 1000000)
+
+
+ticks_cpu = ticks_us
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def ticks_add(a, b):
+    return a + b
+
+
+def sleep(secs):
+    _time.sleep(_clock.real(secs))
+
+
+def sleep_ms(ms):
+    _time.sleep(_clock.real(ms / 1000))
+
+
+def sleep_us(us):
+    _time.sleep(_clock.real(us / 1000000))
@@ -0,0 +1,211 @@
+"""
+Boot the whole device on the host: bilalcast.main against local stand-ins.
+
+    python3 bench/hostport/run.py [--speed N] [--soon MIN] [--hours H]
+        [--flash DIR] [--ota] [--bootsel SECS] [--http-port P]
+        [--profile FILE] [--tracemalloc]
+
+The flash is a directory (a temporary one by default) given a config.json
+for the simulated Wi-Fi and a fake Chromecast, "Fake Cast", already cached
+as the cast device. The internet is internet.py: prayer times from the fake
+Aladhan are --soon minutes apart from power-on (default: a fixed day), and
+notifications are printed instead of sent. --ota serves this tree as an
+update, otherwise the flash claims to run it already. There is no slot
+booting bootstrap here, so the update goes in place, as on a device flashed
+before slots. machine.reset() reboots the app with the flash kept, as on the
+Pico, though always from this tree.
+
+The status page is on http://127.0.0.1:P (80 on the device). --speed runs
+virtual time faster, so a day of schedule passes in 86400/N seconds; casts
+and fetches still take real time. After --hours of virtual time the run
+stops and prints what the device did. For a CPU profile use --profile, or
+run under ``py-spy record -- python3 bench/hostport/run.py``; --tracemalloc
+makes gc.mem_free() and the status page's heap figures meaningful.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import _thread
+
+BENCH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BENCH)
+import hostport  # noqa: E402
+
+PRAYERS = ("Fajr", "Dhuhr", "Asr", "Maghrib", "Isha")
+
+
+def parse(argv):
+    p = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    p.add_argument("--flash", help="flash directory, kept between runs (default: a new temporary one)")
+    p.add_argument("--speed", type=float, default=1, help="virtual seconds per real second")
+    p.add_argument("--soon", type=int, metavar="MIN", help="prayer times MIN minutes apart from power-on")
+    p.add_argument("--pre", type=int, default=0, metavar="MIN", help="pre-athan minutes (default 0)")
+    p.add_argument("--hours", type=float, default=24, help="virtual hours to run")
+    p.add_argument("--ota", action="store_true", help="offer this tree as an OTA update")
+    p.add_argument("--bootsel", type=float, metavar="SECS", help="hold BOOTSEL for SECS at power-on")
+    p.add_argument("--http-port", type=int, default=8080, help="host port for the device's port 80")
+    p.add_argument("--max-resets", type=int, default=5)
+    p.add_argument("--profile", metavar="FILE", help="cProfile the run into FILE and print the top entries")
+    p.add_argument("--tracemalloc", action="store_true")
+    return p.parse_args(argv)
+
+
+def _soon_times(minutes, offset):
+    """HH:MM local times, ``minutes`` apart starting ``minutes`` after power-on."""
+    from hostport import clock
+
+    local = int(clock.world() + offset) // 60
+    return ["{:02d}:{:02d}".format((m // 60) % 24, m % 60) for m in (local + minutes * (i + 1) for i in range(5))]
+
+
+def _flash(args):
+    import json
+
+    with open("config.json", "w") as f:
+        json.dump({"ssid": "HostNet", "password": "password", "cast_device_name": "Fake Cast",
+                   "pre_athan_mins": args.pre, "method": 2}, f)
+    if not args.ota and not os.path.exists("ota_slot.json"):
+        with open(os.path.join(hostport.ROOT, "version.txt")) as src, open("ota_version.txt", "w") as f:
+            f.write(src.read().strip())
+    for d in ("audio", "audio_cache"):
+        if not os.path.isdir(d):
+            os.mkdir(d)
+
+
+def _sync_templates():
+    """phew's render_template is an ``async def`` with yields: a plain
+    generator to MicroPython, which phew relies on, but an async generator
+    here. Drive it synchronously instead (it never awaits)."""
+    from bilalcast.phew import template
+
+    render = template.render_template
+
+    def render_template(path, **kwargs):
+        agen = render(path, **kwargs)
+        while True:
+            try:
+                agen.__anext__().send(None)
+            except StopIteration as chunk:
+                yield chunk.value
+            except StopAsyncIteration:
+                return
+
+    template.render_template = render_template
+
+
+def _power_on(rx_port, flash):
+    """Import bilalcast.main fresh, which runs the app until it returns or resets."""
+    from bilalcast import persist
+
+    persist.put("cast_device", {"host": "127.0.0.1", "port": rx_port})
+    persist.flush()
+    _sync_templates()
+    from bilalcast import audio, audiocache, status
+
+    audio.AUDIO_DIRS = (os.path.join(flash, "audio"),)
+    audiocache._dir = os.path.join(flash, "audio_cache")
+    # In the tree the templates are under bilalcast/, not next to it as in a slot
+    status._WWW = os.path.join(hostport.ROOT, "bilalcast", "www") + "/"
+    import bilalcast.main  # noqa: F401
+
+
+def _reboot():
+    import machine
+    import rp2
+
+    from hostport import clock
+
+    for name in [m for m in sys.modules if m == "bilalcast" or m.startswith("bilalcast.")]:
+        del sys.modules[name]
+    machine.reset_requested = False
+    machine.deinit_all()
+    # BOOTSEL is let go while the Pico restarts
+    rp2.hold_bootsel(0)
+    clock.reboot()
+
+
+def run(args):
+    hostport.install(args.speed)
+    if args.tracemalloc:
+        import tracemalloc
+
+        tracemalloc.start()
+    from hostport import internet
+
+    flash = os.path.abspath(args.flash or tempfile.mkdtemp(prefix="bilalcast-flash"))
+    os.makedirs(flash, exist_ok=True)
+    os.chdir(flash)
+
+    inet = internet.Internet()
+    if args.soon:
+        inet.times = _soon_times(args.soon, inet.location["offset"])
+    ports = inet.start()
+    hostport.route(ports, {80: args.http_port})
+    _flash(args)
+
+    import fake_cast
+    import fake_mdns
+    import machine
+    import network
+
+    network.ap("HostNet", "password", fake_mdns.local_ip())
+    rx = fake_cast.Receiver(fake_cast.Timing(item=5000))
+    rx_port = rx.start("127.0.0.1", 0, True)
+    if args.bootsel:
+        import rp2
+
+        rp2.hold_bootsel(args.bootsel)
+
+    print("flash: {}".format(flash))
+    print("prayer times: {}".format(" ".join("{} {}".format(p, t) for p, t in zip(PRAYERS, inet.times))))
+    print("status page: http://127.0.0.1:{}/".format(args.http_port))
+    sys.stdout.flush()
+
+    # KeyboardInterrupt in the main thread, which main.py catches and logs
+    stop = threading.Timer(args.hours * 3600 / args.speed, _thread.interrupt_main)
+    stop.daemon = True
+    stop.start()
+
+    resets = 0
+    while True:
+        try:
+            _power_on(rx_port, flash)
+        except machine.Reset:
+            reset = True
+        else:
+            reset = machine.reset_requested
+        if not reset or resets >= args.max_resets:
+            break
+        resets += 1
+        print("--- reset {} ---".format(resets))
+        _reboot()
+    stop.cancel()
+
+    print()
+    print("resets: {}".format(resets))
+    print("ntfy messages: {}".format(len(inet.ntfy)))
+    for host, n in sorted(inet.requests.items()):
+        print("  {:30s} {}".format(host, n))
+    print("casts loaded: {}".format(rx.loads))
+
+
+def main(argv):
+    args = parse(argv)
+    if args.profile:
+        import cProfile
+        import pstats
+
+        prof = cProfile.Profile()
+        try:
+            prof.runcall(run, args)
+        finally:
+            prof.dump_stats(args.profile)
+            pstats.Stats(args.profile).sort_stats("cumulative").print_stats(25)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,124 @@
+"""
+LOAD to PLAYING time for LAN-served vs internet-served athan audio.
+
+Stands in for the Chromecast's media player: for each URL it times what the
+receiver does between LOAD and reporting PLAYING — connect, a ranged GET
+for the first PREROLL bytes, then a second ranged request
+for the file's tail on the same connection (players read it for the
+duration) — and prints min/median/max over RUNS tries.
+
+Run from a workstation on the same LAN as the device:
+
+    python3 bench/load_to_playing.py \\
+        http://<device ip>/audio/Salat_Ibrahimiyya.mp3 \\
+        https://storage.googleapis.com/athans/Salat_Ibrahimiyya.mp3
+
+Or, with `--serve DIR`, against this repo's phew server on the workstation
+itself (DIR stands in for /audio), to check Range and keep-alive handling
+without a device.
+
+The device logs the real figure for every cast ("LOAD to PLAYING ... ms").
+"""
+import http.client
+import sys
+import time
+from urllib.parse import urlsplit
+
+RUNS = 5
+# Roughly what the default receiver buffers before it starts playing
+# (a few seconds of 128 kbit/s MP3)
+PREROLL = 64 * 1024
+TAIL = 16 * 1024
+
+
+def _connect(url):
+    u = urlsplit(url)
+    cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+    path = u.path + ("?" + u.query if u.query else "")
+    return cls(u.hostname, u.port, timeout=20), path
+
+
+def load_once(url):
+    """ms until PREROLL bytes were buffered and the tail was read; connection reused."""
+    t0 = time.perf_counter()
+    conn, path = _connect(url)
+    conn.request("GET", path, headers={"Range": "bytes=0-{}".format(PREROLL - 1)})
+    r = conn.getresponse()
+    if r.status not in (200, 206):
+        raise OSError("HTTP {}".format(r.status))
+    size = int(r.getheader("Content-Range", "/").split("/")[-1] or r.getheader("Content-Length", "0"))
+    r.read()
+    reused = False
+    if size > TAIL:
+        conn.request("GET", path, headers={"Range": "bytes={}-".format(size - TAIL)})
+        r = conn.getresponse()
+        reused = r.getheader("Connection", "").lower() == "keep-alive"
+        r.read()
+    ms = (time.perf_counter() - t0) * 1000
+    conn.close()
+    return ms, reused
+
+
+def bench(url):
+    times = []
+    for _ in range(RUNS):
+        ms, reused = load_once(url)
+        times.append(ms)
+    times.sort()
+    print(
+        "{:>8.0f} {:>8.0f} {:>8.0f} ms  keep-alive={}  {}".format(
+            times[0], times[len(times) // 2], times[-1], "yes" if reused else "no", url
+        )
+    )
+
+
+def serve(directory, port=8080):
+    """Run bilalcast's phew server on the workstation with ``directory`` as /audio."""
+    import asyncio
+    import importlib.util
+    import os
+    import threading
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    sys.path.insert(0, root)
+    # phew's server only needs get_event_loop/start_server/wait_for, which
+    # asyncio has; its package __init__ is device-only (gc.threshold), so
+    # load server.py on its own
+    sys.modules.setdefault("uasyncio", asyncio)
+    spec = importlib.util.spec_from_file_location("phew_server", os.path.join(root, "bilalcast/phew/server.py"))
+    server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(server)
+    from bilalcast import audio
+
+    audio.AUDIO_DIRS = (directory,)
+
+    async def run():
+        app = server.Phew()
+        app.add_route("/audio/<name>", lambda request, name: audio.serve(app, request, name), ["GET", "HEAD"])
+        await asyncio.start_server(app._handle_request, "127.0.0.1", port)
+        await asyncio.Event().wait()
+
+    threading.Thread(target=lambda: asyncio.run(run()), daemon=True).start()
+    time.sleep(0.5)
+    return "http://127.0.0.1:{}/audio/".format(port)
+
+
+def main(args):
+    if not args:
+        print(__doc__)
+        return
+    if args[0] == "--serve":
+        base = serve(args[1])
+        import os
+
+        args = [base + n for n in sorted(os.listdir(args[1]))] + args[2:]
+    print("     min   median      max")
+    for url in args:
+        try:
+            bench(url)
+        except Exception as e:
+            print("failed: {} ({})".format(url, e))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
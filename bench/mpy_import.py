@@ -0,0 +1,111 @@
+"""
+Import time and heap of the app's modules: .py source vs precompiled .mpy.
+
+First build the bytecode tree on the workstation, with the mpy-cross the
+pre-commit hook uses (`pip install mpy-cross==1.24.1.post2`, or set MPY_CROSS):
+
+    python3 bench/mpy_import.py
+
+That compiles bilalcast/ into mpy/bilalcast/. Then, on the device:
+
+    mpremote mount . run bench/mpy_import.py
+
+Each module in MODULES is imported in the order main.py imports it, once
+from bilalcast/ and once from mpy/bilalcast/, and its own import time and
+the heap it keeps are printed. Imports from a mounted directory are slowed
+by the USB link, which favours the smaller .mpy files; for boot-like figures
+copy bilalcast/, mpy/ and this file to the flash and run it from there.
+"""
+import gc
+import os
+import sys
+
+OUT = "mpy"
+MODULES = (
+    "bilalcast.boottime",
+    "bilalcast.logger",
+    "bilalcast.persist",
+    "bilalcast.prayer",
+    "bilalcast.discovery",
+    "bilalcast.ahttp",
+    "bilalcast.audio",
+    "bilalcast.audiocache",
+    "bilalcast.boot",
+    "bilalcast.fetch",
+    "bilalcast.health",
+    "bilalcast.metrics",
+    "bilalcast.offline",
+    "bilalcast.playlist",
+    "bilalcast.receiver",
+    "bilalcast.sntp",
+    "bilalcast.timetable",
+    "bilalcast.tz",
+    "bilalcast.wifi",
+    "bilalcast.status",
+    "bilalcast.state",
+)
+
+
+def build():
+    import shutil
+    import subprocess
+
+    exe = os.environ.get("MPY_CROSS") or shutil.which("mpy-cross")
+    if not exe:
+        sys.exit("mpy-cross not found; pip install mpy-cross==1.24.1.post2 or set MPY_CROSS")
+    n = 0
+    for d, _, files in os.walk("bilalcast"):
+        for f in files:
+            if not f.endswith(".py"):
+                continue
+            src = os.path.join(d, f)
+            dst = os.path.join(OUT, src[:-3] + ".mpy")
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            subprocess.run([exe, "-s", src, "-o", dst, src], check=True)
+            n += 1
+    print("{} modules compiled into {}/".format(n, OUT))
+
+
+def _purge():
+    for name in [m for m in sys.modules if m == "bilalcast" or m.startswith("bilalcast.")]:
+        del sys.modules[name]
+    gc.collect()
+
+
+def _run(root):
+    """Import MODULES from ``root``; returns ([(ms, heap)], free heap after)."""
+    import utime as time  # pyright: ignore[reportMissingImports]
+
+    _purge()
+    sys.path.insert(0, root)
+    rows = []
+    try:
+        for name in MODULES:
+            gc.collect()
+            a0 = gc.mem_alloc()
+            t0 = time.ticks_us()
+            __import__(name)
+            us = time.ticks_diff(time.ticks_us(), t0)
+            gc.collect()
+            rows.append((us // 1000, gc.mem_alloc() - a0))
+        return rows, gc.mem_free()
+    finally:
+        sys.path.remove(root)
+
+
+def main():
+    src, src_free = _run("")
+    mpy, mpy_free = _run(OUT)
+    _purge()
+    print("{:24s} {:>7s} {:>8s} {:>7s} {:>8s}".format("module", "py ms", "py heap", "mpy ms", "mpy heap"))
+    for name, (pm, ph), (mm, mh) in zip(MODULES, src, mpy):
+        print("{:24s} {:7d} {:8d} {:7d} {:8d}".format(name[10:], pm, ph, mm, mh))
+    print("{:24s} {:7d} {:8d} {:7d} {:8d}".format(
+        "total", sum(r[0] for r in src), sum(r[1] for r in src), sum(r[0] for r in mpy), sum(r[1] for r in mpy)))
+    print("free heap after imports: py {}, mpy {}".format(src_free, mpy_free))
+
+
+if sys.implementation.name == "micropython":
+    main()
+else:
+    build()
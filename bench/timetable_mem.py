@@ -0,0 +1,59 @@
+"""
+Heap cost of a year of prayer times: dicts of "HH:MM" strings vs packed days.
+
+Run on the device with `mpremote mount . run bench/timetable_mem.py`, or
+with the MicroPython unix port from the repo root.
+"""
+import gc
+import os
+from array import array
+
+from bilalcast import timetable
+
+DAYS = 365
+PATH = "bench_timetable.bin"
+
+
+def _fake_day(n):
+    # Plausible times that drift from day to day
+    return (300 + n % 60, 750 + n % 20, 930 + n % 50, 1080 + n % 70, 1170 + n % 60)
+
+
+def _used(build):
+    gc.collect()
+    before = gc.mem_alloc()
+    obj = build()
+    gc.collect()
+    return obj, gc.mem_alloc() - before
+
+
+def as_dicts():
+    year = []
+    for n in range(DAYS):
+        year.append({p: timetable.hhmm(m) for p, m in zip(timetable.PRAYERS, _fake_day(n))})
+    return year
+
+
+def as_array():
+    year = array("H")
+    for n in range(DAYS):
+        year.extend(_fake_day(n))
+    return year
+
+
+def main():
+    dicts, dict_bytes = _used(as_dicts)
+    del dicts
+    packed, packed_bytes = _used(as_array)
+    timetable.write(PATH, 20000, [packed[i * 5 : i * 5 + 5] for i in range(DAYS)])
+    del packed
+    day, file_bytes = _used(lambda: timetable.read_day(PATH, 20000 + 200))
+    assert list(day) == list(_fake_day(200))
+    os.remove(PATH)
+    print("days:", DAYS)
+    print("dict of HH:MM strings: {} bytes".format(dict_bytes))
+    print("array('H') in RAM:     {} bytes".format(packed_bytes))
+    print("flash file, one day:   {} bytes".format(file_bytes))
+
+
+main()
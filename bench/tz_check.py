@@ -0,0 +1,100 @@
+"""
+Check tz.py and the tzdb.py rules against CPython's zoneinfo.
+
+    python3 bench/tz_check.py [ZONE ...]
+
+For each zone (default ZONES: three with DST, one hemisphere apart, and one
+without) every hour of YEARS is converted both ways, and around each DST
+transition zoneinfo reports, every minute from two hours before to two hours
+after. utc_offset() and localtime() are compared at each instant, and
+mktime() for each wall-clock time: a time skipped by the jump must read
+with the offset from before it, a repeated one as its first occurrence,
+which is zoneinfo's fold=0. Prints the mismatches and exits 1 if there are
+any. Needs the system tz database or `pip install tzdata`.
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hostport  # noqa: E402
+
+hostport.install()
+from bilalcast import tz  # noqa: E402
+
+ZONES = ("Europe/London", "America/New_York", "Australia/Sydney", "Asia/Riyadh")
+YEARS = range(2024, 2031)
+AROUND_S = 2 * 3600
+SHOW = 10
+
+
+def _offset(zi, t):
+    return int(datetime.fromtimestamp(t, zi).utcoffset().total_seconds())
+
+
+def _local(zi, t):
+    return datetime.fromtimestamp(t, zi).timetuple()[:6]
+
+
+def _check_instant(zi, t, bad):
+    if tz.utc_offset(t) != _offset(zi, t):
+        bad.append("utc_offset({}) = {}, want {}".format(t, tz.utc_offset(t), _offset(zi, t)))
+    if tuple(tz.localtime(t)[:6]) != _local(zi, t):
+        bad.append("localtime({}) = {}, want {}".format(t, tuple(tz.localtime(t)[:6]), _local(zi, t)))
+
+
+def _check_wall(zi, wall, bad):
+    want = int(datetime(*wall, tzinfo=zi).timestamp())
+    got = tz.mktime(*wall)
+    if got != want:
+        bad.append("mktime{} = {}, want {}".format(wall, got, want))
+
+
+def check(name):
+    """Returns (transitions, instants checked, mismatches)."""
+    zi = ZoneInfo(name)
+    tz.set_zone(name)
+    if not tz.rule:
+        return 0, 0, ["no rule in tzdb for " + name]
+    bad = []
+    changes = []
+    n = 0
+    t = int(datetime(YEARS[0], 1, 1, tzinfo=timezone.utc).timestamp())
+    end = int(datetime(YEARS[-1] + 1, 1, 1, tzinfo=timezone.utc).timestamp())
+    prev = _offset(zi, t)
+    while t < end:
+        _check_instant(zi, t, bad)
+        n += 1
+        off = _offset(zi, t)
+        if off != prev:
+            changes.append(t)
+            prev = off
+        t += 3600
+    for hour in changes:
+        # The transition is in the hour before the first changed sample
+        for t in range(hour - 3600 - AROUND_S, hour + AROUND_S, 60):
+            _check_instant(zi, t, bad)
+            n += 1
+        # Wall-clock times either side of it, including any gap or repeat
+        t0 = hour - 3600 - AROUND_S
+        local = datetime.fromtimestamp(t0, timezone.utc) + timedelta(seconds=_offset(zi, t0))
+        for m in range(0, 2 * AROUND_S // 60 + 60, 15):
+            _check_wall(zi, (local + timedelta(minutes=m)).timetuple()[:6], bad)
+    return len(changes), n, bad
+
+
+def main(argv):
+    failed = False
+    for name in argv or ZONES:
+        changes, n, bad = check(name)
+        print("{:20s} {:28s} {:3d} transitions, {:6d} instants, {} mismatches".format(
+            name, tz.rule, changes, n, len(bad)))
+        for line in bad[:SHOW]:
+            print("    " + line)
+        failed = failed or bool(bad)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
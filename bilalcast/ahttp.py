@@ -0,0 +1,114 @@
+import asyncio
+import ujson as json  # pyright: ignore[reportMissingImports]
+
+DEFAULT_TIMEOUT_MS = 10000
+
+# Each TLS session holds tens of KB of mbedTLS buffers; with several boot
+# stages fetching at once, two handshakes can exhaust the Pico W heap.
+_tls = asyncio.Lock()
+
+
+def split_url(url):
+    """Return (use_ssl, host, port, path) for an http(s) URL."""
+    use_ssl = url.startswith("https://")
+    rest = url.split("://", 1)[1]
+    if "/" in rest:
+        hostport, path = rest.split("/", 1)
+        path = "/" + path
+    else:
+        hostport, path = rest, "/"
+    if ":" in hostport:
+        host, port = hostport.split(":", 1)
+        port = int(port)
+    else:
+        host, port = hostport, 443 if use_ssl else 80
+    return use_ssl, host, port, path
+
+
+async def _request(method, url, data, headers, sink=None):
+    use_ssl, host, port, path = split_url(url)
+    if use_ssl:
+        async with _tls:
+            return await _exchange(method, host, port, path, data, headers, True, sink)
+    return await _exchange(method, host, port, path, data, headers, False, sink)
+
+
+async def _exchange(method, host, port, path, data, headers, use_ssl, sink=None):
+    """Returns (status, response headers, body); with ``sink``, a 200 body is
+    written to it chunk by chunk and body is None."""
+    reader, writer = await asyncio.open_connection(host, port, ssl=True if use_ssl else None)
+    try:
+        # HTTP/1.0 so the server closes the connection and never sends chunked
+        req = "{} {} HTTP/1.0\r\nHost: {}\r\nUser-Agent: bilalcast\r\n".format(method, path, host)
+        for k, v in (headers or {}).items():
+            req += "{}: {}\r\n".format(k, v)
+        if data is not None:
+            if isinstance(data, str):
+                data = data.encode()
+            req += "Content-Length: {}\r\n".format(len(data))
+        writer.write(req.encode() + b"\r\n")
+        if data is not None:
+            writer.write(data)
+        await writer.drain()
+
+        line = await reader.readline()
+        if not line:
+            raise OSError("connection closed")
+        status = int(line.split(None, 2)[1])
+        resp_headers = {}
+        while True:
+            line = await reader.readline()
+            if not line or line == b"\r\n":
+                break
+            if sink is not None and b":" in line:
+                k, v = line.decode().split(":", 1)
+                resp_headers[k.strip().lower()] = v.strip()
+        if sink is not None and status == 200:
+            while True:
+                chunk = await reader.read(2048)
+                if not chunk:
+                    break
+                sink.write(chunk)
+            return status, resp_headers, None
+        # Join once at the end: growing a bytes object per chunk fragments the
+        # heap badly on large bodies such as a month of Aladhan calendar
+        chunks = []
+        while True:
+            chunk = await reader.read(1024)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return status, resp_headers, b"".join(chunks)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def request(method, url, data=None, headers=None, timeout_ms=DEFAULT_TIMEOUT_MS):
+    """Make one HTTP request without blocking the event loop. Returns (status, body)."""
+    status, _, body = await asyncio.wait_for(_request(method, url, data, headers), timeout_ms / 1000)
+    return status, body
+
+
+async def download(url, f, headers=None, timeout_ms=DEFAULT_TIMEOUT_MS):
+    """GET ``url`` and stream a 200 body into open file ``f`` without holding it in RAM.
+
+    Returns (status, response headers with lower-case names).
+    """
+    status, resp_headers, _ = await asyncio.wait_for(_request("GET", url, None, headers, f), timeout_ms / 1000)
+    return status, resp_headers
+
+
+async def get_json(url, timeout_ms=DEFAULT_TIMEOUT_MS):
+    """GET ``url`` and decode its JSON body. Raises OSError on a non-200 status."""
+    status, body = await request("GET", url, timeout_ms=timeout_ms)
+    if status != 200:
+        raise OSError("HTTP {} from {}".format(status, url.split("?", 1)[0]))
+    return json.loads(body)
+
+
+async def get_text(url, timeout_ms=DEFAULT_TIMEOUT_MS):
+    status, body = await request("GET", url, timeout_ms=timeout_ms)
+    if status != 200:
+        raise OSError("HTTP {} from {}".format(status, url.split("?", 1)[0]))
+    return (body or b"").decode()  # None only when a sink took the body
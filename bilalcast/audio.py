@@ -0,0 +1,66 @@
+"""
+Athan audio served from the device itself.
+
+An MP3 whose file name matches the last path segment of a remote audio URL
+(e.g. ``Salat_Ibrahimiyya.mp3``) and sits in one of AUDIO_DIRS is cast as
+``http://<device ip>/audio/<name>`` instead, so the Chromecast buffers it over
+the LAN rather than the internet. The status server streams it with Range
+support and keep-alive (see phew/server.py). Anything not found locally is
+cast from the on-device cache of remote audio if it is there (see
+audiocache.py), or from its remote URL.
+"""
+import os
+
+# An SD card, if one is mounted at /sd, is searched before flash
+AUDIO_DIRS = ("/sd/audio", "/audio")
+
+
+def name_for(url):
+    """File name an audio URL is stored under locally."""
+    return url[url.rfind("/") + 1 :].split("?")[0]
+
+
+def find(name):
+    """Path of a local audio file, or None."""
+    if not name or name[0] == "." or "/" in name:
+        return None
+    for d in AUDIO_DIRS:
+        path = d + "/" + name
+        try:
+            if os.stat(path)[0] & 0x4000 == 0:
+                return path
+        except OSError:
+            pass
+    return None
+
+
+def local_url(url, ip):
+    """The LAN URL for ``url`` if its file is stored or cached on the device, else ``url``."""
+    if not ip:
+        return url
+    name = name_for(url)
+    if find(name):
+        return "http://{}/audio/{}".format(ip, name)
+    from bilalcast import audiocache
+
+    key = audiocache.lookup(url)
+    if key:
+        return "http://{}/cache/{}.mp3".format(ip, key)
+    return url
+
+
+def remote_only(urls):
+    """The distinct URLs in ``urls`` that have no stored file."""
+    out = []
+    for url in urls:
+        if url not in out and not find(name_for(url)):
+            out.append(url)
+    return out
+
+
+def serve(app, request, name):
+    """Response for ``GET /audio/<name>``."""
+    path = find(name)
+    if path is None:
+        return "not found", 404, "text/plain"
+    return app.serve_file(path, request)
@@ -0,0 +1,229 @@
+"""
+On-device cache of remote athan MP3s, proxied to the Chromecast over the LAN.
+
+For audio kept in the cloud: prefetch() downloads each URL once, streamed to
+flash (or the SD card, if mounted at /sd) in chunks, and revalidates it with
+its ETag at most once per REVALIDATE_S so a recording replaced upstream is
+picked up. The cache is bounded by _budget(), which on flash is whatever
+the filesystem can spare, and evicts the least recently cast file first. A
+cast of a URL that is not cached yet goes to the remote URL as before and
+counts as a miss; fetch_missed() caches it once the cast is over.
+"""
+import hashlib
+import os
+import ubinascii  # pyright: ignore[reportMissingImports]
+import utime as time  # pyright: ignore[reportMissingImports]
+
+import bilalcast.persist as persist
+from bilalcast import ahttp, fetch
+from bilalcast.logger import log
+
+# {key: {"u": url, "e": etag, "n": size, "t": last cast, "c": last checked}}
+INDEX_KEY = "audio_cache"
+REVALIDATE_S = 86400
+DOWNLOAD_TIMEOUT_MS = 180000
+MAX_BYTES_SD = 64 * 1024 * 1024
+# Flash kept free for the journal, config and OTA slot downloads
+RESERVE_BYTES = 256 * 1024
+
+_dir = None
+# URLs prefetch() was asked to cache; only these count as hits or misses
+_wanted = set()
+# URLs being downloaded, so overlapping prefetch() calls fetch each once
+_fetching = set()
+# URLs that missed during a cast, for fetch_missed()
+_missed = set()
+
+hits = 0
+misses = 0
+bytes_served = 0
+downloads = 0
+revalidated = 0
+evictions = 0
+
+
+def _key(url):
+    return ubinascii.hexlify(hashlib.sha256(url.encode()).digest()[:8]).decode()
+
+
+def _on_sd():
+    try:
+        os.stat("/sd")
+        return True
+    except OSError:
+        return False
+
+
+def _cache_dir():
+    global _dir
+    if _dir is None:
+        _dir = "/sd/audio_cache" if _on_sd() else "/audio_cache"
+        try:
+            os.mkdir(_dir)
+        except OSError:
+            pass
+    return _dir
+
+
+def _path(key):
+    return _cache_dir() + "/" + key + ".mp3"
+
+
+def _remove(key):
+    try:
+        os.remove(_path(key))
+    except OSError:
+        pass
+
+
+def _index():
+    return dict(persist.get(INDEX_KEY) or {})
+
+
+def _budget(idx):
+    """Bytes the cache may hold: what it has plus what the filesystem can
+    spare, capped on the SD card. The flash is too small for a fixed cap to
+    mean anything, so there it is sized from free space alone."""
+    d = _cache_dir()
+    st = os.statvfs(d)
+    free = st[0] * st[3]
+    used = sum(e["n"] for e in idx.values())
+    if d.startswith("/sd/"):
+        return min(MAX_BYTES_SD, used + free)
+    return max(0, used + free - RESERVE_BYTES)
+
+
+def _evict(idx, need):
+    """Drop least recently cast entries until ``need`` more bytes fit. False if they never will."""
+    global evictions
+    budget = _budget(idx)
+    if need > budget:
+        return False
+    used = sum(e["n"] for e in idx.values())
+    while idx and used + need > budget:
+        key = min(idx, key=lambda k: idx[k]["t"])
+        used -= idx.pop(key)["n"]
+        _remove(key)
+        evictions += 1
+    return True
+
+
+def lookup(url):
+    """The cache key for ``url`` if it is cached, else None. Counts a hit or miss."""
+    global hits, misses
+    if url not in _wanted:
+        return None
+    key = _key(url)
+    idx = _index()
+    entry = idx.get(key)
+    if entry is None or entry["u"] != url:
+        misses += 1
+        # Cast from the remote URL this time, and be ready for the next
+        _missed.add(url)
+        return None
+    entry["t"] = time.time()
+    persist.put(INDEX_KEY, idx)
+    hits += 1
+    return key
+
+
+class _Capped(object):
+    """File wrapper for ahttp.download() that aborts the download once more
+    than ``limit`` bytes arrive, before they fill the filesystem."""
+
+    def __init__(self, f, limit):
+        self.f = f
+        self.limit = limit
+        self.n = 0
+
+    def write(self, chunk):
+        self.n += len(chunk)
+        if self.n > self.limit:
+            raise OSError("more than {} bytes does not fit the audio cache".format(self.limit))
+        self.f.write(chunk)
+
+
+async def _fetch(url):
+    global downloads, revalidated
+    key = _key(url)
+    idx = _index()
+    entry = idx.get(key)
+    headers = {}
+    if entry and entry.get("e"):
+        headers["If-None-Match"] = entry["e"]
+    idx.pop(key, None)
+    limit = _budget(idx)
+    tmp = _path(key) + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            status, resp = await ahttp.download(url, _Capped(f, limit), headers, DOWNLOAD_TIMEOUT_MS)
+        # Casts may have touched the index during the download
+        idx = _index()
+        entry = idx.get(key)
+        if status == 304:
+            if entry:
+                entry["c"] = time.time()
+                persist.put(INDEX_KEY, idx)
+            revalidated += 1
+            return
+        if status != 200:
+            raise OSError("HTTP {} from {}".format(status, url))
+        size = os.stat(tmp)[6]
+        idx.pop(key, None)
+        if not _evict(idx, size):
+            raise OSError("{} bytes does not fit the audio cache".format(size))
+        os.rename(tmp, _path(key))
+    finally:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+    now = time.time()
+    idx[key] = {"u": url, "e": resp.get("etag", ""), "n": size, "t": entry["t"] if entry else now, "c": now}
+    persist.put(INDEX_KEY, idx)
+    downloads += 1
+    log("audio cached: {} ({} KB)".format(url, size // 1024))
+
+
+async def prefetch(urls):
+    """Cache each of ``urls`` that is missing, and revalidate stale ones."""
+    now = time.time()
+    for url in urls:
+        _wanted.add(url)
+        if url in _fetching:
+            continue
+        entry = _index().get(_key(url))
+        if entry and now - entry["c"] < REVALIDATE_S:
+            continue
+        _fetching.add(url)
+        try:
+            await fetch.call("audio", lambda: _fetch(url), fetch.deadline_in(0))
+        except Exception as e:
+            print("audio cache:", url, e)
+        finally:
+            _fetching.discard(url)
+
+
+async def fetch_missed():
+    """Cache the URLs that missed, once the cast that missed them is over,
+    so their download does not compete with it for the network and heap."""
+    urls = list(_missed)
+    _missed.clear()
+    await prefetch(urls)
+
+
+def serve(app, request, name):
+    """Response for ``GET /cache/<key>.mp3``."""
+    global bytes_served
+    key = name.split(".")[0]
+    if key not in _index():
+        return "not found", 404, "text/plain"
+    response = app.serve_file(_path(key), request)
+    if request.method == "GET" and response.status in (200, 206):
+        bytes_served += response.length
+    return response
+
+
+def stats():
+    idx = _index()
+    return len(idx), sum(e["n"] for e in idx.values())
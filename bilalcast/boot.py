@@ -0,0 +1,44 @@
+"""
+Run boot stages concurrently, each starting as soon as its dependencies finish.
+"""
+import asyncio
+import utime as time  # pyright: ignore[reportMissingImports]
+
+from bilalcast.logger import log
+
+
+async def _run_stage(name, deps, fn, events, results, timings, t0):
+    for dep in deps:
+        await events[dep].wait()
+    start = time.ticks_ms()
+    try:
+        results[name] = await fn(results)
+    finally:
+        end = time.ticks_ms()
+        timings.append((name, time.ticks_diff(start, t0), time.ticks_diff(end, start)))
+        events[name].set()
+
+
+async def run(stages):
+    """Run ``stages``, a list of ``(name, deps, fn)``; ``fn(results)`` is awaited.
+
+    ``results`` maps each finished stage name to its return value. An exception
+    in any stage propagates once the others have been scheduled. Returns results.
+    """
+    events = {}
+    for name, _, _ in stages:
+        events[name] = asyncio.Event()
+    results = {}
+    timings = []
+    t0 = time.ticks_ms()
+    await asyncio.gather(
+        *[_run_stage(name, deps, fn, events, results, timings, t0) for name, deps, fn in stages]
+    )
+    # One line for the whole boot: every log() is an HTTP POST when not in DEBUG
+    log(
+        "boot stages ({} ms): {}".format(
+            time.ticks_diff(time.ticks_ms(), t0),
+            ", ".join("{} +{}/{}ms".format(n, s, d) for n, s, d in timings),
+        )
+    )
+    return results
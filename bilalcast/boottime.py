@@ -0,0 +1,70 @@
+import gc
+import sys
+import utime as time  # pyright: ignore[reportMissingImports]
+
+# (module, self_ms, total_ms, heap_bytes) for each module imported while installed
+_records = []
+# (label, ms since power-on)
+_marks = []
+_seen = set()
+# One [child_us, child_heap] accumulator per import in progress
+_stack = []
+_orig_import = None
+
+
+def _profiled_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules or name in _seen:
+        return _orig_import(name, globals, locals, fromlist, level)  # type: ignore[misc]
+    _seen.add(name)
+    _stack.append([0, 0])
+    a0 = gc.mem_alloc()
+    t0 = time.ticks_us()
+    try:
+        return _orig_import(name, globals, locals, fromlist, level)  # type: ignore[misc]
+    finally:
+        total_us = time.ticks_diff(time.ticks_us(), t0)
+        heap = max(0, gc.mem_alloc() - a0)
+        child_us, child_heap = _stack.pop()
+        if _stack:
+            _stack[-1][0] += total_us
+            _stack[-1][1] += heap
+        _records.append((name, (total_us - child_us) // 1000, total_us // 1000, max(0, heap - child_heap)))
+
+
+def install():
+    """Start timing imports. Returns False if this firmware can't override __import__."""
+    global _orig_import
+    import builtins
+    if _orig_import is not None:
+        return True
+    try:
+        _orig_import = builtins.__import__
+        builtins.__import__ = _profiled_import
+    except (AttributeError, TypeError):
+        _orig_import = None
+        return False
+    return True
+
+
+def uninstall():
+    global _orig_import
+    import builtins
+    if _orig_import is not None:
+        builtins.__import__ = _orig_import
+        _orig_import = None
+
+
+def mark(label):
+    """Record a boot milestone; ticks_ms counts from power-on on the Pico."""
+    ms = time.ticks_ms()
+    _marks.append((label, ms))
+    return ms
+
+
+def marks():
+    return _marks
+
+
+def slowest(n=10):
+    """The ``n`` imports with the highest self time."""
+    return sorted(_records, key=lambda r: -r[1])[:n]
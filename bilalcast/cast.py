@@ -1,4 +1,6 @@
-import socket, ssl, time
+import asyncio
+import select, socket, ssl, time
+import ujson as json  # pyright: ignore[reportMissingImports]
 
 from struct import pack, unpack
 import gc
@@ -10,6 +12,9 @@ _RECV = b"receiver-0"
 _NS_CONN = b"urn:x-cast:com.google.cast.tp.connection"
 _NS_RECV = b"urn:x-cast:com.google.cast.receiver"
 _NS_MEDIA = b"urn:x-cast:com.google.cast.media"
+_NS_HEARTBEAT = b"urn:x-cast:com.google.cast.tp.heartbeat"
+
+APP_MEDIA = b"CC1AD845"  # Default Media Receiver
 
 
 def _varint(n):
@@ -60,18 +65,79 @@ def _frame(namespace, payload_utf8, dest=_RECV, src=_SRC):
     return pack(">I", len(body)) + body
 
 
+def _parse(msg):
+    """(namespace, source_id, payload_utf8) of a CastMessage body."""
+    ns = src = payload = b""
+    i = 0
+    while i < len(msg):
+        tag = msg[i]
+        i += 1
+        if tag & 7 == 0:
+            while msg[i] & 0x80:
+                i += 1
+            i += 1
+            continue
+        if tag & 7 != 2:
+            raise ValueError("unexpected wire type")
+        n = shift = 0
+        while True:
+            b = msg[i]
+            i += 1
+            n |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                break
+        field = tag >> 3
+        if field == 2:
+            src = msg[i : i + n]
+        elif field == 4:
+            ns = msg[i : i + n]
+        elif field == 6:
+            payload = msg[i : i + n]
+        i += n
+    return ns, src, payload
+
+
+def _media(url_b):
+    """MediaInformation JSON for an MP3 URL."""
+    return (
+        b'{"contentId":"' + url_b + b'","streamType":"BUFFERED","contentType":"audio/mpeg","metadata":'
+        b'{"metadataType":0,"title":"Bilal Cast","thumb":"' + THUMB + b'","images":[{"url":"' + THUMB + b'"}]}}'
+    )
+
+
+def tls_connect(sock, host, port):
+    """Connect ``sock`` to host:port and return the stream to speak Cast over.
+
+    The default transport: TLS, without certificate checks, as the receiver
+    presents a device certificate no CA signs. ``transport`` can be swapped
+    for one that returns any object with read/write/close that select.poll
+    accepts, e.g. to run against a fake receiver on another platform.
+    """
+    sock.connect((host, port))
+    return ssl.wrap_socket(sock)
+
+
+transport = tls_connect
+
+
 class Chromecast(object):
     def __init__(self, cast_ip, cast_port, timeout_s=5):
         self.ip = cast_ip
+        # ms from sending LOAD to MEDIA_STATUS PLAYING, for the last play_url()
+        self.load_to_playing_ms = None
+        # transport (session) of the media app launched by play_url()
+        self.transport_id = None
         self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.s = None
+        self._poll = None
+        self._request_id = 0
         try:
             try:
                 self._sock.settimeout(timeout_s)
             except Exception:
                 pass
-            self._sock.connect((self.ip, cast_port))
-            self.s = ssl.wrap_socket(self._sock)
+            self.s = transport(self._sock, self.ip, cast_port)
             self._send(_frame(_NS_CONN, b'{"type":"CONNECT"}'))
         except Exception:
             try:
@@ -116,58 +182,193 @@ class Chromecast(object):
             raise OSError("invalid cast frame size: %d" % siz)
         return self._read_exact(siz)
 
+    async def next_message(self, timeout_ms):
+        """Next JSON message as (namespace, source_id, dict), or None after ``timeout_ms``.
+
+        Heartbeat PINGs from the receiver are answered here, not returned.
+        """
+        start = self._ticks_ms()
+        while True:
+            left = timeout_ms - self._ticks_diff(self._ticks_ms(), start)
+            if left <= 0 or not await self._readable(left):
+                return None
+            ns, src, payload = _parse(self.read_message())
+            if ns == _NS_HEARTBEAT:
+                if b'"PING"' in payload:
+                    self._send(_frame(_NS_HEARTBEAT, b'{"type":"PONG"}', dest=src))
+                continue
+            try:
+                return ns, src, json.loads(payload)
+            except ValueError:
+                continue
+
+    def ping(self):
+        """Keep the connection alive while nothing else is being sent."""
+        self._send(_frame(_NS_HEARTBEAT, b'{"type":"PING"}'))
+
+    def _rid(self):
+        """Next request id; unique per connection so replies can be told apart."""
+        self._request_id += 1
+        return self._request_id
+
+    def _rid_b(self):
+        return str(self._rid()).encode()
+
+    async def _reply(self, request_id, timeout_ms):
+        """The reply to request ``request_id``, skipping broadcasts and other replies."""
+        start = self._ticks_ms()
+        while True:
+            left = timeout_ms - self._ticks_diff(self._ticks_ms(), start)
+            m = await self.next_message(left) if left > 0 else None
+            if m is None:
+                return None
+            if m[2].get("requestId") == request_id:
+                return m[2]
+
+    async def receiver_status(self, timeout_ms=3000):
+        """The RECEIVER_STATUS ``status`` object (applications, volume), or None."""
+        rid = self._rid()
+        self._send(_frame(_NS_RECV, b'{"type":"GET_STATUS","requestId":' + str(rid).encode() + b"}"))
+        d = await self._reply(rid, timeout_ms)
+        return d.get("status") if d else None
+
+    async def media_status(self, transport_id, timeout_ms=3000):
+        """The first MEDIA_STATUS entry of the app at ``transport_id``, or None."""
+        if isinstance(transport_id, str):
+            transport_id = transport_id.encode()
+        self._send(_frame(_NS_CONN, b'{"type":"CONNECT"}', dest=transport_id))
+        rid = self._rid()
+        self._send(_frame(_NS_MEDIA, b'{"type":"GET_STATUS","requestId":' + str(rid).encode() + b"}", dest=transport_id))
+        d = await self._reply(rid, timeout_ms)
+        return d["status"][0] if d and d.get("status") else None
+
+    async def resume(self, app_id, media, current_time, timeout_ms=5000):
+        """Relaunch ``app_id`` and reload ``media`` (a MediaInformation dict) at ``current_time``."""
+        if isinstance(app_id, str):
+            app_id = app_id.encode()
+        self._send(_frame(_NS_RECV, b'{"type":"LAUNCH","appId":"' + app_id + b'","requestId":' + self._rid_b() + b"}"))
+        transport_id = await self._wait_for_transport_id(timeout_ms=timeout_ms)
+        if not transport_id:
+            return False
+        self._send(_frame(_NS_CONN, b'{"type":"CONNECT"}', dest=transport_id))
+        await asyncio.sleep_ms(1000)
+        payload = json.dumps({
+            "type": "LOAD",
+            "media": media,
+            "currentTime": current_time,
+            "autoplay": True,
+            "requestId": self._rid(),
+            "sessionId": transport_id.decode(),
+        })
+        self._send(_frame(_NS_MEDIA, payload, dest=transport_id))
+        return True
+
     def set_volume(self, volume):
         if isinstance(volume, float):
-            v = ("%.2f" % volume).rstrip("0").rstrip(".")
+            # Four places, so a level read back from the receiver is restored exactly
+            v = ("%.4f" % volume).rstrip("0").rstrip(".")
         else:
             v = str(volume)
-        payload = b'{"type":"SET_VOLUME","volume":{"level":' + v.encode() + b'},"requestId":2}'
+        payload = b'{"type":"SET_VOLUME","volume":{"level":' + v.encode() + b'},"requestId":' + self._rid_b() + b"}"
         self._send(_frame(_NS_RECV, payload, dest=_RECV))
 
-    def play_url(self, url):
-        if isinstance(url, str):
-            url_b = url.encode()
-        else:
-            url_b = url
+    async def ramp_volume(self, start, end, steps, duration_ms):
+        """Move the volume from ``start`` to ``end`` in ``steps`` even steps over ``duration_ms``.
+
+        The SET_VOLUMEs are pipelined: each goes out on schedule without
+        waiting for the receiver's reply to the one before.
+        """
+        for i in range(1, steps + 1):
+            await asyncio.sleep_ms(duration_ms // steps)
+            self.set_volume(start + (end - start) * i / steps)
+
+    async def _readable(self, timeout_ms):
+        """Yield to the event loop until a message arrives or ``timeout_ms`` passes.
 
-        self._send(_frame(_NS_RECV, b'{"type":"STOP","requestId":2}'))
-        self._send(_frame(_NS_RECV, b'{"type":"LAUNCH","appId":"CC1AD845","requestId":3}'))
+        The status server must keep running meanwhile: when the audio is
+        served from this device, the receiver fetches it from us before it
+        reports the load.
+        """
+        if self._poll is None:
+            self._poll = select.poll()
+            self._poll.register(self.s, select.POLLIN)
+        # Records the TLS layer has already decrypted do not show on the socket
+        pending = getattr(self.s, "pending", None)
+        start = self._ticks_ms()
+        while not (pending and pending()) and not self._poll.poll(0):
+            if self._ticks_diff(self._ticks_ms(), start) >= timeout_ms:
+                return False
+            await asyncio.sleep_ms(20)
+        return True
 
-        transport_id = self._wait_for_transport_id(timeout_ms=5000)
+    async def play_url(self, url):
+        """Play ``url``, or a list of URLs queued in one QUEUE_LOAD."""
+        urls = [url] if isinstance(url, (str, bytes)) else url
+        urls = [u.encode() if isinstance(u, str) else u for u in urls]
+
+        self._send(_frame(_NS_RECV, b'{"type":"STOP","requestId":' + self._rid_b() + b"}"))
+        self._send(_frame(_NS_RECV, b'{"type":"LAUNCH","appId":"' + APP_MEDIA + b'","requestId":' + self._rid_b() + b"}"))
+
+        transport_id = await self._wait_for_transport_id(timeout_ms=5000)
         if not transport_id:
             return False
 
+        self.transport_id = transport_id
         self._send(_frame(_NS_CONN, b'{"type":"CONNECT"}', dest=transport_id))
-        time.sleep_ms(1000)  # let transport connection settle before sending LOAD
+        await asyncio.sleep_ms(1000)  # let transport connection settle before sending LOAD
 
-        load_payload = (
-            b'{"media":{"contentId":"' + url_b + b'","streamType":"BUFFERED","contentType":"audio/mpeg","metadata":'
-            b'{"metadataType":0,"title":"Bilal Cast","thumb":"' + THUMB + b'","images":[{"url":"' + THUMB + b'"}]}},'
-            b'"type":"LOAD","autoplay":true,"customData":{},"requestId":4,"sessionId":"' + transport_id + b'"}'
-        )
+        if len(urls) == 1:
+            load_payload = (
+                b'{"media":' + _media(urls[0]) + b',"type":"LOAD","autoplay":true,"customData":{},'
+                b'"requestId":' + self._rid_b() + b',"sessionId":"' + transport_id + b'"}'
+            )
+        else:
+            # The receiver buffers each item preloadTime seconds before the
+            # previous one ends, so the queue plays without gaps or reconnects
+            items = b",".join([b'{"media":' + _media(u) + b',"autoplay":true,"preloadTime":10}' for u in urls])
+            load_payload = (
+                b'{"type":"QUEUE_LOAD","items":[' + items + b'],"startIndex":0,"repeatMode":"REPEAT_OFF",'
+                b'"customData":{},"requestId":' + self._rid_b() + b',"sessionId":"' + transport_id + b'"}'
+            )
 
         self._send(_frame(_NS_MEDIA, load_payload, dest=transport_id))
-        return self._wait_for_load_confirmation(timeout_ms=10000)
+        return await self._wait_for_load_confirmation(timeout_ms=10000)
 
-    def _wait_for_load_confirmation(self, timeout_ms=10000):
-        """Read messages until MEDIA_STATUS shows BUFFERING/PLAYING, or LOAD_FAILED."""
+    async def _wait_for_load_confirmation(self, timeout_ms=10000, playing_ms=5000):
+        """Read messages until MEDIA_STATUS shows PLAYING, or LOAD_FAILED.
+
+        BUFFERING already counts as loaded; after it, wait up to ``playing_ms``
+        more for PLAYING so the LOAD to PLAYING time can be recorded.
+        """
         start = self._ticks_ms()
-        while self._ticks_diff(self._ticks_ms(), start) < timeout_ms:
+        limit = timeout_ms
+        buffering = False
+        while True:
+            left = limit - self._ticks_diff(self._ticks_ms(), start)
+            if left <= 0 or not await self._readable(left):
+                break
             try:
                 msg = self.read_message()
             except OSError:
-                return False
+                return buffering
             if b"LOAD_FAILED" in msg:
                 return False
-            if b'"BUFFERING"' in msg or b'"PLAYING"' in msg:
+            if b'"PLAYING"' in msg:
+                self.load_to_playing_ms = self._ticks_diff(self._ticks_ms(), start)
                 return True
-        return False
+            if b'"BUFFERING"' in msg and not buffering:
+                buffering = True
+                limit = self._ticks_diff(self._ticks_ms(), start) + playing_ms
+        return buffering
 
-    def _wait_for_transport_id(self, timeout_ms=4000):
+    async def _wait_for_transport_id(self, timeout_ms=4000):
         """Wait until any incoming message contains "transportId":"..."""
         start = self._ticks_ms()
         key = b'"transportId":"'
-        while self._ticks_diff(self._ticks_ms(), start) < timeout_ms:
+        while True:
+            left = timeout_ms - self._ticks_diff(self._ticks_ms(), start)
+            if left <= 0 or not await self._readable(left):
+                break
             try:
                 msg = self.read_message()
             except OSError:
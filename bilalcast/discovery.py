@@ -1,19 +1,14 @@
 import asyncio
-import utime as time
-import ujson as json
 
-from bilalcast.cast import Chromecast
+import bilalcast.persist as persist
 from bilalcast.logger import log
 
 _persistent_client = None
 
-CAST_CACHE_FILE = "cast_device.json"
-
 
 def _load_cast_cache():
     try:
-        with open(CAST_CACHE_FILE) as f:
-            d = json.load(f)
+        d = persist.get("cast_device") or {}
         host, port = d.get("host"), d.get("port")
         if host and port:
             return host, int(port)
@@ -23,30 +18,7 @@ def _load_cast_cache():
 
 
 def _save_cast_cache(host, port):
-    try:
-        with open(CAST_CACHE_FILE, "w") as f:
-            json.dump({"host": host, "port": port}, f)
-    except Exception as e:
-        log("Cache save failed: " + str(e))
-
-
-def _device_reachable(host, port):
-    s = None
-    try:
-        import socket
-
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.settimeout(3)
-        s.connect((host, port))
-        return True
-    except Exception:
-        return False
-    finally:
-        if s:
-            try:
-                s.close()
-            except Exception:
-                pass
+    persist.put("cast_device", {"host": host, "port": port})
 
 
 def start_mdns_responder(local_ip, device_ip):
@@ -118,44 +90,30 @@ async def list_cast_devices(local_ip, scans=5):
     return devices
 
 
+async def rediscover(local_ip, name):
+    """Find ``name`` over mDNS and cache its address. Returns (host, port) or (None, None)."""
+    host, port = await _mdns_find(local_ip, name)
+    if host and port:
+        _save_cast_cache(host, port)
+    return host, port
+
+
 async def resolve_cast_device(local_ip, name):
+    from bilalcast import health
+
     host, port = _load_cast_cache()
     if host and port:
         log("Cache hit: {}:{}, verifying...".format(host, port))
-        if _device_reachable(host, port):
+        if await health.check(host, port):
             log("Cached device confirmed.")
             return host, port
         log("Cached device unreachable, scanning mDNS...")
 
     log("Scanning mDNS for '{}'...".format(name))
-    host, port = await _mdns_find(local_ip, name)
+    host, port = await rediscover(local_ip, name)
     if host and port:
         log("Found via mDNS: {}:{}".format(host, port))
-        _save_cast_cache(host, port)
         return host, port
 
     log("mDNS scan failed — cast device not found. Proceeding without cast.")
     return None, None
-
-
-def cast_url(url, host, port, volume=0.5, max_retries=3):
-    last_error = "transport_id timeout"
-    for attempt in range(1, max_retries + 1):
-        cc = None
-        ok = False
-        try:
-            cc = Chromecast(host, port)
-            cc.set_volume(volume)
-            if cc.play_url(url):
-                ok = True
-                return True, None
-            log("Cast attempt {}/{}: transport_id timeout".format(attempt, max_retries))
-        except Exception as e:
-            last_error = str(e)
-            log("Cast attempt {}/{} failed: {}".format(attempt, max_retries, e))
-        finally:
-            if cc:
-                cc.disconnect()
-        if attempt < max_retries:
-            time.sleep(3)
-    return False, last_error
@@ -0,0 +1,133 @@
+"""
+Shared retry policy for network fetches.
+
+Each endpoint gets a circuit breaker: after FAIL_THRESHOLD consecutive
+failures it opens and calls skip the network until the cool-down ends. The
+cool-down doubles every time a trial call fails, up to MAX_OPEN_MS. Between
+attempts call() backs off exponentially with jitter and gives up at the
+caller's deadline. While the breaker is open, or once the deadline has
+passed, the caller's fallback (e.g. last-known-good data) is used instead.
+"""
+import asyncio
+import random
+import utime as time  # pyright: ignore[reportMissingImports]
+
+from bilalcast import metrics
+
+FAIL_THRESHOLD = 3
+OPEN_MS = 60000
+MAX_OPEN_MS = 30 * 60000
+BACKOFF_MIN_MS = 1000
+BACKOFF_MAX_MS = 60000
+
+_breakers = {}
+
+
+class Breaker(object):
+    __slots__ = (
+        "name",
+        "failures",
+        "opened_at",
+        "open_ms",
+        "calls",
+        "retries",
+        "errors",
+        "fallbacks",
+        "last_error",
+    )
+
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self.open_ms = OPEN_MS
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+        self.fallbacks = 0
+        self.last_error = ""
+
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.wait_ms() == 0 else "open"
+
+    def wait_ms(self):
+        """How long until a call may go out; 0 when closed or half-open."""
+        if self.opened_at is None:
+            return 0
+        return max(0, self.open_ms - time.ticks_diff(time.ticks_ms(), self.opened_at))
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.open_ms = OPEN_MS
+
+    def failure(self, e):
+        self.errors += 1
+        self.failures += 1
+        self.last_error = str(e) or type(e).__name__
+        if self.opened_at is not None:
+            # A half-open trial failed: stay open for longer
+            self.open_ms = min(self.open_ms * 2, MAX_OPEN_MS)
+            self.opened_at = time.ticks_ms()
+        elif self.failures >= FAIL_THRESHOLD:
+            self.opened_at = time.ticks_ms()
+
+
+def breaker(name):
+    b = _breakers.get(name)
+    if b is None:
+        b = _breakers[name] = Breaker(name)
+    return b
+
+
+def breakers():
+    return list(_breakers.values())
+
+
+def deadline_in(ms):
+    """A deadline ``ms`` from now, for call()."""
+    return time.ticks_add(time.ticks_ms(), max(0, ms))
+
+
+async def call(name, fn, deadline=None, fallback=None):
+    """Await ``fn()`` under endpoint ``name``'s breaker, retrying until it succeeds.
+
+    ``deadline`` is a ticks_ms value (see deadline_in) after which no new
+    attempt starts; None retries indefinitely. ``fallback()`` is tried when
+    the breaker is open or the deadline has passed; if it returns None the
+    call keeps waiting, or raises OSError once past the deadline.
+    """
+    b = breaker(name)
+    delay = BACKOFF_MIN_MS
+    attempted = False
+    while True:
+        wait = b.wait_ms()
+        if not wait:
+            if attempted:
+                b.retries += 1
+                metrics.inc(metrics.FETCH_RETRIES)
+            attempted = True
+            b.calls += 1
+            try:
+                result = await fn()
+                b.success()
+                return result
+            except Exception as e:
+                b.failure(e)
+                print("fetch", name, "failed:", e)
+            wait = b.wait_ms()
+        expired = deadline is not None and time.ticks_diff(deadline, time.ticks_ms()) <= 0
+        if wait or expired:
+            value = fallback() if fallback else None
+            if value is not None:
+                b.fallbacks += 1
+                return value
+        if expired:
+            raise OSError("{} unavailable: {}".format(name, b.last_error))
+        pause = wait or delay // 2 + random.getrandbits(16) % delay
+        delay = min(delay * 2, BACKOFF_MAX_MS)
+        if deadline is not None:
+            pause = min(pause, max(0, time.ticks_diff(deadline, time.ticks_ms())))
+        await asyncio.sleep_ms(pause)
@@ -0,0 +1,45 @@
+import hashlib
+import ubinascii  # pyright: ignore[reportMissingImports]
+
+import bilalcast.persist as persist
+from bilalcast import ahttp, fetch
+from bilalcast.logger import log
+from bilalcast.prayer import _url_encode
+
+# Coordinates of the last geocoded address, keyed by a hash of the address
+CACHE_KEY = "geocode"
+
+
+def _address_key(address):
+    norm = " ".join(address.lower().split())
+    return ubinascii.hexlify(hashlib.sha256(norm.encode()).digest()[:8]).decode()
+
+
+def cached(address):
+    """Return the cached (lat, lon) for ``address``, or (None, None)."""
+    c = persist.get(CACHE_KEY)
+    if c and c.get("h") == _address_key(address):
+        return c["lat"], c["lon"]
+    return None, None
+
+
+async def geocode_address(address):
+    """Geocode an address via Nominatim. Returns (lat, lon) floats or (None, None).
+
+    Nominatim is only asked once per address; the result is kept on flash.
+    """
+    lat, lon = cached(address)
+    if lat is not None:
+        return lat, lon
+    url = "https://nominatim.openstreetmap.org/search?q=" + _url_encode(address) + "&format=json&limit=1"
+    try:
+        # One attempt: callers fall back to the address endpoint
+        results = await fetch.call("nominatim", lambda: ahttp.get_json(url), fetch.deadline_in(0))
+        if results:
+            log("geocoded '{}' → {}, {}".format(address, results[0]["lat"], results[0]["lon"]))
+            lat, lon = float(results[0]["lat"]), float(results[0]["lon"])
+            persist.put(CACHE_KEY, {"h": _address_key(address), "lat": lat, "lon": lon})
+            return lat, lon
+    except Exception as e:
+        log("geocode failed: " + str(e))
+    return None, None
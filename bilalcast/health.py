@@ -0,0 +1,91 @@
+"""
+Cast device liveness, checked ahead of the prayer times.
+
+monitor() probes the Chromecast's Cast port with a non-blocking TCP connect
+(no TLS, no Cast handshake) every INTERVAL_S, and every SOON_INTERVAL_S once
+a cast is less than SOON_S away. After FAIL_STREAK failed probes in a row
+the device is looked up again over mDNS, so a DHCP lease change is noticed
+and the new address cached before the athan rather than at it.
+"""
+import asyncio
+import select
+import socket
+import utime as time  # pyright: ignore[reportMissingImports]
+
+from bilalcast.logger import log
+
+TIMEOUT_MS = 1500
+INTERVAL_S = 300
+SOON_INTERVAL_S = 30
+SOON_S = 15 * 60
+FAIL_STREAK = 3
+
+rtt_ms = None
+failures = 0
+probes = 0
+rediscoveries = 0
+
+
+async def probe(host, port, timeout_ms=TIMEOUT_MS):
+    """Round-trip ms of a TCP connect to host:port, or None if it fails."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.setblocking(False)
+        t0 = time.ticks_ms()
+        try:
+            s.connect(socket.getaddrinfo(host, port)[0][-1])
+        except OSError:
+            pass  # EINPROGRESS
+        p = select.poll()
+        p.register(s, select.POLLOUT)
+        while True:
+            ev = p.poll(0)
+            if ev:
+                # A refused or reset connect shows up as an error, not as writable
+                if ev[0][1] & (select.POLLERR | select.POLLHUP):
+                    return None
+                return time.ticks_diff(time.ticks_ms(), t0)
+            if time.ticks_diff(time.ticks_ms(), t0) >= timeout_ms:
+                return None
+            await asyncio.sleep_ms(10)
+    except OSError:
+        return None
+    finally:
+        s.close()
+
+
+async def check(host, port):
+    """Probe once, recording RTT and the failure streak. Returns True if reachable."""
+    global rtt_ms, failures, probes
+    probes += 1
+    rtt = await probe(host, port)
+    if rtt is None:
+        failures += 1
+        return False
+    rtt_ms = rtt
+    failures = 0
+    return True
+
+
+async def monitor(state, name, secs_to_next_cast):
+    """Background task: keep ``state.cast_host``/``cast_port`` pointing at a live device.
+
+    ``secs_to_next_cast()`` returns seconds until the next scheduled cast, or None.
+    """
+    global failures, rediscoveries
+    from bilalcast import discovery
+
+    while True:
+        secs = secs_to_next_cast()
+        await asyncio.sleep(SOON_INTERVAL_S if secs is not None and secs < SOON_S else INTERVAL_S)
+        host, port = state.cast_host, state.cast_port
+        # Rediscover on every FAIL_STREAK-th failure, not on each one after it
+        if host is None or await check(host, port) or failures % FAIL_STREAK:
+            continue
+        print("cast device {}:{} unreachable {} times, rediscovering".format(host, port, failures))
+        new_host, new_port = await discovery.rediscover(state.local_ip, name)
+        rediscoveries += 1
+        if new_host and (new_host, new_port) != (host, port):
+            log("cast device moved: {}:{} -> {}:{}".format(host, port, new_host, new_port))
+            state.update(cast_host=new_host, cast_port=new_port)
+            failures = 0
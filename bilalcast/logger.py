@@ -1,4 +1,3 @@
-import urequests  # pyright: ignore[reportMissingImports]
 import ujson as json  # pyright: ignore[reportMissingImports]
 
 _debug = True
@@ -20,6 +19,8 @@ def send_ntfy(msg, priority=3, tags=None):
     if tags:
         payload["tags"] = tags
     try:
+        import urequests  # pyright: ignore[reportMissingImports]
+
         resp = urequests.post(
             "https://ntfy.sh/",
             data=json.dumps(payload),
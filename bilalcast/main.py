@@ -1,27 +1,32 @@
+# Installed first so every import below is timed (shown on the status page)
+import bilalcast.boottime as boottime
+boottime.install()
+
 import asyncio
 import machine
-import network
 import utime as time
 import ujson as json
-import ntptime
 import os
 
 import bilalcast.logger as logger
+import bilalcast.persist as persist
+import bilalcast.prayer as prayer
 from bilalcast.logger import log, warn, error, send_ntfy
 from bilalcast.prayer import (
     get_location,
+    revalidate_location,
+    last_known_times,
     get_all_prayers,
     get_all_prayers_by_address,
     try_prayers_by_address,
-    geocode_address,
     pre_athan_time,
     seconds_until,
-    ATHANS,
     ATHANS_ORDER,
-    PRE_ATHAN,
 )
-from bilalcast.discovery import resolve_cast_device, cast_url, start_mdns_responder, list_cast_devices
+from bilalcast.discovery import resolve_cast_device, start_mdns_responder
+from bilalcast import ahttp, audio, audiocache, boot, fetch, health, metrics, offline, playlist, receiver, sntp, timetable, tz, wifi
 from bilalcast.status import start_status_server
+from bilalcast.state import State
 
 # USER CONFIGURED DATA
 DEBUG = False  # True = print to console, False = send via ntfy
@@ -29,7 +34,6 @@ DEBUG = False  # True = print to console, False = send via ntfy
 ACTIVATION_URL = "https://translate.google.com/translate_tts?client=tw-ob&tl=en&q=Salaam+Alaykum,+This+is+Belaal+Cast.+You+will+hear+the+adthaan+on+this+device."
 
 CONFIG_FILE = "config.json"
-CAST_STATE_FILE = "cast_state.json"
 
 # Runtime config — populated from CONFIG_FILE at boot
 SSID = None
@@ -51,26 +55,7 @@ _led = machine.Pin("LED", machine.Pin.OUT)
 _led_timer = None
 
 # Shared state between HTTP handler and prayer scheduler
-state = {
-    "prayer_times": {},
-    "next_prayer": None,
-    "next_prayer_time": None,
-    "cast_host": None,
-    "cast_port": None,
-    "last_cast_ok": None,
-    "last_cast_label": None,
-    "lat": None,
-    "lon": None,
-    "address": None,
-    "lat_adj": 1,
-    "midnight": 0,
-    "school": 0,
-    "cast_devices": [],
-    "local_ip": None,
-    "boot_epoch": 0,
-    "device_name": None,
-    "hostname": "bilalcast",
-}
+state = State()
 
 
 def led_blink():
@@ -120,169 +105,144 @@ def load_config():
     return None
 
 
-_NTP_HOSTS = [
-    "pool.ntp.org",
-    "time.google.com",
-    "time.cloudflare.com",
-    "time.apple.com",
-]
-
-
-def connect_to_wifi_with_retries(
-    ssid, password, *, hostname=None, max_retries=10, timeout_seconds=30, retry_delay_s=2
-):
-    statuses = {
-        network.STAT_IDLE: "idle",
-        network.STAT_CONNECTING: "connecting",
-        network.STAT_WRONG_PASSWORD: "wrong password",
-        network.STAT_NO_AP_FOUND: "access point not found",
-        network.STAT_CONNECT_FAIL: "connection failed",
-        network.STAT_GOT_IP: "got ip address",
-    }
-
-    wlan = network.WLAN(network.STA_IF)
-
-    for attempt in range(1, max_retries + 1):
-        try:
-            log("Wi-Fi connect attempt {}/{}...".format(attempt, max_retries))
-
-            wlan.active(False)
-            time.sleep(1)
-            if hostname:
-                try:
-                    network.hostname(hostname)
-                except Exception:
-                    pass
-            wlan.active(True)
-
-            wlan.connect(ssid, password)
-
-            start = time.time()
-            last_status = None
-
-            while not wlan.isconnected():
-                status = wlan.status()
+async def set_rtc(max_attempts=10):
+    for _ in range(max_attempts):
+        if await sntp.sync():
+            return
+        await asyncio.sleep(2)
 
-                if status != last_status:
-                    log("  status: " + statuses.get(status, str(status)))
-                    last_status = status
+    log("NTP failed after {} attempts; resetting.".format(max_attempts))
+    time.sleep(1)
+    persist.reboot()
 
-                if time.time() - start >= timeout_seconds:
-                    log("  timed out after {}s".format(timeout_seconds))
-                    break
 
-                time.sleep(1)
+def _reset_allowed():
+    """Hold off Wi-Fi give-up resets while an athan is due soon."""
+    t = state.next_prayer_time
+    return t is None or seconds_until(t) > (PRE_ATHAN_MINS + 5) * 60
 
-            if wlan.isconnected() and wlan.status() == network.STAT_GOT_IP:
-                ip = wlan.ifconfig()[0]
-                log("connected to wifi: " + ip)
-                time.sleep(2)
-                return ip
 
-        except Exception as e:
-            log("Wi-Fi error on attempt {}/{}: {}".format(attempt, max_retries, e))
+def _secs_to_next_cast():
+    t = state.next_prayer_time
+    if t is None:
+        return None
+    if PRE_ATHAN_MINS > 0:
+        t = pre_athan_time(t, PRE_ATHAN_MINS)
+    return seconds_until(t)
 
-        time.sleep(retry_delay_s)
 
-    log("Wi-Fi failed after {} attempts; resetting.".format(max_retries))
-    time.sleep(1)
-    machine.reset()
+def _time_passed(t):
+    """Return True if ``t`` (minutes since midnight) has already passed today (local time)."""
+    now = tz.localtime()
+    return t <= now[3] * 60 + now[4]
 
 
-def set_rtc(max_attempts=20):
-    for host_idx in range(max_attempts):
-        ntptime.host = _NTP_HOSTS[host_idx % len(_NTP_HOSTS)]
-        try:
-            ntptime.settime()
-        except Exception as e:
-            log(
-                "NTP sync failed ({}), trying next host: {}".format(
-                    ntptime.host, str(e)
-                )
-            )
-            time.sleep(2)
-            continue
+async def _get_prayer_times(lat, lon, method, tz):
+    """Fetch prayer times with address fallback chain.
 
-        year = time.localtime()[0]
-        if year >= 2024:
-            log("RTC set via {} (UTC): {}".format(ntptime.host, str(time.localtime())))
-            return
+    0. offline calendar covers today for these settings → no network at all
+    1. lat/lon available → lat/lon endpoint
+    2. address config, no lat/lon → address endpoint
+    3. fallback path: never reached if caller ensures lat/lon or address is set
 
-        log("RTC year implausible ({}), trying next host...".format(year))
-        time.sleep(2)
+    Both retry until the next cast is due, then use the last known times.
+    """
+    day = _calendar_times(lat, lon)
+    if day:
+        return day
+    deadline = _fetch_deadline()
+    if lat is not None and lon is not None:
+        times = await get_all_prayers(lat, lon, method, tz, LAT_ADJ_METHOD, MIDNIGHT_MODE, SCHOOL, deadline)
+    elif _cfg_address:
+        times = await get_all_prayers_by_address(_cfg_address, method, tz, LAT_ADJ_METHOD, MIDNIGHT_MODE, SCHOOL, deadline)
+    else:
+        return None
+    state.set("times_source", prayer.last_source)
+    return times
 
-    log("NTP failed after {} attempts; resetting.".format(max_attempts))
-    time.sleep(1)
-    machine.reset()
 
+def _calendar_key(lat, lon):
+    return offline.params_key(lat, lon, _cfg_address, CALC_METHOD, _tz_string, LAT_ADJ_METHOD, MIDNIGHT_MODE, SCHOOL)
 
-def adjust_rtc(utc_offset_secs):
-    t = time.localtime(time.time() + utc_offset_secs)
-    machine.RTC().datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
-    log("RTC adjusted to local time (UTC offset {}s)".format(utc_offset_secs))
 
+def _calendar_times(lat, lon):
+    day = offline.today(_calendar_key(lat, lon))
+    if day:
+        state.set("times_source", "calendar")
+    return day
 
-def ensure_wifi():
-    wlan = network.WLAN(network.STA_IF)
-    if not wlan.isconnected():
-        warn("WiFi dropped, reconnecting...")
-        connect_to_wifi_with_retries(SSID, PASSWORD)
 
+async def _refresh_calendar():
+    """Background task: keep the offline calendar covering the months ahead."""
+    lat, lon = _prayer_coords()
+    if lat is None and not _cfg_address:
+        return
+    try:
+        await offline.refresh(
+            _calendar_key(lat, lon), lat, lon, _cfg_address, CALC_METHOD, _tz_string, LAT_ADJ_METHOD, MIDNIGHT_MODE, SCHOOL
+        )
+    except Exception as e:
+        warn("offline calendar refresh failed: " + str(e))
 
-def _time_passed(hhmm):
-    """Return True if HH:MM has already passed today (local time)."""
-    now = time.localtime()
-    h, m = hhmm.split(":")
-    return int(h) * 60 + int(m) <= now[3] * 60 + now[4]
 
+async def _cache_audio():
+    """Background task: keep today's and tomorrow's remote athan audio cached on the device."""
+    await audiocache.prefetch(audio.remote_only(playlist.upcoming(tz.day_number())))
 
-def _get_prayer_times(lat, lon, method, tz):
-    """Fetch prayer times with address fallback chain.
 
-    1. lat/lon available → lat/lon endpoint (retry forever)
-    2. address config, no lat/lon → address endpoint (retry forever)
-    3. fallback path: never reached if caller ensures lat/lon or address is set
-    """
-    if lat is not None and lon is not None:
-        return get_all_prayers(lat, lon, method, tz, LAT_ADJ_METHOD, MIDNIGHT_MODE, SCHOOL)
-    if _cfg_address:
-        return get_all_prayers_by_address(_cfg_address, method, tz, LAT_ADJ_METHOD, MIDNIGHT_MODE, SCHOOL)
-    return {}
+def _fetch_deadline():
+    """A fetch deadline one minute before the next cast the known times imply, or None."""
+    times = state.prayer_times
+    if not timetable.has_times(times):
+        times = last_known_times()
+    if not times:
+        return None
+    secs = None
+    for t in times:
+        if t == timetable.NONE:
+            continue
+        if PRE_ATHAN_MINS > 0:
+            t = pre_athan_time(t, PRE_ATHAN_MINS)
+        s = seconds_until(t)
+        if secs is None or s < secs:
+            secs = s
+    if secs is None:
+        return None
+    return fetch.deadline_in((secs - 60) * 1000)
 
 
 async def _discovery_loop():
     """Background task: retry cast device discovery every 30s until found."""
     while True:
         await asyncio.sleep(30)
-        if state["cast_host"] is not None:
+        if state.cast_host is not None:
             return
         log("Re-attempting cast device discovery...")
-        host, port = await resolve_cast_device(state["local_ip"], CAST_DEVICE_NAME)
+        host, port = await resolve_cast_device(state.local_ip, CAST_DEVICE_NAME)
         if host:
-            state["cast_host"] = host
-            state["cast_port"] = port
+            state.update(cast_host=host, cast_port=port)
             log("Cast device found: {}:{}".format(host, port))
             return
 
 
-def _save_cast_state(ok, label):
-    state["last_cast_ok"] = ok
-    state["last_cast_label"] = label
-    try:
-        with open(CAST_STATE_FILE, "w") as f:
-            json.dump({"ok": ok, "label": label}, f)
-    except Exception as e:
-        error("cast state save failed: " + str(e))
+def _save_cast_state(ok, label, end=None):
+    state.update(last_cast_ok=ok, last_cast_label=label, last_cast_end=end)
+
+
+def _persist_cast_state(key, value):
+    # Subscribed to the last_cast_* fields; the journal coalesces the three
+    # puts of one update into a single write
+    persist.put("cast_state", {"ok": state.last_cast_ok, "label": state.last_cast_label, "end": state.last_cast_end})
 
 
 async def do_cast(url, label, volume=0.5):
-    ensure_wifi()
-    if state["cast_host"] is None:
+    """Cast ``url``, or a playlist (list of URLs) as one queue."""
+    await wifi.ensure()
+    if state.cast_host is None:
         log("Cast host unknown, attempting re-discovery...")
-        host, port = await resolve_cast_device(state["local_ip"], CAST_DEVICE_NAME)
+        host, port = await resolve_cast_device(state.local_ip, CAST_DEVICE_NAME)
         if host:
-            state["cast_host"] = host
-            state["cast_port"] = port
+            state.update(cast_host=host, cast_port=port)
         else:
             warn("cast device not found: {}".format(CAST_DEVICE_NAME))
             send_ntfy(
@@ -292,10 +252,21 @@ async def do_cast(url, label, volume=0.5):
             )
             _save_cast_state(False, label)
             return
-    ok, cast_error = cast_url(url, state["cast_host"], state["cast_port"], volume=volume)
+    # Stored audio is fetched by the Chromecast from us over the LAN
+    if isinstance(url, str):
+        url = audio.local_url(url, state.local_ip)
+    else:
+        url = [audio.local_url(u, state.local_ip) for u in url]
+    ok, cast_error = await receiver.start(url, state.cast_host, state.cast_port, volume)
     _save_cast_state(ok, label)
     if ok:
         send_ntfy(label, priority=3, tags=["bell"])
+        # Returns once playback is over and the receiver is put back as it was
+        end = await receiver.watch()
+        if end != "superseded":
+            _save_cast_state(True, label, end)
+        if end not in ("finished", "superseded"):
+            print("cast {} ended: {}".format(label, end))
     else:
         error("cast failed: {} — {}".format(label, cast_error))
         send_ntfy(
@@ -303,20 +274,25 @@ async def do_cast(url, label, volume=0.5):
             priority=5,
             tags=["warning"],
         )
+    # Audio that missed the cache is fetched now, not during the cast
+    asyncio.create_task(audiocache.fetch_missed())
 
 
 async def run_schedule():
     while True:
-        times = state["prayer_times"]
-        for prayer in ATHANS_ORDER:
-            t = times.get(prayer)
-            if not t or _time_passed(t):
+        times = state.prayer_times or timetable.empty()
+        for i, prayer in enumerate(ATHANS_ORDER):
+            t = times[i]
+            if t == timetable.NONE or _time_passed(t):
                 continue
 
-            state["next_prayer"] = prayer
-            state["next_prayer_time"] = t
+            state.update(next_prayer=prayer, next_prayer_time=t)
 
             vol = PRAYER_VOLUMES.get(prayer, 0.5)
+            # Resolved now, hours ahead, so the cast itself only connects and loads
+            day = tz.day_number()
+            queue = playlist.resolve(prayer, day)
+            pre_queue = playlist.resolve(playlist.PRE, day)
 
             if PRE_ATHAN_MINS > 0:
                 pre_t = pre_athan_time(t, PRE_ATHAN_MINS)
@@ -325,123 +301,123 @@ async def run_schedule():
                     if secs_to_pre > 0:
                         await asyncio.sleep(secs_to_pre)
                     asyncio.create_task(
-                        do_cast(PRE_ATHAN, "pre_{}, {}".format(prayer, pre_t), vol)
+                        do_cast(pre_queue, "pre_{}, {}".format(prayer, timetable.hhmm(pre_t)), vol)
                     )
 
             secs_to_prayer = seconds_until(t)
             if secs_to_prayer > 0:
                 await asyncio.sleep(secs_to_prayer)
 
-            await do_cast(ATHANS[prayer], "{}, {}".format(prayer, t), vol)
-            await asyncio.sleep(200)
-
-        # All today's prayers done — wait for local midnight, re-sync, re-fetch
-        state["next_prayer"] = None
-        state["next_prayer_time"] = None
-        await asyncio.sleep(max(60, seconds_until("00:01")))
-        set_rtc()
-        global _tz_string
-        geo_lat, geo_lon, offset, tz_string = get_location()
-        _tz_string = tz_string
-        if offset:
-            adjust_rtc(offset)
-        lat = float(_cfg_lat) if _cfg_lat else (None if _cfg_address else geo_lat)
-        lon = float(_cfg_lon) if _cfg_lon else (None if _cfg_address else geo_lon)
-        state["lat"] = lat
-        state["lon"] = lon
-        state["prayer_times"] = _get_prayer_times(lat, lon, CALC_METHOD, _tz_string)
+            await do_cast(queue, "{}, {}".format(prayer, timetable.hhmm(t)), vol)
+
+        # All today's prayers done — wait for local midnight and re-fetch.
+        # The tz rules already track DST; the location is only re-queried
+        # if the network changed or the cached entry expired.
+        state.update(next_prayer=None, next_prayer_time=None)
+        await asyncio.sleep(max(60, seconds_until(1)))
+        await _revalidate_location()
+        await _refresh_prayers()
         log("Prayer times refreshed for new day")
+        asyncio.create_task(_refresh_calendar())
+        asyncio.create_task(_cache_audio())
 
 
-async def main():
-    global SSID, PASSWORD, CAST_DEVICE_NAME, PRE_ATHAN_MINS, CALC_METHOD, LAT_ADJ_METHOD, MIDNIGHT_MODE, SCHOOL, PRAYER_VOLUMES, _cfg_lat, _cfg_lon, _cfg_address, _tz_string
+async def _geocode_config_address():
+    """Resolve the configured address to coordinates (cached on flash). True on success."""
+    global _cfg_lat, _cfg_lon
+    from bilalcast.geocode import geocode_address
 
-    logger.configure(True, None)  # always print before WiFi is up
-    led_blink()
-    log("athan starting")
+    gc_lat, gc_lon = await geocode_address(_cfg_address)
+    if gc_lat is None:
+        return False
+    _cfg_lat = str(gc_lat)
+    _cfg_lon = str(gc_lon)
+    return True
 
-    if check_factory_reset():
-        log("Factory reset confirmed, clearing config...")
-        for f in (CONFIG_FILE, "cast_device.json", CAST_STATE_FILE):
-            try:
-                os.remove(f)
-            except Exception:
-                pass
-        from bilalcast.captive_portal import captive_portal as _portal
 
-        await _portal()
-        return  # never reached — portal resets the device after save
+def _prayer_coords():
+    lat = float(_cfg_lat) if _cfg_lat else (None if _cfg_address else state.lat)
+    lon = float(_cfg_lon) if _cfg_lon else (None if _cfg_address else state.lon)
+    return lat, lon
 
-    config = load_config()
-    if not config:
-        log("No config found, starting captive portal...")
-        from bilalcast.captive_portal import captive_portal as _portal
 
-        await _portal()
-        return  # never reached — portal resets the device after save
+async def _refresh_prayers():
+    # An address that failed to geocode at boot gets another try each day
+    if _cfg_address and not _cfg_lat:
+        await _geocode_config_address()
+    lat, lon = _prayer_coords()
+    try:
+        times = await _get_prayer_times(lat, lon, CALC_METHOD, _tz_string)
+    except OSError as e:
+        warn("prayer times refresh failed, keeping previous: " + str(e))
+        return
+    state.update(lat=lat, lon=lon, prayer_times=times)
 
-    SSID = config["ssid"]
-    PASSWORD = config["password"]
-    CAST_DEVICE_NAME = config["cast_device_name"]
-    PRE_ATHAN_MINS = int(config.get("pre_athan_mins", 10))
-    CALC_METHOD = int(config.get("method", 2))
-    LAT_ADJ_METHOD = int(config.get("lat_adj", 1))
-    MIDNIGHT_MODE = int(config.get("midnight", 0))
-    SCHOOL = int(config.get("school", 0))
-    _cfg_lat = config.get("lat")
-    _cfg_lon = config.get("lon")
-    _cfg_address = config.get("address")
-    for _p in ["Fajr", "Dhuhr", "Asr", "Maghrib", "Isha"]:
-        _k = "vol_" + _p.lower()
-        PRAYER_VOLUMES[_p] = int(config.get(_k, "50")) / 100.0
 
-    local_ip = connect_to_wifi_with_retries(SSID, PASSWORD, hostname=DEVICE_HOSTNAME)
-    logger.configure(DEBUG, CAST_DEVICE_NAME)
+def _network_fingerprint():
+    """Identify the network without a round trip: SSID, gateway and AP BSSID."""
+    hint = persist.get(wifi.HINT_KEY) or {}
+    return "{}|{}|{}".format(SSID, wifi.gateway(), hint.get("bssid", ""))
 
-    # Populate state and start HTTP server immediately after WiFi so the
-    # status page is reachable as soon as possible. Remaining boot steps
-    # (OTA, NTP, location, prayer times) fill in the state afterwards.
-    state["local_ip"] = local_ip
-    state["device_name"] = CAST_DEVICE_NAME
-    state["hostname"] = DEVICE_HOSTNAME
-    state["boot_epoch"] = time.time()
-    try:
-        with open(CAST_STATE_FILE) as f:
-            cs = json.load(f)
-        state["last_cast_ok"] = cs.get("ok")
-        state["last_cast_label"] = cs.get("label")
-    except Exception:
-        pass
 
-    start_status_server(state, PRE_ATHAN_MINS, CALC_METHOD, PRAYER_VOLUMES, CONFIG_FILE, ACTIVATION_URL, do_cast, local_ip)
-    start_mdns_responder(local_ip, local_ip)
+async def _revalidate_location():
+    """Re-query IP geolocation if the network changed. Returns True if the location moved."""
+    global _tz_string
+    loc = await revalidate_location(_network_fingerprint())
+    if loc is None:
+        return False
+    geo_lat, geo_lon, utc_offset, _tz_string = loc
+    tz.set_zone(_tz_string, utc_offset)
+    if not (_cfg_lat or _cfg_address):
+        state.update(lat=geo_lat, lon=geo_lon)
+    return True
+
+
+async def _check_location():
+    """Background task after boot, which used the cached location."""
+    if await _revalidate_location():
+        await _refresh_prayers()
+        log("location changed, prayer times refreshed")
 
+
+async def _stage_ota(r):
     try:
-        from bilalcast.ota import check_and_update
-        if check_and_update():
+        from bilalcast import ota
+
+        remote_v = (await ahttp.get_text(ota.VERSION_URL)).strip()
+        # Downloads stay blocking, but only run when there is something new
+        if remote_v != ota.current_version() and ota.check_and_update(remote_v):
             log("OTA update applied, rebooting...")
             time.sleep(1)
-            machine.reset()
+            persist.reboot()
     except Exception as e:
         warn("OTA check failed: " + str(e))
 
-    geo_lat, geo_lon, utc_offset, tz_string = get_location()
-    _tz_string = tz_string
-    set_rtc()
-    if utc_offset:
-        adjust_rtc(utc_offset)
 
-    cast_host, cast_port = await resolve_cast_device(local_ip, CAST_DEVICE_NAME)
+async def _stage_ntp(r):
+    await set_rtc()
+
+
+async def _stage_location(r):
+    return await get_location(_network_fingerprint())
+
+
+async def _stage_cast(r):
+    cast_host, cast_port = await resolve_cast_device(state.local_ip, CAST_DEVICE_NAME)
     if cast_host:
         log("cast device found: {}:{}".format(cast_host, cast_port))
     else:
         warn("cast device not found at boot, background retry active")
         asyncio.create_task(_discovery_loop())
+    state.update(cast_host=cast_host, cast_port=cast_port)
 
-    state["cast_host"] = cast_host
-    state["cast_port"] = cast_port
 
-    t = time.localtime()
+async def _stage_clock(r):
+    global _tz_string
+    _, _, utc_offset, _tz_string = r["location"]
+    if not tz.set_zone(_tz_string, utc_offset):
+        warn("no DST rules for timezone {!r}, using a fixed UTC offset".format(_tz_string))
+    t = tz.localtime()
     send_ntfy(
         "online: {:04d}-{:02d}-{:02d} {:02d}:{:02d}".format(
             t[0], t[1], t[2], t[3], t[4]
@@ -450,19 +426,18 @@ async def main():
         tags=["white_check_mark"],
     )
 
-    # Resolve lat/lon: explicit config > Nominatim geocoding > IP geolocation
+
+async def _stage_coords(r):
+    """Resolve lat/lon: explicit config > Nominatim geocoding > IP geolocation."""
+    geo_lat, geo_lon, _, _ = r["location"]
     if _cfg_lat and _cfg_lon:
         lat = float(_cfg_lat)
         lon = float(_cfg_lon)
         log("using configured location: {}, {}".format(lat, lon))
-    elif _cfg_address and not (_cfg_lat and _cfg_lon):
+    elif _cfg_address:
         # Try to geocode the address for precise coordinates
-        gc_lat, gc_lon = geocode_address(_cfg_address)
-        if gc_lat is not None:
-            lat = gc_lat
-            lon = gc_lon
-            _cfg_lat = str(gc_lat)
-            _cfg_lon = str(gc_lon)
+        if await _geocode_config_address():
+            lat, lon = _prayer_coords()
             log("geocoded to: {}, {}".format(lat, lon))
         else:
             # Nominatim failed — will use address endpoint for prayer times
@@ -473,29 +448,136 @@ async def main():
         lat = geo_lat
         lon = geo_lon
 
-    state["lat"] = lat
-    state["lon"] = lon
-    state["address"] = _cfg_address or ""
-    state["lat_adj"] = LAT_ADJ_METHOD
-    state["midnight"] = MIDNIGHT_MODE
-    state["school"] = SCHOOL
+    state.update(
+        lat=lat,
+        lon=lon,
+        address=_cfg_address or "",
+        lat_adj=LAT_ADJ_METHOD,
+        midnight=MIDNIGHT_MODE,
+        school=SCHOOL,
+    )
+    return lat, lon
+
 
-    # Fetch prayer times: try address endpoint first if no lat/lon, then geo fallback
-    if lat is None and lon is None and _cfg_address:
-        times = try_prayers_by_address(_cfg_address, CALC_METHOD, _tz_string, LAT_ADJ_METHOD, MIDNIGHT_MODE, SCHOOL)
+async def _stage_prayers(r):
+    """Fetch prayer times: address endpoint first if no lat/lon, then geo fallback."""
+    lat, lon = r["coords"]
+    day = _calendar_times(lat, lon)
+    if day:
+        state.set("prayer_times", day)
+    elif lat is None and lon is None and _cfg_address:
+        times = await try_prayers_by_address(_cfg_address, CALC_METHOD, _tz_string, LAT_ADJ_METHOD, MIDNIGHT_MODE, SCHOOL)
         if times is None:
             log("address prayer times failed, falling back to IP geolocation")
-            lat = geo_lat
-            lon = geo_lon
-            state["lat"] = lat
-            state["lon"] = lon
-            state["prayer_times"] = get_all_prayers(lat, lon, CALC_METHOD, _tz_string)
+            geo_lat, geo_lon, _, _ = r["location"]
+            state.update(
+                lat=geo_lat,
+                lon=geo_lon,
+                prayer_times=await get_all_prayers(geo_lat, geo_lon, CALC_METHOD, _tz_string, deadline=_fetch_deadline()),
+                times_source=prayer.last_source,
+            )
         else:
-            state["prayer_times"] = times
+            state.update(prayer_times=times, times_source="live")
     else:
-        state["prayer_times"] = _get_prayer_times(lat, lon, CALC_METHOD, _tz_string)
+        state.set("prayer_times", await _get_prayer_times(lat, lon, CALC_METHOD, _tz_string))
+
+
+async def main():
+    global SSID, PASSWORD, CAST_DEVICE_NAME, PRE_ATHAN_MINS, CALC_METHOD, LAT_ADJ_METHOD, MIDNIGHT_MODE, SCHOOL, PRAYER_VOLUMES, _cfg_lat, _cfg_lon, _cfg_address, _tz_string
+
+    logger.configure(True, None)  # always print before WiFi is up
+    led_blink()
+    log("athan starting")
+
+    # The app imported and the loop runs, so this slot boots; confirm it now,
+    # before Wi-Fi, whose give-up resets must not count as failed boots
+    from bilalcast import ota
+
+    ota.mark_ready()
 
+    if check_factory_reset():
+        log("Factory reset confirmed, clearing config...")
+        try:
+            os.remove(CONFIG_FILE)
+        except Exception:
+            pass
+        persist.wipe()
+        from bilalcast.captive_portal import captive_portal as _portal
+
+        await _portal()
+        return  # never reached — portal resets the device after save
+
+    config = load_config()
+    if not config:
+        log("No config found, starting captive portal...")
+        from bilalcast.captive_portal import captive_portal as _portal
+
+        await _portal()
+        return  # never reached — portal resets the device after save
+
+    SSID = config["ssid"]
+    PASSWORD = config["password"]
+    CAST_DEVICE_NAME = config["cast_device_name"]
+    PRE_ATHAN_MINS = int(config.get("pre_athan_mins", 10))
+    CALC_METHOD = int(config.get("method", 2))
+    LAT_ADJ_METHOD = int(config.get("lat_adj", 1))
+    MIDNIGHT_MODE = int(config.get("midnight", 0))
+    SCHOOL = int(config.get("school", 0))
+    _cfg_lat = config.get("lat")
+    _cfg_lon = config.get("lon")
+    _cfg_address = config.get("address")
+    for _p in ["Fajr", "Dhuhr", "Asr", "Maghrib", "Isha"]:
+        _k = "vol_" + _p.lower()
+        PRAYER_VOLUMES[_p] = int(config.get(_k, "50")) / 100.0
+    playlist.configure(config.get("playlists"), int(config.get("hijri_adjust", 0)))
+    receiver.resume_media = bool(config.get("resume_media", False))
+    receiver.ramp_s = int(config.get("volume_ramp_s", 0))
+
+    wifi.configure(SSID, PASSWORD, hostname=DEVICE_HOSTNAME, can_reset=_reset_allowed)
+    local_ip = await wifi.ensure()
+    logger.configure(DEBUG, CAST_DEVICE_NAME)
+
+    # Populate state and start HTTP server immediately after WiFi so the
+    # status page is reachable as soon as possible. Remaining boot steps
+    # (OTA, NTP, location, prayer times) fill in the state afterwards.
+    state.update(
+        local_ip=local_ip,
+        device_name=CAST_DEVICE_NAME,
+        hostname=DEVICE_HOSTNAME,
+        boot_epoch=time.time(),
+    )
+    cs = persist.get("cast_state")
+    if cs:
+        state.update(last_cast_ok=cs.get("ok"), last_cast_label=cs.get("label"), last_cast_end=cs.get("end"))
+    state.subscribe(("last_cast_ok", "last_cast_label", "last_cast_end"), _persist_cast_state)
+    asyncio.create_task(persist.flush_loop())
+    asyncio.create_task(wifi.watch())
+    asyncio.create_task(metrics.watch())
+
+    start_status_server(state, PRE_ATHAN_MINS, CALC_METHOD, PRAYER_VOLUMES, CONFIG_FILE, ACTIVATION_URL, do_cast, local_ip)
+    start_mdns_responder(local_ip, local_ip)
+    log("status page up {} ms after power-on".format(boottime.mark("status page up")))
+
+    # Only the prayer fetch needs both the clock and a location; everything
+    # else overlaps, so boot takes about as long as the slowest chain.
+    await boot.run([
+        ("ota", (), _stage_ota),
+        ("ntp", (), _stage_ntp),
+        ("location", (), _stage_location),
+        ("cast", (), _stage_cast),
+        ("clock", ("ntp", "location"), _stage_clock),
+        ("coords", ("location",), _stage_coords),
+        ("prayers", ("clock", "coords"), _stage_prayers),
+    ])
+
+    asyncio.create_task(sntp.resync_loop())
+    asyncio.create_task(_check_location())
+    asyncio.create_task(_refresh_calendar())
+    asyncio.create_task(_cache_audio())
+    asyncio.create_task(health.monitor(state, CAST_DEVICE_NAME, _secs_to_next_cast))
     led_solid()
+    boottime.mark("ready")
+    boottime.uninstall()
     log("ready — visit http://bilalcast.local")
 
     await run_schedule()
@@ -508,4 +590,4 @@ except KeyboardInterrupt:
 except Exception as e:
     log("fatal error: " + str(e))
     time.sleep(1)
-    machine.reset()
+    persist.reboot()
@@ -6,6 +6,7 @@ from select import select
 
 import uasyncio
 
+from bilalcast import metrics
 from bilalcast.mdns_client.constants import CLASS_IN, LOCAL_MDNS_SUFFIX, MAX_PACKET_SIZE, MDNS_ADDR, MDNS_PORT, TYPE_A
 from bilalcast.mdns_client.parser import parse_packet
 from bilalcast.mdns_client.structs import DNSQuestion, DNSQuestionWrapper, DNSResponse
@@ -114,15 +115,18 @@ class Client:
                     "Issue processing network data due to insufficient memory. "
                     "Rebooting the socket to free up cache buffer."
                 )
+                metrics.inc(metrics.MDNS_DROPPED)
                 self._init_socket()
                 continue
 
+            metrics.inc(metrics.MDNS_PACKETS)
             if addr[0] == self.local_addr:
                 continue
 
             try:
                 await self.process_packet(buffer)
             except Exception as e:
+                metrics.inc(metrics.MDNS_DROPPED)
                 self.dprint("Issue processing packet: {}".format(e))
             finally:
                 gc.collect()
@@ -195,7 +195,7 @@ class ServiceDiscovery:
         self.dprint(
             "Removing service protocol from monitoring: {}".format(service_protocol)
         )
-        for monitored_service in self.monitored_services[service_protocol]:
+        for monitored_service in tuple(self.monitored_services[service_protocol]):
             self._remove_item(monitored_service)
 
     def _remove_item(self, service: ServiceResponse) -> None:
@@ -266,7 +266,7 @@ class ServiceDiscovery:
         self._enqueued_service_records.add(srv_name.lower())
 
     def _on_srv_record(self, record: DNSRecord) -> None:
-        if record.name in self._enqueued_service_records:
+        if record.name.lower() in self._enqueued_service_records:
             self._enqueued_service_records.remove(record.name.lower())
 
         srv_name_items = record.name.split(".")
@@ -308,9 +308,9 @@ class ServiceDiscovery:
 
         self._records_by_target.setdefault(response.name.lower(), set()).add(response)
         self._records_by_target.setdefault(response.target.lower(), set()).add(response)
-        self._enqueued_target_records.add(srv_record.target)
+        self._enqueued_target_records.add(srv_record.target.lower())
 
-        for item in self._a_records_by_target_buffer:
+        for item in tuple(self._a_records_by_target_buffer):
             if item.record.name.lower() in self._records_by_target:
                 self._on_a_record(item.record)
                 self._a_records_by_target_buffer.remove(item)
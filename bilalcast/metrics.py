@@ -0,0 +1,132 @@
+"""
+Counters, gauges and histograms, served as Prometheus text at /metrics.
+
+Every metric is declared below and lives in an array allocated at import,
+so inc(), gauge() and observe() allocate nothing: call them from anywhere,
+including a hot loop. Values are integers (ms, bytes, counts); they stay
+allocation-free while below 2**30, MicroPython's small-int limit.
+Histogram buckets are counted individually and made cumulative on export.
+
+watch() samples the heap and the event loop's lag once a second. A fall in
+gc.mem_alloc() between samples counts as a collection, which catches the
+automatic ones the Pico gives no hook for, though not two in one second.
+"""
+import asyncio
+import gc
+from array import array
+
+import utime as time  # pyright: ignore[reportMissingImports]
+
+SAMPLE_MS = 1000
+
+# Counter and gauge ids, in the order of _SCALARS
+(
+    CASTS,
+    CAST_FAILURES,
+    MDNS_PACKETS,
+    MDNS_DROPPED,
+    HTTP_REQUESTS,
+    FETCH_RETRIES,
+    GC_RUNS,
+    HEAP_FREE,
+    HEAP_ALLOC,
+    HEAP_MIN_FREE,
+) = range(10)
+
+# (name, type, help)
+_SCALARS = (
+    ("bilalcast_casts_total", "counter", "Casts started"),
+    ("bilalcast_cast_failures_total", "counter", "Casts that never reached PLAYING"),
+    ("bilalcast_mdns_packets_total", "counter", "mDNS packets received"),
+    ("bilalcast_mdns_dropped_total", "counter", "mDNS packets dropped: unparseable or out of memory"),
+    ("bilalcast_http_requests_total", "counter", "Requests served by the status server"),
+    ("bilalcast_fetch_retries_total", "counter", "Network fetch attempts after the first"),
+    ("bilalcast_gc_runs_total", "counter", "Garbage collections seen between heap samples"),
+    ("bilalcast_heap_free_bytes", "gauge", "gc.mem_free() at the last sample"),
+    ("bilalcast_heap_alloc_bytes", "gauge", "gc.mem_alloc() at the last sample"),
+    ("bilalcast_heap_min_free_bytes", "gauge", "Lowest gc.mem_free() sampled since boot"),
+)
+
+# Histogram ids, in the order of _HISTOGRAMS
+CAST_MS, HTTP_MS, LOOP_LAG_MS = range(3)
+
+# (name, help, bucket upper bounds in ms)
+_HISTOGRAMS = (
+    ("bilalcast_cast_ms", "Cast start to PLAYING, including retries", (500, 1000, 2000, 5000, 10000, 30000)),
+    ("bilalcast_http_ms", "Status server request handling and rendering", (5, 10, 25, 50, 100, 250, 1000)),
+    ("bilalcast_loop_lag_ms", "Event loop lag past a SAMPLE_MS sleep", (1, 5, 10, 50, 100, 500, 1000)),
+)
+
+_values = array("L", [0] * len(_SCALARS))
+_values[HEAP_MIN_FREE] = 0xFFFFFFFF
+# Histogram h's bounds start at _first[h] in _bounds; its counts, one more
+# for +Inf, at _first[h] + h in _counts
+_first = array("H")
+_bounds = array("L")
+for _h in _HISTOGRAMS:
+    _first.append(len(_bounds))
+    _bounds.extend(_h[2])
+del _h
+_counts = array("L", [0] * (len(_bounds) + len(_HISTOGRAMS)))
+_sums = array("L", [0] * len(_HISTOGRAMS))
+
+
+def inc(counter, n=1):
+    _values[counter] += n
+
+
+def gauge(metric, v):
+    _values[metric] = v
+
+
+def observe(histogram, v):
+    """Record ``v`` (ms) in ``histogram``."""
+    b = _first[histogram]
+    end = b + len(_HISTOGRAMS[histogram][2])
+    i = b
+    while i < end and v > _bounds[i]:
+        i += 1
+    _counts[i + histogram] += 1
+    _sums[histogram] += v
+
+
+def since(histogram, t0):
+    """observe() the ms from ticks_ms value ``t0`` until now."""
+    observe(histogram, time.ticks_diff(time.ticks_ms(), t0))
+
+
+def sample():
+    """Update the heap gauges; called by watch() and before each export."""
+    free = gc.mem_free()
+    alloc = gc.mem_alloc()
+    if alloc < _values[HEAP_ALLOC]:
+        _values[GC_RUNS] += 1
+    _values[HEAP_FREE] = free
+    _values[HEAP_ALLOC] = alloc
+    if free < _values[HEAP_MIN_FREE]:
+        _values[HEAP_MIN_FREE] = free
+
+
+async def watch():
+    """Background task: sample the heap and the loop's lag every SAMPLE_MS."""
+    while True:
+        t0 = time.ticks_ms()
+        await asyncio.sleep_ms(SAMPLE_MS)
+        observe(LOOP_LAG_MS, max(0, time.ticks_diff(time.ticks_ms(), t0) - SAMPLE_MS))
+        sample()
+
+
+def export():
+    """Prometheus text exposition, as a generator of lines for phew."""
+    sample()
+    for i, (name, kind, help) in enumerate(_SCALARS):
+        yield "# HELP {} {}\n# TYPE {} {}\n{} {}\n".format(name, help, name, kind, name, _values[i])
+    for h, (name, help, bounds) in enumerate(_HISTOGRAMS):
+        yield "# HELP {} {}\n# TYPE {} histogram\n".format(name, help, name)
+        c = _first[h] + h
+        total = 0
+        for i, le in enumerate(bounds):
+            total += _counts[c + i]
+            yield '{}_bucket{{le="{}"}} {}\n'.format(name, le, total)
+        total += _counts[c + len(bounds)]
+        yield '{}_bucket{{le="+Inf"}} {}\n{}_sum {}\n{}_count {}\n'.format(name, total, name, _sums[h], name, total)
@@ -0,0 +1,151 @@
+"""
+Year-ahead prayer calendar on flash, so the schedule survives WAN outages.
+
+Aladhan's monthly calendar is fetched for MONTHS months from the current one
+and packed into a timetable file (see timetable.py). The file is tagged with
+the location and calculation settings it was fetched for; any change makes it
+unusable until the next refresh. While it covers today, daily prayer times
+come from flash and need no network at all.
+"""
+import gc
+import ujson as json  # pyright: ignore[reportMissingImports]
+
+import bilalcast.persist as persist
+from bilalcast import ahttp, fetch, timetable, tz
+from bilalcast.logger import log
+from bilalcast.prayer import _url_encode, settings_query
+
+CALENDAR_FILE = "calendar.bin"
+META_KEY = "calendar"
+MONTHS = 12
+# Refetch once fewer than this many days remain
+REFRESH_BELOW_DAYS = 60
+
+
+def params_key(lat, lon, address, method, timezone, lat_adj, midnight, school):
+    """Identify what a calendar was fetched for."""
+    where = "{:.4f},{:.4f}".format(lat, lon) if lat is not None else address
+    return "|".join([str(x) for x in (where, method, timezone, lat_adj, midnight, school)])
+
+
+def last_day(key=None):
+    """Last day (days since 1970) the calendar covers, or None if absent or fetched for other settings."""
+    meta = persist.get(META_KEY)
+    if not meta or (key is not None and meta.get("key") != key):
+        return None
+    return meta.get("last")
+
+
+def today(key):
+    """Today's packed times from the calendar, or None."""
+    if last_day(key) is None:
+        return None
+    day = timetable.read_day(CALENDAR_FILE, tz.day_number())
+    return day if timetable.has_times(day) else None
+
+
+def _month_url(y, m, lat, lon, address, query):
+    if lat is not None:
+        url = "https://api.aladhan.com/v1/calendar/{}/{}?latitude={:.4f}&longitude={:.4f}".format(y, m, lat, lon)
+    else:
+        url = "https://api.aladhan.com/v1/calendarByAddress/{}/{}?address=".format(y, m) + _url_encode(address)
+    return url + query
+
+
+class _Days(object):
+    """ahttp.download() sink for an Aladhan calendar. Each day's Gregorian
+    date and timings are picked out of the JSON as it streams in, so only
+    the packed days are kept, never the month's whole response."""
+
+    # Longest marker, less one: how much of a chunk's tail may hold a split one
+    _TAIL = 10
+
+    def __init__(self):
+        self.days = {}
+        self._buf = b""
+        self._timings = None
+        self._date = None
+
+    def write(self, chunk):
+        buf = self._buf + chunk
+        i = 0
+        while True:
+            t = buf.find(b'"timings"', i)
+            g = buf.find(b'"gregorian"', i)
+            if t < 0 and g < 0:
+                i = max(i, len(buf) - self._TAIL)
+                break
+            if t >= 0 and (g < 0 or t < g):
+                # A flat object: {"Fajr": "05:12 (+03)", ...}
+                start = buf.find(b"{", t)
+                end = buf.find(b"}", start) if start >= 0 else -1
+                if end < 0:
+                    i = t
+                    break
+                self._timings = timetable.pack(json.loads(buf[start : end + 1]))
+                i = end + 1
+            else:
+                # "gregorian": {"date": "DD-MM-YYYY", ...}
+                k = buf.find(b'"date"', g)
+                c = buf.find(b":", k) if k >= 0 else -1
+                q = buf.find(b'"', c) if c >= 0 else -1
+                end = buf.find(b'"', q + 1) if q >= 0 else -1
+                if end < 0:
+                    i = g
+                    break
+                self._date = buf[q + 1 : end].decode()
+                i = end + 1
+            if self._timings is not None and self._date is not None:
+                dd, mm, yyyy = self._date.split("-")
+                self.days[tz.days(int(yyyy), int(mm), int(dd))] = self._timings
+                self._timings = self._date = None
+        self._buf = buf[i:]
+
+
+async def _fetch_month(url):
+    async def get():
+        sink = _Days()
+        status, _ = await ahttp.download(url, sink)
+        if status != 200:
+            raise OSError("HTTP {} from {}".format(status, url.split("?", 1)[0]))
+        if not sink.days:
+            raise OSError("no days in calendar")
+        return sink.days
+
+    return await fetch.call("aladhan", get, fetch.deadline_in(0))
+
+
+async def refresh(key, lat, lon, address, method, timezone, lat_adj, midnight, school):
+    """Refetch the calendar if it is missing, stale or runs out within REFRESH_BELOW_DAYS.
+
+    Keeps the existing file if the new fetch would cover less. Returns True if rewritten.
+    """
+    end = last_day(key)
+    if end is not None and end - tz.day_number() >= REFRESH_BELOW_DAYS:
+        return False
+    query = settings_query(method, timezone, lat_adj, midnight, school)
+    lt = tz.localtime()
+    y, m = lt[0], lt[1]
+    days = {}
+    for _ in range(MONTHS):
+        try:
+            days.update(await _fetch_month(_month_url(y, m, lat, lon, address, query)))
+        except Exception as e:
+            print("calendar fetch stopped at {}-{:02d}: {}".format(y, m, e))
+            break
+        # Free the month's parse garbage before the next TLS session
+        gc.collect()
+        m += 1
+        if m > 12:
+            m = 1
+            y += 1
+    if not days:
+        return False
+    first = min(days)
+    last = max(days)
+    if end is not None and last <= end:
+        return False
+    timetable.write(CALENDAR_FILE, first, [days.get(n) or timetable.empty() for n in range(first, last + 1)])
+    persist.put(META_KEY, {"key": key, "last": last})
+    log("offline calendar cached through {:04d}-{:02d}-{:02d}".format(*tz.from_days(last)))
+    return True
@@ -7,11 +7,54 @@ OTA_REPO   = "bilal-cast"
 OTA_BRANCH = "main"
 
 _RAW = "https://raw.githubusercontent.com/{}/{}/{}".format(OTA_OWNER, OTA_REPO, OTA_BRANCH)
-_VER_FILE = "ota_version.txt"
-_FILE_VERS = "ota_file_versions.json"
+VERSION_URL = _RAW + "/version.txt"
+_VER_FILE = "ota_version.txt"  # pre-slot installs only
 
+# The app lives in one of two slot directories. SLOT_FILE names the active
+# one; an update is staged into the other and made live by rewriting
+# SLOT_FILE. _bootstrap.py rolls back if a new slot never reaches ready.
+# Firmware flashed before slots has a frozen bootstrap that only boots the
+# root tree, so those devices are updated in place until they are reflashed.
+SLOT_FILE = "ota_slot.json"
+_SLOTS = ("slot_a", "slot_b")
 
-def _local_version():
+
+def _boots_slots():
+    """True if the bootstrap that started this app boots slots: the app was
+    loaded from one, or the bootstrap says so (OTA_SLOTS in _bootstrap.py)."""
+    import sys
+    for slot in _SLOTS:
+        if "/" + slot in sys.path:
+            return True
+    try:
+        import __main__  # pyright: ignore[reportMissingImports]
+        return bool(getattr(__main__, "OTA_SLOTS", False))
+    except ImportError:
+        return False
+
+
+def _read_slot():
+    try:
+        with open(SLOT_FILE) as f:
+            return json.load(f)
+    except Exception:
+        return {"active": ""}
+
+
+def _write_slot(s):
+    from bilalcast import persist
+    persist.write_atomic(SLOT_FILE, json.dumps(s))
+
+
+def _prefix(slot):
+    return slot + "/" if slot else ""
+
+
+def current_version():
+    """Version of the running app, or None if unknown."""
+    s = _read_slot()
+    if s.get("active") and _boots_slots():
+        return s.get("version")
     try:
         with open(_VER_FILE) as f:
             return f.read().strip()
@@ -19,9 +62,19 @@ def _local_version():
         return None
 
 
-def _remote_version():
+def mark_ready():
+    """Confirm the active slot boots; stops _bootstrap.py from rolling it back."""
+    s: dict = _read_slot()  # not only the str values of the fallback
+    if s.get("pending"):
+        s["pending"] = False
+        s["boots"] = 0
+        _write_slot(s)
+        print("OTA: slot", s.get("active"), "confirmed")
+
+
+def _remote_version(base=None):
     try:
-        r = urequests.get(_RAW + "/version.txt")
+        r = urequests.get((base or _RAW) + "/version.txt")
         try:
             return r.text.strip()
         finally:
@@ -42,30 +95,309 @@ def _makedirs(path):
                 pass
 
 
-def _download(url, local_path):
-    _makedirs(local_path)
-    for attempt in range(3):
+_CHUNK = 1024
+_PIPELINE = 4  # requests in flight on the kept-alive connection
+_ROUNDS = 3
+
+
+def _split_url(url):
+    """Return (use_ssl, host, port, path) for an http(s) URL."""
+    use_ssl = url.startswith("https://")
+    rest = url.split("://", 1)[1]
+    if "/" in rest:
+        hostport, path = rest.split("/", 1)
+        path = "/" + path
+    else:
+        hostport, path = rest, ""
+    if ":" in hostport:
+        host, port = hostport.split(":", 1)
+        port = int(port)
+    else:
+        host, port = hostport, 443 if use_ssl else 80
+    return use_ssl, host, port, path
+
+
+class _Conn(object):
+    """One kept-alive HTTP/1.1 connection. GETs may be pipelined: send
+    several with get(), then read the responses back in order."""
+
+    def __init__(self, use_ssl, host, port):
+        import socket
+        self.host = host
+        ai = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+        self._sock = socket.socket(ai[0], socket.SOCK_STREAM)
+        try:
+            self._sock.settimeout(10)
+            self._sock.connect(ai[-1])
+            if use_ssl:
+                import ssl
+                self.s = ssl.wrap_socket(self._sock, server_hostname=host)
+            else:
+                self.s = self._sock.makefile("rwb", 0)
+        except Exception:
+            self._sock.close()
+            raise
+
+    def get(self, path, offset=0):
+        req = "GET {} HTTP/1.1\r\nHost: {}\r\nConnection: keep-alive\r\n".format(path, self.host)
+        if offset:
+            req += "Range: bytes={}-\r\n".format(offset)
+        self.s.write((req + "\r\n").encode())
+
+    def response(self):
+        """Read a status line and headers. Returns (status, content_length)."""
+        line = self.s.readline()
+        if not line:
+            raise OSError("connection closed")
+        status = int(line.split(None, 2)[1])
+        length = None
+        while True:
+            line = self.s.readline()
+            if not line or line == b"\r\n":
+                break
+            name, _, value = line.decode().partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value.strip())
+            elif name == "transfer-encoding" and "chunked" in value:
+                raise OSError("chunked response not supported")
+        if length is None:
+            raise OSError("no content-length")
+        return status, length
+
+    def readinto(self, mv):
+        # Both socket.makefile() and MicroPython's SSL socket have readinto;
+        # the IO stub pyright sees for the former does not
+        return self.s.readinto(mv)  # pyright: ignore[reportAttributeAccessIssue]
+
+    def skip(self, n, mv):
+        while n > 0:
+            got = self.readinto(mv[: min(len(mv), n)])
+            if not got:
+                raise OSError("connection closed")
+            n -= got
+
+    def close(self):
+        try:
+            self.s.close()
+        except Exception:
+            pass
         try:
-            r = urequests.get(url)
+            self._sock.close()
+        except Exception:
+            pass
+
+
+def _hexdigest(h):
+    import ubinascii  # pyright: ignore[reportMissingImports]
+    return ubinascii.hexlify(h.digest()).decode()
+
+
+_inflate_ok = None
+
+
+def _can_inflate():
+    global _inflate_ok
+    if _inflate_ok is None:
+        try:
+            import deflate  # pyright: ignore[reportMissingImports]
+            _inflate_ok = True
+        except ImportError:
             try:
-                with open(local_path, "wb") as f:
-                    f.write(r.content)
-            finally:
-                r.close()
-            print("OTA:", local_path)
-            return True
-        except Exception as e:
-            print("OTA retry", attempt + 1, local_path, e)
-            if attempt < 2:
-                import utime
-                utime.sleep(2)
-    return False
+                import zlib
+                _inflate_ok = hasattr(zlib, "DecompIO")
+            except ImportError:
+                _inflate_ok = False
+    return _inflate_ok
+
+
+def _compressed(entry):
+    """The entry's zlib payload info, if it has one and we can inflate it."""
+    z = entry.get("z")
+    return z if z and _can_inflate() else None
+
+
+def _inflater(f):
+    try:
+        import deflate  # pyright: ignore[reportMissingImports]
+        return deflate.DeflateIO(f, deflate.ZLIB)
+    except ImportError:
+        import zlib
+        return zlib.DecompIO(f, 15)  # pyright: ignore[reportAttributeAccessIssue]
+
 
+def _part_path(entry):
+    """Partial download of ``entry``, named for the file it should become, so
+    one left by another release is never resumed with this one's bytes."""
+    tag = "." + entry["sha256"][:8] if entry.get("sha256") else ""
+    return entry["local"] + tag + (".z.part" if _compressed(entry) else ".part")
 
-def _fetch_manifest():
+
+def _part_size(part):
+    try:
+        return os.stat(part)[6]
+    except OSError:
+        return 0
+
+
+def _inflate(src, dst, want, mv):
+    """Inflate ``src`` into ``dst`` via a temp file, checking the SHA-256 of
+    the output. Returns True if it matched."""
+    import hashlib
+    h = hashlib.sha256()
+    tmp = dst + ".tmp"
+    try:
+        with open(src, "rb") as fi, open(tmp, "wb") as fo:
+            zi = _inflater(fi)
+            while True:
+                n = zi.readinto(mv)
+                if not n:
+                    break
+                fo.write(mv[:n])
+                h.update(mv[:n])
+        ok = not want or _hexdigest(h) == want
+    except Exception as e:
+        # A corrupt stream (or a full disk): fetch the payload afresh
+        print("OTA: inflate failed", src, e)
+        ok = False
+    for f in (src,) if ok else (src, tmp):
+        try:
+            os.remove(f)
+        except OSError:
+            pass
+    if not ok:
+        return False
+    os.rename(tmp, dst)
+    return True
+
+
+def _drop_source(entry, local):
+    """Delete the .py beside a .mpy variant just put in place at ``local``;
+    MicroPython imports a .py before a .mpy of the same name."""
+    if "source" in entry:
+        try:
+            os.remove(local[:-4] + ".py")
+        except OSError:
+            pass
+
+
+def _finish(entry, part, mv):
+    """Verify a complete .part (inflating compressed payloads) and move it
+    into place. Returns True if it matched."""
+    local = entry["local"]
+    want = entry.get("sha256")
+    if _compressed(entry):
+        ok = _inflate(part, local, want, mv)
+    else:
+        ok = not want or _file_matches(part, want)
+        if ok:
+            os.rename(part, local)
+        else:
+            os.remove(part)
+    if not ok:
+        print("OTA: hash mismatch", local)
+        return False
+    _drop_source(entry, local)
+    print("OTA:", local)
+    return True
+
+
+def _receive(conn, entry, offset, mv, stats):
+    """Stream one response body into the entry's .part file, then verify it
+    and move it into place. Returns True on success. A short read raises and
+    leaves the .part for the next round to resume."""
+    local = entry["local"]
+    part = _part_path(entry)
+    status, length = conn.response()
+    if status == 416 and offset:
+        # The .part already holds the whole file: power was lost before it
+        # was verified
+        conn.skip(length, mv)
+        return _finish(entry, part, mv)
+    if status == 200:
+        offset = 0  # server ignored the Range header
+    elif status != 206:
+        conn.skip(length, mv)
+        print("OTA: HTTP", status, local)
+        return False
+    _makedirs(local)
+    with open(part, "ab" if offset else "wb") as f:
+        remaining = length
+        while remaining > 0:
+            n = conn.readinto(mv[: min(len(mv), remaining)])
+            if not n:
+                raise OSError("short read")
+            f.write(mv[:n])
+            remaining -= n
+    stats["bytes"] += length
+    stats["raw"] += entry.get("size", length)
+    return _finish(entry, part, mv)
+
+
+def _fetch_round(base, entries, stats):
+    """Fetch ``entries`` over one kept-alive connection. Returns the entries
+    that still need fetching."""
+    import gc
+    use_ssl, host, port, path = _split_url(base)
+    buf = bytearray(_CHUNK)
+    mv = memoryview(buf)
+    failed = []
+    i = 0
+    conn = None
+    try:
+        conn = _Conn(use_ssl, host, port)
+        while i < len(entries):
+            batch = entries[i : i + _PIPELINE]
+            offsets = []
+            for entry in batch:
+                z = _compressed(entry)
+                off = _part_size(_part_path(entry))
+                offsets.append(off)
+                conn.get(path + "/" + (z["remote"] if z else entry["remote"]), off)
+            for entry, off in zip(batch, offsets):
+                if not _receive(conn, entry, off, mv, stats):
+                    failed.append(entry)
+                i += 1
+                gc.collect()
+                stats["min_free"] = min(stats["min_free"], gc.mem_free())
+    except Exception as e:
+        print("OTA: connection error after", i, "files:", e)
+        failed.extend(entries[i:])
+    finally:
+        if conn:
+            conn.close()
+    return failed
+
+
+def _download_entries(entries, base=None):
+    """Download ``entries`` with resume and retry. Returns the failed entries."""
+    import gc
+    import utime  # pyright: ignore[reportMissingImports]
+    base = base or _RAW
+    gc.collect()
+    stats = {"bytes": 0, "raw": 0, "min_free": gc.mem_free()}
+    t0 = utime.ticks_ms()
+    pending = entries
+    for attempt in range(_ROUNDS):
+        if not pending:
+            break
+        if attempt:
+            print("OTA retry", attempt, len(pending), "files")
+            utime.sleep(2)
+        pending = _fetch_round(base, pending, stats)
+    print(
+        "OTA: {} files, {} bytes ({} uncompressed) in {} ms, min free heap {}".format(
+            len(entries) - len(pending), stats["bytes"], stats["raw"],
+            utime.ticks_diff(utime.ticks_ms(), t0), stats["min_free"],
+        )
+    )
+    return pending
+
+
+def _fetch_manifest(base=None):
     for attempt in range(3):
         try:
-            r = urequests.get(_RAW + "/manifest.json")
+            r = urequests.get((base or _RAW) + "/manifest.json")
             try:
                 return json.loads(r.text)
             finally:
@@ -78,70 +410,232 @@ def _fetch_manifest():
     return None
 
 
-def _load_file_versions():
+def _file_matches(path, want):
+    import hashlib
+    h = hashlib.sha256()
+    buf = bytearray(_CHUNK)
+    mv = memoryview(buf)
     try:
-        with open(_FILE_VERS) as f:
-            return json.loads(f.read())
-    except Exception:
-        return {}
+        with open(path, "rb") as f:
+            while True:
+                n = f.readinto(mv)
+                if not n:
+                    break
+                h.update(mv[:n])
+    except OSError:
+        return False
+    return _hexdigest(h) == want
 
 
-def _save_file_versions(versions):
+def _copy(src, dst):
+    buf = bytearray(_CHUNK)
+    mv = memoryview(buf)
+    _makedirs(dst)
+    with open(src, "rb") as fi, open(dst, "wb") as fo:
+        while True:
+            n = fi.readinto(mv)
+            if not n:
+                break
+            fo.write(mv[:n])
+
+
+def _walk(d):
     try:
-        with open(_FILE_VERS, "w") as f:
-            f.write(json.dumps(versions))
-    except Exception as e:
-        print("OTA: file versions save failed:", e)
+        entries = list(os.ilistdir(d))
+    except OSError:
+        return
+    for e in entries:
+        path = d + "/" + e[0]
+        if e[1] == 0x4000:
+            for p in _walk(path):
+                yield p
+        else:
+            yield path
 
 
-def download_all():
-    """Download all app files (first-boot install). Returns True if all succeeded."""
-    manifest = _fetch_manifest()
+def _prune(slot, manifest):
+    """Delete files in ``slot`` that the manifest no longer lists. Partial
+    downloads of listed files are kept so they can be resumed. The source of
+    a .mpy variant is kept only while there is no .mpy yet, so the module
+    stays importable until _finish replaces it."""
+    p = _prefix(slot)
+    keep = []
+    for e in manifest:
+        keep.append(p + e["local"])
+        keep.append(p + _part_path(e))
+        src = e.get("source")
+        if src:
+            keep.append(p + _part_path(src))
+            if not _part_size(p + e["local"]):
+                keep.append(p + src["local"])
+    for top in ("bilalcast", "www"):
+        for path in list(_walk(_prefix(slot) + top)):
+            if path not in keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def _remove_legacy(manifest):
+    """Delete the pre-slot app tree once no slot pointer refers to it."""
+    dirs = []
+    for e in manifest:
+        try:
+            os.remove(e["local"])
+        except OSError:
+            pass
+        d = e["local"]
+        while "/" in d:
+            d = d.rsplit("/", 1)[0]
+            if d not in dirs:
+                dirs.append(d)
+    for d in sorted(dirs, key=len, reverse=True):
+        try:
+            os.rmdir(d)
+        except OSError:
+            pass
+    for path in (_VER_FILE, "ota_file_versions.json"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _mpy_abi():
+    """Bytecode version this firmware loads, as "major.minor"."""
+    import sys
+    try:
+        v = sys.implementation._mpy  # pyright: ignore[reportAttributeAccessIssue]
+    except AttributeError:
+        return None
+    return "{}.{}".format(v & 0xFF, (v >> 8) & 3)
+
+
+def _variant(entry, abi):
+    """The file to install for ``entry``: its precompiled .mpy when one was
+    built from the same source for this firmware's bytecode ABI, else the
+    source itself. The .mpy variant keeps the source entry for fallback."""
+    m = entry.get("mpy")
+    if not m or m.get("abi") != abi or m.get("src") != entry.get("sha256"):
+        return entry
+    e = dict(m)
+    e["local"] = entry["local"][:-3] + ".mpy"
+    e["source"] = entry
+    return e
+
+
+def _stage_entries(entries, slot, src_slot):
+    """Return the entries still to download after reusing verified local copies."""
+    todo = []
+    for entry in entries:
+        want = entry.get("sha256")
+        dst = _prefix(slot) + entry["local"]
+        if want:
+            if _file_matches(dst, want):
+                continue
+            src = _prefix(src_slot) + entry["local"]
+            if _file_matches(src, want):
+                _copy(src, dst)
+                _drop_source(entry, dst)
+                continue
+        e = dict(entry)
+        e["local"] = dst
+        todo.append(e)
+    return todo
+
+
+def _stage(manifest, slot, src_slot, base=None):
+    """Make ``slot`` hold every manifest file. Verified files already there or
+    in ``src_slot`` are reused; the rest are downloaded. Modules whose .mpy
+    cannot be fetched fall back to source. Returns True if the slot is
+    complete."""
+    abi = _mpy_abi()
+    entries = [_variant(e, abi) for e in manifest]
+    _prune(slot, entries)
+    todo = _stage_entries(entries, slot, src_slot)
+    print("OTA: staging", slot or "in place", "-", len(todo), "of", len(entries), "files to fetch")
+    failed = _download_entries(todo, base)
+    sources = [e["source"] for e in failed if "source" in e]
+    if sources:
+        print("OTA: falling back to source for", len(sources), "modules")
+        failed = [e for e in failed if "source" not in e]
+        failed += _download_entries(_stage_entries(sources, slot, src_slot), base)
+    return not failed
+
+
+def _install_in_place(manifest, version, base=None):
+    """Update the root tree for a bootstrap that cannot boot slots. Each file
+    is replaced whole, but an interrupted update leaves a mix of versions
+    until the next attempt completes it."""
+    if not _stage(manifest, "", "", base):
+        return False
+    from bilalcast import persist
+    persist.write_atomic(_VER_FILE, version)
+    # A slot staged for this bootstrap is never booted; drop the pointer so
+    # it cannot shadow the root tree after a reflash
+    try:
+        os.remove(SLOT_FILE)
+    except OSError:
+        pass
+    print("OTA: updated in place, version", version)
+    return True
+
+
+def _install(manifest, version, base=None):
+    """Stage ``manifest`` into the inactive slot and point SLOT_FILE at it,
+    or update in place when the bootstrap cannot boot slots."""
+    if not _boots_slots():
+        return _install_in_place(manifest, version, base)
+    s = _read_slot()
+    active = s.get("active", "")
+    target = _SLOTS[1] if active == _SLOTS[0] else _SLOTS[0]
+    if not _stage(manifest, target, active, base):
+        return False
+    _write_slot({
+        "active": target,
+        "previous": active,
+        "version": version,
+        "prev_version": current_version(),
+        "pending": True,
+        "boots": 0,
+    })
+    if active and not s.get("previous"):
+        _remove_legacy(manifest)
+    print("OTA: slot", target, "active, version", version)
+    return True
+
+
+def download_all(base=None):
+    """Download all app files (first-boot install). Returns True if all succeeded.
+
+    ``base`` overrides the raw GitHub URL, e.g. to point at a local HTTP
+    stand-in when benchmarking install time and heap use."""
+    manifest = _fetch_manifest(base)
     if manifest is None:
         print("OTA: could not fetch manifest")
         return False
-    return download_changed(manifest)
-
-
-def download_changed(manifest):
-    """Download only files whose version differs from the locally recorded version.
-    Returns True if all attempted downloads succeeded."""
-    local_vers = _load_file_versions()
-    failed = 0
-    updated = {}
-    for entry in manifest:
-        remote_v = entry.get("version")
-        local_v = local_vers.get(entry["local"])
-        if remote_v is not None and remote_v == local_v:
-            continue
-        url = _RAW + "/" + entry["remote"]
-        if _download(url, entry["local"]):
-            updated[entry["local"]] = remote_v
-        else:
-            failed += 1
-    if updated:
-        local_vers.update(updated)
-        _save_file_versions(local_vers)
-    return failed == 0
+    return _install(manifest, _remote_version(base), base)
+
 
+def check_and_update(remote_v=None):
+    """Check remote version; stage and activate it if newer. Returns True if updated.
 
-def check_and_update():
-    """Check remote version; download only changed files if outdated. Returns True if updated."""
-    local_v = _local_version()
-    remote_v = _remote_version()
+    Pass ``remote_v`` when the caller already fetched VERSION_URL itself.
+    """
+    local_v = current_version()
+    if remote_v is None:
+        remote_v = _remote_version()
     if remote_v is None or local_v == remote_v:
         return False
+    if remote_v == _read_slot().get("bad_version"):
+        return False
     print("OTA: updating", local_v, "->", remote_v)
     manifest = _fetch_manifest()
     if manifest is None:
         print("OTA: could not fetch manifest")
         return False
-    if download_changed(manifest):
-        try:
-            with open(_VER_FILE, "w") as f:
-                f.write(remote_v)
-        except Exception as e:
-            print("OTA: version write failed:", e)
+    if _install(manifest, remote_v):
         return True
-    print("OTA: some downloads failed, not marking updated")
+    print("OTA: some downloads failed, will retry")
     return False
@@ -0,0 +1,168 @@
+"""
+Append-only key/value journal for small runtime state.
+
+Each flush appends one JSON line holding every key written since the last
+flush, so a burst of writes costs a single small append instead of one
+whole-file rewrite per file. Replay stops at the first unreadable line, so a
+torn tail from a power cut loses at most the last batch. Once the journal
+reaches COMPACT_AFTER lines it is rewritten to a temp file and renamed over
+the original, which littlefs does atomically.
+"""
+import ujson as json  # pyright: ignore[reportMissingImports]
+import os
+
+JOURNAL_FILE = "state.journal"
+COMPACT_AFTER = 32
+COALESCE_MS = 2000
+
+# Whole-file JSON stores used before the journal; folded in on first load
+_LEGACY = {
+    "cast_state": "cast_state.json",
+    "cast_device": "cast_device.json",
+}
+
+_data = None
+_dirty = {}
+_records = 0
+
+
+def _load():
+    global _data, _records
+    if _data is not None:
+        return _data
+    _data = {}
+    _records = 0
+    torn = False
+    try:
+        with open(JOURNAL_FILE) as f:
+            for line in f:
+                try:
+                    if not line.endswith("\n"):
+                        raise ValueError
+                    batch = json.loads(line)
+                except ValueError:
+                    torn = True
+                    break
+                for k, v in batch.items():
+                    if v is None:
+                        _data.pop(k, None)
+                    else:
+                        _data[k] = v
+                _records += 1
+    except OSError:
+        pass
+    if torn:
+        # Drop the damaged tail so later appends start on a clean line
+        compact()
+    _migrate_legacy()
+    return _data
+
+
+def _migrate_legacy():
+    migrated = []
+    for key, path in _LEGACY.items():
+        try:
+            with open(path) as f:
+                value = json.load(f)
+        except Exception:
+            continue
+        if key not in _data:  # type: ignore[operator]
+            _dirty[key] = value
+        migrated.append(path)
+    if not migrated:
+        return
+    flush()
+    for path in migrated:
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+
+
+def get(key, default=None):
+    if key in _dirty:
+        v = _dirty[key]
+        return default if v is None else v
+    return _load().get(key, default)
+
+
+def put(key, value):
+    """Stage a value; it reaches flash on the next flush()."""
+    _load()
+    _dirty[key] = value
+
+
+def delete(key):
+    put(key, None)
+
+
+def flush():
+    """Append all staged writes as one journal record."""
+    global _dirty, _records
+    if not _dirty:
+        return
+    data = _load()
+    batch = _dirty
+    _dirty = {}
+    with open(JOURNAL_FILE, "a") as f:
+        f.write(json.dumps(batch) + "\n")
+    for k, v in batch.items():
+        if v is None:
+            data.pop(k, None)
+        else:
+            data[k] = v
+    _records += 1
+    if _records >= COMPACT_AFTER:
+        compact()
+
+
+def compact():
+    """Rewrite the journal as a single record holding the live values."""
+    global _records
+    write_atomic(JOURNAL_FILE, json.dumps(_load()) + "\n")
+    _records = 1
+
+
+def write_atomic(path, text):
+    """Write a whole file via temp file + rename so readers never see a torn file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.rename(tmp, path)
+
+
+def reboot():
+    """Flush staged writes, then reset the device. Use instead of machine.reset()."""
+    import machine
+
+    try:
+        flush()
+    except Exception as e:
+        print("persist flush failed:", e)
+    machine.reset()
+
+
+def wipe():
+    """Forget everything (factory reset)."""
+    global _data, _dirty, _records
+    for path in (JOURNAL_FILE, JOURNAL_FILE + ".tmp") + tuple(_LEGACY.values()):
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+    _data = {}
+    _dirty = {}
+    _records = 0
+
+
+async def flush_loop(period_ms=COALESCE_MS):
+    """Background task: coalesce writes made within each period into one append."""
+    import asyncio
+
+    while True:
+        await asyncio.sleep_ms(period_ms)
+        if _dirty:
+            try:
+                flush()
+            except Exception as e:
+                print("persist flush failed:", e)
@@ -1,6 +1,15 @@
 import gc
+import sys
 
 import uasyncio, os  # pyright: ignore[reportMissingImports]
+import utime as time  # pyright: ignore[reportMissingImports]
+
+try:
+    from bilalcast import metrics
+except ImportError:
+    # phew is frozen; firmware built without metrics.py lacks it until the
+    # app is installed on flash
+    metrics = None
 
 
 def urldecode(text):
@@ -87,27 +96,71 @@ content_type_map = {
     "bin": "application/octet-stream",
     "xml": "application/xml",
     "gif": "image/gif",
+    "mp3": "audio/mpeg",
+    "m4a": "audio/mp4",
 }
 
+# how long an idle keep-alive connection is held open for the next request
+KEEPALIVE_S = 5
+
+
+def _parse_range(value, size):
+    # parses a single "bytes=start-end" range into (start, length), or None
+    # if it cannot be satisfied
+    try:
+        unit, spec = value.strip().split("=", 1)
+        start, end = spec.split(",")[0].strip().split("-")
+        if unit != "bytes":
+            return None
+        if start == "":
+            # suffix range: the last n bytes
+            n = min(int(end), size)
+            return (size - n, n) if n > 0 else None
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, end - start + 1
+
 
 class FileResponse(Response):
-    def __init__(self, file, status=200, headers={}):
+    def __init__(self, file, status=200, headers={}, byte_range=None):
         self.status = 404
-        self.headers = headers
+        self.headers = dict(headers)
         self.file = file
+        self.start = 0
+        self.length = 0
 
         try:
-            if (os.stat(self.file)[0] & 0x4000) == 0:
-                self.status = 200
+            stat = os.stat(self.file)
+            if (stat[0] & 0x4000) == 0:
+                self.status = status
+                size = stat[6]
+                self.length = size
 
                 # auto set content type
                 extension = self.file.split(".")[-1].lower()
                 if extension in content_type_map:
-                    headers["Content-Type"] = content_type_map[extension]
-
-                headers["Content-Length"] = os.stat(self.file)[6]
+                    self.headers["Content-Type"] = content_type_map[extension]
+
+                self.headers["Accept-Ranges"] = "bytes"
+                if byte_range:
+                    r = _parse_range(byte_range, size)
+                    if r is None:
+                        self.status = 416
+                        self.length = 0
+                        self.headers["Content-Range"] = "bytes */{}".format(size)
+                    else:
+                        self.start, self.length = r
+                        self.status = 206
+                        self.headers["Content-Range"] = "bytes {}-{}/{}".format(
+                            self.start, self.start + self.length - 1, size
+                        )
         except OSError:
-            return False
+            pass
+        self.headers["Content-Length"] = self.length
 
 
 class Route:
@@ -233,19 +286,40 @@ class Phew:
         self.catchall_handler = None
         self.loop = uasyncio.get_event_loop()
 
-    # handle an incoming request to the web server
+    # handle an incoming connection to the web server; file responses keep
+    # the connection open for the next request (media players fetch a file
+    # as a series of range requests)
     async def _handle_request(self, reader, writer):
+        try:
+            keep_alive = await self._handle_one(reader, writer)
+            while keep_alive:
+                request_line = await uasyncio.wait_for(reader.readline(), KEEPALIVE_S)
+                keep_alive = await self._handle_one(reader, writer, request_line)
+        except (OSError, uasyncio.TimeoutError):
+            # client went away, or left a kept-alive connection idle
+            pass
+        except Exception as e:
+            print("phew: request failed")
+            sys.print_exception(e)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    # handle one request; returns True if the connection can be reused
+    async def _handle_one(self, reader, writer, request_line=None):
 
         # Do a GC collect before handling the request
         gc.collect()
 
         response = None
 
-        request_line = await reader.readline()
+        if request_line is None:
+            request_line = await reader.readline()
         try:
             method, uri, protocol = request_line.decode().split()
         except Exception:
-            return
+            return False
+        t0 = time.ticks_ms()
 
         request = Request(method, uri, protocol)
         request.headers = await _parse_headers(reader)
@@ -283,7 +357,17 @@ class Phew:
                 response.add_header("Content-Length", len(body))  # type: ignore[arg-type]
 
         if response is None:
-            return
+            return False
+
+        keep_alive = (
+            isinstance(response, FileResponse)
+            and protocol == "HTTP/1.1"
+            and request.headers.get("connection", "").lower() != "close"
+        )
+        if keep_alive:
+            response.add_header("Connection", "keep-alive")
+        else:
+            response.add_header("Connection", "close")
 
         # write status line
         status_message = status_message_map.get(response.status, "Unknown")
@@ -296,15 +380,25 @@ class Phew:
         # blank line to denote end of headers
         writer.write("\r\n".encode("ascii"))
 
-        if isinstance(response, FileResponse):
-            # file
-            with open(response.file, "rb") as f:
-                while True:
-                    chunk = f.read(1024)
-                    if not chunk:
-                        break
-                    writer.write(chunk)
-                    await writer.drain()
+        if request.method == "HEAD":
+            await writer.drain()
+        elif isinstance(response, FileResponse):
+            # file, or the requested byte range of it
+            if response.length:
+                buf = bytearray(2048)
+                mv = memoryview(buf)
+                remaining = response.length
+                with open(response.file, "rb") as f:
+                    f.seek(response.start)
+                    while remaining > 0:
+                        n = f.readinto(buf)
+                        if not n:
+                            break
+                        n = min(n, remaining)
+                        writer.write(mv[:n])
+                        await writer.drain()
+                        remaining -= n
+            await writer.drain()
         elif type(response.body).__name__ == "generator":
             # generator
             for chunk in response.body:  # type: ignore[union-attr]
@@ -315,8 +409,10 @@ class Phew:
             writer.write(response.body)
             await writer.drain()
 
-        writer.close()
-        await writer.wait_closed()
+        if metrics:
+            metrics.inc(metrics.HTTP_REQUESTS)
+            metrics.since(metrics.HTTP_MS, t0)
+        return keep_alive
 
     # adds a new route to the routing table
     def add_route(self, path, handler, methods=["GET"]):
@@ -343,8 +439,10 @@ class Phew:
 
         return _catchall
 
-    def serve_file(self, file):
-        return FileResponse(file)
+    def serve_file(self, file, request=None):
+        # honours a Range header when the request is passed in
+        byte_range = request.headers.get("range") if request else None
+        return FileResponse(file, byte_range=byte_range)
 
     # returns the route matching the supplied path or None
     def _match_route(self, request):
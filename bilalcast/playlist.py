@@ -0,0 +1,74 @@
+"""
+Per-prayer audio playlists, resolved ahead of each cast.
+
+Without configuration every prayer plays its ATHANS clip and the pre-athan
+reminder plays PRE_ATHAN, as before. The optional "playlists" object in
+config.json layers variants on top. Each section maps a prayer name, "*"
+(any of the five prayers) or "pre" (the pre-athan reminder) to a list of
+URLs:
+
+    "athan":   one clip a day, rotating through the list (e.g. muezzins)
+    "friday":  replaces "athan" on Fridays
+    "ramadan": replaces both during Ramadan
+    "dua":     every clip listed, queued after the athan
+
+A resolved playlist is a list of URLs, cast as one QUEUE_LOAD. Ramadan is
+found with the tabular Islamic calendar, which can be a day off the local
+moon sighting; "hijri_adjust" in config.json shifts it.
+"""
+from bilalcast.prayer import ATHANS, PRE_ATHAN
+
+PRE = "pre"
+_FRIDAY = 4  # Monday = 0
+_RAMADAN = 9
+
+_lists = {}
+_hijri_adjust = 0
+
+
+def configure(lists, hijri_adjust=0):
+    global _lists, _hijri_adjust
+    _lists = lists or {}
+    _hijri_adjust = hijri_adjust
+
+
+def hijri(n):
+    """(year, month, day) in the tabular Islamic calendar for a days-since-1970 number."""
+    l = n + 2440588 - 1948440 + 10632  # Julian day number, from the Hijri epoch
+    cycle = (l - 1) // 10631
+    l = l - 10631 * cycle + 354
+    j = ((10985 - l) // 5316) * ((50 * l) // 17719) + (l // 5670) * ((43 * l) // 15238)
+    l = l - ((30 - j) // 15) * ((17719 * j) // 50) - (j // 16) * ((15238 * j) // 43) + 29
+    m = (24 * l) // 709
+    return 30 * cycle + j - 30, m, l - (709 * m) // 24
+
+
+def _pick(section, prayer):
+    lists = _lists.get(section) or {}
+    if prayer in lists:
+        return lists[prayer]
+    return lists.get("*") if prayer != PRE else None
+
+
+def resolve(prayer, day):
+    """URLs to queue for ``prayer`` (or PRE) on ``day`` (days since 1970-01-01)."""
+    urls = None
+    if hijri(day + _hijri_adjust)[1] == _RAMADAN:
+        urls = _pick("ramadan", prayer)
+    if not urls and (day + 3) % 7 == _FRIDAY:
+        urls = _pick("friday", prayer)
+    if not urls:
+        urls = _pick("athan", prayer)
+    queue = [urls[day % len(urls)]] if urls else [PRE_ATHAN if prayer == PRE else ATHANS[prayer]]
+    if prayer != PRE:
+        queue.extend(_pick("dua", prayer) or ())
+    return queue
+
+
+def upcoming(day, days=2):
+    """Every URL the playlists resolve to from ``day`` for ``days`` days, for prefetching."""
+    urls = []
+    for n in range(day, day + days):
+        for p in (PRE,) + tuple(ATHANS):
+            urls.extend(resolve(p, n))
+    return urls
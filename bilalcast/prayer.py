@@ -1,7 +1,9 @@
+from array import array
 import utime as time
-import urequests
 
-from bilalcast.logger import log
+import bilalcast.persist as persist
+from bilalcast import ahttp, fetch, timetable, tz
+from bilalcast.logger import log, warn
 
 FAJR_ATHAN = "https://storage.googleapis.com/athans/athan_fajr_1.mp3"
 ATHAN = "https://storage.googleapis.com/athans/athan_1.mp3"
@@ -13,44 +15,100 @@ ATHANS = {
     "Maghrib": ATHAN,
     "Isha": ATHAN,
 }
-ATHANS_ORDER = ["Fajr", "Dhuhr", "Asr", "Maghrib", "Isha"]
+ATHANS_ORDER = timetable.PRAYERS
 
+# IP geolocation is cached on flash and only re-queried when the network
+# fingerprint changes or the entry is older than LOCATION_TTL_S
+LOCATION_KEY = "location"
+LOCATION_TTL_S = 30 * 86400
+# Last successfully fetched prayer times, used while Aladhan is unreachable
+TIMES_KEY = "prayer_times"
 
-def pre_athan_time(hhmm, mins=10):
-    h, m = hhmm.split(":")
-    total = int(h) * 60 + int(m) - int(mins)
-    return "{:02d}:{:02d}".format((total // 60) % 24, total % 60)
+# "live" or "stale" (last known times) for the most recent get_all_prayers*
+last_source = None
 
 
-def seconds_until(hhmm):
-    now = time.localtime()
-    now_secs = now[3] * 3600 + now[4] * 60 + now[5]
-    h, m = hhmm.split(":")
-    target_secs = int(h) * 3600 + int(m) * 60
-    diff = target_secs - now_secs
+def pre_athan_time(t, mins=10):
+    """``mins`` before ``t``; both times are minutes since midnight."""
+    return (t - int(mins)) % 1440
+
+
+def seconds_until(t):
+    """Seconds until local time ``t`` (minutes since midnight) next comes round,
+    counted in real time across DST changes."""
+    now = time.time()
+    lt = tz.localtime(now)
+    h, m = divmod(t, 60)
+    diff = tz.mktime(lt[0], lt[1], lt[2], h, m) - now
     if diff < 0:
-        diff += 86400
+        lt = tz.localtime(now + 86400)
+        diff = tz.mktime(lt[0], lt[1], lt[2], h, m) - now
     return diff
 
 
-def get_location():
-    while True:
-        try:
-            resp = urequests.get("http://ip-api.com/json?fields=status,lat,lon,offset,timezone")
-            try:
-                d = resp.json()
-            finally:
-                resp.close()
-            if d.get("status") == "success":
-                lat, lon = d["lat"], d["lon"]
-                offset = d.get("offset", 0)
-                timezone = d.get("timezone", "")
-                log("location: {}, {} (UTC offset {}s, tz {})".format(lat, lon, offset, timezone))
-                return lat, lon, offset, timezone
-            log("IP geolocation failed, retrying...")
-        except Exception as e:
-            log("IP geolocation error, retrying: " + str(e))
-        time.sleep(2)
+def _clock_set(t):
+    """True if epoch ``t`` came from a set clock; the RTC starts in 2021."""
+    return time.gmtime(t)[0] >= 2024
+
+
+def _as_tuple(c):
+    return c["lat"], c["lon"], c["offset"], c["tz"]
+
+
+async def _fetch_location(net):
+    d = await ahttp.get_json("http://ip-api.com/json?fields=status,lat,lon,offset,timezone,query")
+    if d.get("status") != "success":
+        raise OSError("ip-api status " + str(d.get("status")))
+    c = {
+        "lat": d["lat"],
+        "lon": d["lon"],
+        "offset": d.get("offset", 0),
+        "tz": d.get("timezone", ""),
+        "ip": d.get("query", ""),
+        "net": net,
+        "at": time.time(),
+    }
+    persist.put(LOCATION_KEY, c)
+    log("location: {}, {} (UTC offset {}s, tz {})".format(c["lat"], c["lon"], c["offset"], c["tz"]))
+    return c
+
+
+async def get_location(net=None):
+    """Return (lat, lon, utc_offset, timezone), from the flash cache if there is one.
+
+    Only a device with nothing cached waits for ip-api, retrying until it answers.
+    """
+    c = persist.get(LOCATION_KEY)
+    if c:
+        return _as_tuple(c)
+    return _as_tuple(await fetch.call("ip-api", lambda: _fetch_location(net)))
+
+
+async def revalidate_location(net):
+    """Re-query ip-api if ``net`` differs from the cached fingerprint or the TTL ran out.
+
+    Returns the new (lat, lon, utc_offset, timezone) if the location moved, else None.
+    """
+    old = persist.get(LOCATION_KEY)
+    if old and old.get("net") == net:
+        now = time.time()
+        # Until SNTP has set the clock the entry's age is unknown; keep it
+        if not _clock_set(now):
+            return None
+        # Fetched before the clock was set: its age starts now
+        if not _clock_set(old.get("at", 0)):
+            persist.put(LOCATION_KEY, dict(old, at=now))
+            return None
+        if 0 <= now - old["at"] < LOCATION_TTL_S:
+            return None
+    try:
+        c = await fetch.call("ip-api", lambda: _fetch_location(net), fetch.deadline_in(0))
+    except Exception as e:
+        print("location revalidation failed:", e)
+        return None
+    if old and old["tz"] == c["tz"] and abs(old["lat"] - c["lat"]) < 0.05 and abs(old["lon"] - c["lon"]) < 0.05:
+        return None
+    return _as_tuple(c)
 
 
 def _url_encode(s):
@@ -70,165 +128,140 @@ def _url_encode(s):
     return result
 
 
-def geocode_address(address):
-    """Geocode an address via Nominatim. Returns (lat, lon) floats or (None, None)."""
-    try:
-        url = "https://nominatim.openstreetmap.org/search?q=" + _url_encode(address) + "&format=json&limit=1"
-        resp = urequests.get(url)
-        try:
-            results = resp.json()
-        finally:
-            resp.close()
-        if results:
-            log("geocoded '{}' → {}, {}".format(address, results[0]["lat"], results[0]["lon"]))
-            return float(results[0]["lat"]), float(results[0]["lon"])
-    except Exception as e:
-        log("geocode failed: " + str(e))
-    return None, None
+def settings_query(method=2, timezone="", lat_adj=1, midnight=0, school=0):
+    """Calculation settings as Aladhan query parameters (leading "&")."""
+    q = (
+        "&latitudeAdjustmentMethod={}".format(int(lat_adj))
+        + "&calendarMethod=MATHEMATICAL"
+        + "&method={}".format(int(method))
+        + "&midnightMode={}".format(int(midnight))
+        + "&school={}".format(int(school))
+    )
+    if timezone:
+        q += "&timezonestring=" + _url_encode(timezone)
+    return q
 
 
-def _fetch_timings(date, lat, lon, method=2, timezone="", lat_adj=1, midnight=0, school=0):
+async def _fetch_timings(date, lat, lon, method=2, timezone="", lat_adj=1, midnight=0, school=0):
     url = (
         "https://api.aladhan.com/v1/timings/" + date
         + "?latitude={:.4f}".format(lat)
         + "&longitude={:.4f}".format(lon)
-        + "&latitudeAdjustmentMethod={}".format(int(lat_adj))
-        + "&calendarMethod=MATHEMATICAL"
-        + "&method={}".format(int(method))
-        + "&midnightMode={}".format(int(midnight))
-        + "&school={}".format(int(school))
+        + settings_query(method, timezone, lat_adj, midnight, school)
     )
-    if timezone:
-        url += "&timezonestring=" + timezone
-    resp = urequests.get(url)
-    try:
-        d = resp.json()
-    finally:
-        resp.close()
-    return d
-
-
-def get_all_prayers(lat, lon, method=2, timezone="", lat_adj=1, midnight=0, school=0):
-    """Return all 5 prayer times for today as a dict, in local time."""
-    while True:
-        try:
-            ct = time.localtime()
-            date = "{:02d}-{:02d}-{:04d}".format(ct[2], ct[1], ct[0])
-            d = _fetch_timings(date, lat, lon, method, timezone, lat_adj, midnight, school)
-            if d.get("code") == 200:
-                timings = d["data"]["timings"]
-                result = {}
-                for prayer in ATHANS_ORDER:
-                    t = timings.get(prayer, "")[:5]
-                    if t:
-                        result[prayer] = t
-                if result:
-                    log("prayer times: " + str(result))
-                    return result
-                log("Prayer times empty, retrying...")
-            else:
-                log("Timings fetch failed (code {}), retrying...".format(d.get("code")))
-        except Exception as e:
-            log("Prayer times fetch failed, retrying: " + str(e))
-        time.sleep(2)
-
-
-def _fetch_timings_by_address(date, address, method=2, timezone="", lat_adj=1, midnight=0, school=0):
+    return await ahttp.get_json(url)
+
+
+def _today():
+    ct = tz.localtime()
+    return "{:02d}-{:02d}-{:04d}".format(ct[2], ct[1], ct[0])
+
+
+def _parse_timings(d):
+    """Aladhan response -> packed day (see timetable)."""
+    if d.get("code") != 200:
+        raise OSError("timings code {}".format(d.get("code")))
+    result = timetable.pack(d["data"]["timings"])
+    if not timetable.has_times(result):
+        raise OSError("prayer times empty")
+    return result
+
+
+def last_known_times():
+    """The most recently fetched prayer times (possibly an earlier day's), or None."""
+    c = persist.get(TIMES_KEY)
+    if not c:
+        return None
+    times = c["times"]
+    # Entries written before times were packed hold an "HH:MM" dict
+    return timetable.pack(times) if isinstance(times, dict) else array("H", times)
+
+
+def _fallback_times():
+    global last_source
+    times = last_known_times()
+    if times:
+        last_source = "stale"
+        warn("prayer times unavailable, using last known: " + str(timetable.to_dict(times)))
+    return times
+
+
+def _remember_times(times):
+    global last_source
+    last_source = "live"
+    persist.put(TIMES_KEY, {"date": _today(), "times": list(times)})
+
+
+async def get_all_prayers(lat, lon, method=2, timezone="", lat_adj=1, midnight=0, school=0, deadline=None):
+    """Return today's prayer times as a packed day (see timetable), in local time.
+
+    Retries until ``deadline`` (see fetch.call), then uses the last known times.
+    """
+    async def attempt():
+        d = await _fetch_timings(_today(), lat, lon, method, timezone, lat_adj, midnight, school)
+        result = _parse_timings(d)
+        log("prayer times: " + str(timetable.to_dict(result)))
+        _remember_times(result)
+        return result
+
+    return await fetch.call("aladhan", attempt, deadline, _fallback_times)
+
+
+async def _fetch_timings_by_address(date, address, method=2, timezone="", lat_adj=1, midnight=0, school=0):
     url = (
         "https://api.aladhan.com/v1/timingsByAddress/" + date
         + "?address=" + _url_encode(address)
-        + "&latitudeAdjustmentMethod={}".format(int(lat_adj))
-        + "&calendarMethod=MATHEMATICAL"
-        + "&method={}".format(int(method))
-        + "&midnightMode={}".format(int(midnight))
-        + "&school={}".format(int(school))
+        + settings_query(method, timezone, lat_adj, midnight, school)
     )
-    if timezone:
-        url += "&timezonestring=" + _url_encode(timezone)
-    resp = urequests.get(url)
-    try:
-        d = resp.json()
-    finally:
-        resp.close()
-    return d
-
-
-def get_all_prayers_by_address(address, method=2, timezone="", lat_adj=1, midnight=0, school=0):
-    """Return all 5 prayer times for today using an address string, retrying until success."""
-    while True:
-        try:
-            ct = time.localtime()
-            date = "{:02d}-{:02d}-{:04d}".format(ct[2], ct[1], ct[0])
-            d = _fetch_timings_by_address(date, address, method, timezone, lat_adj, midnight, school)
-            if d.get("code") == 200:
-                timings = d["data"]["timings"]
-                result = {}
-                for prayer in ATHANS_ORDER:
-                    t = timings.get(prayer, "")[:5]
-                    if t:
-                        result[prayer] = t
-                if result:
-                    log("prayer times (by address): " + str(result))
-                    return result
-                log("Prayer times empty, retrying...")
-            else:
-                log("Timings fetch failed (code {}), retrying...".format(d.get("code")))
-        except Exception as e:
-            log("Prayer times fetch failed, retrying: " + str(e))
-        time.sleep(2)
-
-
-def try_prayers_by_address(address, method=2, timezone="", lat_adj=1, midnight=0, school=0):
+    return await ahttp.get_json(url)
+
+
+async def get_all_prayers_by_address(address, method=2, timezone="", lat_adj=1, midnight=0, school=0, deadline=None):
+    """Return all 5 prayer times for today using an address string.
+
+    Retries until ``deadline`` (see fetch.call), then uses the last known times.
+    """
+    async def attempt():
+        d = await _fetch_timings_by_address(_today(), address, method, timezone, lat_adj, midnight, school)
+        result = _parse_timings(d)
+        log("prayer times (by address): " + str(timetable.to_dict(result)))
+        _remember_times(result)
+        return result
+
+    return await fetch.call("aladhan", attempt, deadline, _fallback_times)
+
+
+async def try_prayers_by_address(address, method=2, timezone="", lat_adj=1, midnight=0, school=0):
     """Single attempt, returns dict or None on failure (no retry)."""
+    async def attempt():
+        d = await _fetch_timings_by_address(_today(), address, method, timezone, lat_adj, midnight, school)
+        return _parse_timings(d)
+
     try:
-        ct = time.localtime()
-        date = "{:02d}-{:02d}-{:04d}".format(ct[2], ct[1], ct[0])
-        d = _fetch_timings_by_address(date, address, method, timezone, lat_adj, midnight, school)
-        if d.get("code") == 200:
-            timings = d["data"]["timings"]
-            result = {}
-            for prayer in ATHANS_ORDER:
-                t = timings.get(prayer, "")[:5]
-                if t:
-                    result[prayer] = t
-            if result:
-                return result
+        result = await fetch.call("aladhan", attempt, fetch.deadline_in(0))
     except Exception as e:
         log("try_prayers_by_address failed: " + str(e))
-    return None
-
-
-def get_next_prayer(lat, lon, method=2, timezone=""):
-    while True:
-        try:
-            ct = time.localtime()
-            now_mins = ct[3] * 60 + ct[4]
-            date = "{:02d}-{:02d}-{:04d}".format(ct[2], ct[1], ct[0])
-            d = _fetch_timings(date, lat, lon, method, timezone)
-            if d.get("code") == 200:
-                timings = d["data"]["timings"]
-                for prayer in ATHANS_ORDER:
-                    t = timings.get(prayer, "")[:5]
-                    if not t:
-                        continue
-                    h, m = t.split(":")
-                    if int(h) * 60 + int(m) > now_mins:
-                        log("next prayer: {} {}".format(prayer, t))
-                        return prayer, t
-                # All today's prayers have passed — fetch tomorrow's first
-                tomorrow = time.localtime(time.mktime(ct) + 86400)
-                date2 = "{:02d}-{:02d}-{:04d}".format(tomorrow[2], tomorrow[1], tomorrow[0])
-                d2 = _fetch_timings(date2, lat, lon, method, timezone)
-                if d2.get("code") == 200:
-                    timings2 = d2["data"]["timings"]
-                    for prayer in ATHANS_ORDER:
-                        t = timings2.get(prayer, "")[:5]
-                        if t:
-                            log("next prayer (tomorrow): {} {}".format(prayer, t))
-                            return prayer, t
-                log("No known prayer found, retrying...")
-            else:
-                log("Timings fetch failed (code {}), retrying...".format(d.get("code")))
-        except Exception as e:
-            log("Next prayer fetch failed, retrying: " + str(e))
-        time.sleep(2)
+        return None
+    _remember_times(result)
+    return result
+
+
+async def get_next_prayer(lat, lon, method=2, timezone=""):
+    async def attempt():
+        ct = tz.localtime()
+        now_mins = ct[3] * 60 + ct[4]
+        day = _parse_timings(await _fetch_timings(_today(), lat, lon, method, timezone))
+        for i, prayer in enumerate(ATHANS_ORDER):
+            if day[i] != timetable.NONE and day[i] > now_mins:
+                log("next prayer: {} {}".format(prayer, timetable.hhmm(day[i])))
+                return prayer, day[i]
+        # All today's prayers have passed — fetch tomorrow's first
+        tomorrow = tz.localtime(time.time() + 86400)
+        date2 = "{:02d}-{:02d}-{:04d}".format(tomorrow[2], tomorrow[1], tomorrow[0])
+        day2 = _parse_timings(await _fetch_timings(date2, lat, lon, method, timezone))
+        for i, prayer in enumerate(ATHANS_ORDER):
+            if day2[i] != timetable.NONE:
+                log("next prayer (tomorrow): {} {}".format(prayer, timetable.hhmm(day2[i])))
+                return prayer, day2[i]
+
+    return await fetch.call("aladhan", attempt)
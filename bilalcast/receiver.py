@@ -0,0 +1,186 @@
+"""
+Cast sessions that follow the receiver until the athan has played.
+
+start() reads the receiver's status before taking it over: the running app,
+its media and the volume. watch() keeps the Cast connection open after the
+LOAD, answering heartbeats and following MEDIA_STATUS/RECEIVER_STATUS until
+the queue finishes, the user stops it, or MAX_PLAY_S passes. It then restores
+the volume and, if enabled, reloads the interrupted media where it left off.
+With ramp_s set, the athan fades in from RAMP_FROM of its volume meanwhile.
+
+A cast that starts while another is still being watched (the athan after a
+long pre-athan) takes the session over. It keeps the first cast's saved
+volume and media, so what gets restored is the state before either.
+"""
+import asyncio
+import utime as time  # pyright: ignore[reportMissingImports]
+
+from bilalcast import metrics
+from bilalcast.logger import log
+
+MAX_PLAY_S = 15 * 60
+PING_MS = 5000
+RAMP_STEPS = 10
+# A ramp starts at this fraction of the prayer's volume
+RAMP_FROM = 0.1
+
+# Latest receiver state seen by a session
+app_name = None
+volume = None
+muted = None
+player_state = None
+
+resume_media = False
+# Seconds to fade the athan in over; 0 starts at full volume
+ramp_s = 0
+
+_cc = None
+_port = None
+_ramp = None
+# Bumped by each start(); an older watcher that sees it change stops quietly
+_gen = 0
+# {"volume", "app", "media", "time"} from before the current session
+_saved = None
+
+
+def _note_receiver(status):
+    global app_name, volume, muted
+    vol = status.get("volume") or {}
+    volume = vol.get("level", volume)
+    muted = vol.get("muted", muted)
+    apps = status.get("applications") or []
+    app_name = apps[0].get("displayName") if apps else None
+    return apps
+
+
+async def _snapshot(cc):
+    """What the receiver is doing now, to restore once the athan is over."""
+    status = await cc.receiver_status()
+    if status is None:
+        return None
+    apps = _note_receiver(status)
+    saved = {"volume": volume, "app": None, "media": None, "time": 0}
+    if resume_media and apps and not apps[0].get("isIdleScreen") and apps[0].get("transportId"):
+        m = await cc.media_status(apps[0]["transportId"])
+        if m and m.get("media") and m.get("playerState") in ("PLAYING", "PAUSED", "BUFFERING"):
+            saved.update(app=apps[0]["appId"], media=m["media"], time=m.get("currentTime", 0))
+    return saved
+
+
+async def start(urls, host, port, vol=0.5, max_retries=3):
+    """Take over the receiver and load ``urls``. Returns (ok, error)."""
+    from bilalcast.cast import Chromecast
+
+    global _cc, _port, _gen, _saved, _ramp
+    _gen += 1
+    metrics.inc(metrics.CASTS)
+    t0 = time.ticks_ms()
+    _port = port
+    last_error = "transport_id timeout"
+    for attempt in range(1, max_retries + 1):
+        cc = None
+        try:
+            cc = Chromecast(host, port)
+            if _saved is None:
+                _saved = await _snapshot(cc)
+            cc.set_volume(vol * RAMP_FROM if ramp_s else vol)
+            if await cc.play_url(urls):
+                if cc.load_to_playing_ms is not None:
+                    print("LOAD to PLAYING {} ms: {}".format(cc.load_to_playing_ms, urls))
+                _cc = cc
+                metrics.since(metrics.CAST_MS, t0)
+                if ramp_s:
+                    # Runs alongside watch(), which stops it when playback ends
+                    _ramp = asyncio.create_task(cc.ramp_volume(vol * RAMP_FROM, vol, RAMP_STEPS, ramp_s * 1000))
+                return True, None
+            log("Cast attempt {}/{}: transport_id timeout".format(attempt, max_retries))
+        except Exception as e:
+            last_error = str(e)
+            log("Cast attempt {}/{} failed: {}".format(attempt, max_retries, e))
+        if cc:
+            cc.disconnect()
+        if attempt < max_retries:
+            await asyncio.sleep(3)
+    metrics.inc(metrics.CAST_FAILURES)
+    # Nothing of ours is playing: put the volume back now
+    saved, _saved = _saved, None
+    _restore_volume(host, port, saved)
+    return False, last_error
+
+
+def _restore_volume(host, port, saved):
+    """Put the saved volume back over a fresh connection."""
+    from bilalcast.cast import Chromecast
+
+    if not saved or saved["volume"] is None:
+        return
+    try:
+        cc = Chromecast(host, port)
+        try:
+            cc.set_volume(saved["volume"])
+        finally:
+            cc.disconnect()
+    except Exception as e:
+        print("volume restore failed:", e)
+
+
+async def watch():
+    """Follow the session start() opened until playback ends.
+
+    Returns why it ended: "finished", "stopped" (by the user or another
+    app), "error", "timeout", "lost" (connection dropped) or "superseded"
+    (another cast took over).
+    """
+    global _cc, _saved, _ramp, player_state
+    cc, gen, ramp = _cc, _gen, _ramp
+    _cc = _ramp = None
+    if cc is None:
+        return "lost"
+    began = time.time()
+    reason = "timeout"
+    try:
+        while time.time() - began < MAX_PLAY_S:
+            m = await cc.next_message(PING_MS)
+            if gen != _gen:
+                return "superseded"
+            if m is None:
+                cc.ping()
+                continue
+            _, _, d = m
+            kind = d.get("type")
+            if kind == "RECEIVER_STATUS":
+                apps = _note_receiver(d.get("status") or {})
+                if not any(a.get("transportId", "").encode() == cc.transport_id for a in apps):
+                    reason = "stopped"
+                    break
+            elif kind == "MEDIA_STATUS" and d.get("status"):
+                st = d["status"][0]
+                player_state = st.get("playerState", player_state)
+                if player_state == "IDLE" and st.get("idleReason"):
+                    r = st["idleReason"]
+                    reason = "finished" if r == "FINISHED" else "error" if r == "ERROR" else "stopped"
+                    break
+    except OSError:
+        reason = "lost"
+    finally:
+        if ramp:
+            ramp.cancel()
+        if gen != _gen:
+            cc.disconnect()
+    saved, _saved = _saved, None
+    if reason == "lost":
+        cc.disconnect()
+        _restore_volume(cc.ip, _port, saved)
+        return reason
+    try:
+        if saved and saved["volume"] is not None:
+            cc.set_volume(saved["volume"])
+        # Only put back what the athan interrupted, not what the user chose
+        if saved and saved["media"] and reason == "finished":
+            log("resuming {} at {} s".format(saved["app"], int(saved["time"])))
+            await cc.resume(saved["app"], saved["media"], saved["time"])
+    except Exception as e:
+        print("restore after cast failed:", e)
+    finally:
+        cc.disconnect()
+    return reason
@@ -0,0 +1,148 @@
+"""
+Non-blocking SNTP client.
+
+All HOSTS are queried in parallel over UDP and the reply with the lowest
+round-trip delay sets the RTC (to UTC), aligned to the second boundary. The RTC error
+found at each sync gives a drift estimate (kept in persist across reboots),
+and resync_loop() spaces syncs so the drift stays under MAX_ERROR_S.
+Timestamps are integer milliseconds: the Pico's single-precision floats
+cannot hold an NTP timestamp.
+"""
+import asyncio
+import machine
+import socket
+import struct
+import utime as time  # pyright: ignore[reportMissingImports]
+
+import bilalcast.persist as persist
+from bilalcast.logger import log, warn
+
+HOSTS = (
+    "pool.ntp.org",
+    "time.google.com",
+    "time.cloudflare.com",
+    "time.apple.com",
+)
+TIMEOUT_MS = 2000
+MAX_ERROR_S = 2
+MIN_INTERVAL_S = 3600
+DEFAULT_INTERVAL_S = 86400
+# asyncio.sleep() goes through ticks_add(), which rejects 2**29 ms (6.2 days)
+MAX_INTERVAL_S = 5 * 86400
+DRIFT_KEY = "ntp_drift"
+
+# Seconds from the NTP era (1900) to this port's time.time() epoch
+_DELTA = 3155673600 if time.gmtime(0)[0] == 2000 else 2208988800
+
+# time.time() epoch of the last sync this boot, and the smoothed drift (ppm)
+_last_sync = None
+_ppm = None
+last_delay_ms = None
+last_host = None
+
+
+def _ms(msg, i):
+    sec, frac = struct.unpack_from("!II", msg, i)
+    return (sec - _DELTA) * 1000 + ((frac * 1000) >> 32)
+
+
+async def _query(host):
+    """Return (delay_ms, server_ms, ticks) where server_ms was the time at ticks."""
+    addr = socket.getaddrinfo(host, 123)[0][-1]
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.setblocking(False)
+        pkt = bytearray(48)
+        pkt[0] = 0x1B  # LI 0, version 3, mode 3 (client)
+        t1 = time.ticks_ms()
+        s.sendto(pkt, addr)
+        while True:
+            try:
+                msg = s.recv(48)
+                break
+            except OSError:
+                if time.ticks_diff(time.ticks_ms(), t1) > TIMEOUT_MS:
+                    raise OSError("timeout")
+                await asyncio.sleep_ms(10)
+        t4 = time.ticks_ms()
+    finally:
+        s.close()
+    if len(msg) < 48 or msg[0] & 7 != 4 or msg[1] == 0:
+        raise OSError("bad reply")  # stratum 0 is a kiss-of-death
+    t2 = _ms(msg, 32)
+    t3 = _ms(msg, 40)
+    delay = time.ticks_diff(t4, t1) - (t3 - t2)
+    return delay, t3 + delay // 2, t4
+
+
+def _write_rtc(secs):
+    t = time.gmtime(secs)
+    machine.RTC().datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+
+
+def _load_drift():
+    global _ppm
+    if _ppm is None:
+        _ppm = persist.get(DRIFT_KEY)
+
+
+def _record_drift(error_s, now):
+    """Fold this sync's RTC error into the drift estimate."""
+    global _ppm
+    if _last_sync is None:
+        return
+    elapsed = now - _last_sync
+    # One second of RTC resolution needs a few hours to mean anything
+    if elapsed < MIN_INTERVAL_S * 4:
+        return
+    ppm = error_s * 1000000 // elapsed
+    _ppm = ppm if _ppm is None else (_ppm * 3 + ppm) // 4
+    persist.put(DRIFT_KEY, _ppm)
+
+
+async def sync():
+    """Query all HOSTS and set the RTC from the best reply. Returns True on success."""
+    global _last_sync, last_delay_ms, last_host
+    _load_drift()
+    results = await asyncio.gather(*[_query(h) for h in HOSTS], return_exceptions=True)
+    best = None
+    for host, r in zip(HOSTS, results):
+        if isinstance(r, BaseException):
+            print("NTP", host, "failed:", r)
+        elif best is None or r[0] < best[1][0]:
+            best = (host, r)
+    if best is None:
+        return False
+    host, (delay, server_ms, ticks) = best
+    now_ms = server_ms + time.ticks_diff(time.ticks_ms(), ticks)
+    if time.gmtime(now_ms // 1000)[0] < 2024:
+        warn("NTP time from {} implausible".format(host))
+        return False
+
+    # Set the RTC on the next whole second so it is right to within a tick
+    await asyncio.sleep_ms(1000 - now_ms % 1000)
+    now = now_ms // 1000 + 1
+    error_s = time.time() - now
+    _record_drift(error_s, now)
+    _write_rtc(now)
+    _last_sync = now
+    last_delay_ms = delay
+    last_host = host
+    log("RTC set via {} (delay {} ms, was off {} s, drift {} ppm)".format(host, delay, error_s, _ppm))
+    return True
+
+
+def next_interval():
+    """Seconds until the drift would reach MAX_ERROR_S."""
+    _load_drift()
+    if _ppm is None:
+        return DEFAULT_INTERVAL_S
+    return max(MIN_INTERVAL_S, min(MAX_INTERVAL_S, MAX_ERROR_S * 1000000 // max(1, abs(_ppm))))
+
+
+async def resync_loop():
+    """Background task: resync on the adaptive interval, retrying failures hourly."""
+    interval = next_interval()
+    while True:
+        await asyncio.sleep(interval)
+        interval = next_interval() if await sync() else MIN_INTERVAL_S
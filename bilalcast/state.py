@@ -0,0 +1,120 @@
+class State(object):
+    """Shared runtime state with change versioning and per-key subscriptions.
+
+    Fields are read as attributes (``state.cast_host``) or items
+    (``state["cast_host"]``). Writes go through ``set``/``update`` (or item
+    assignment) so the version is bumped and subscribers are notified only
+    when a value actually changes.
+    """
+
+    __slots__ = (
+        "prayer_times",
+        "times_source",
+        "next_prayer",
+        "next_prayer_time",
+        "cast_host",
+        "cast_port",
+        "last_cast_ok",
+        "last_cast_label",
+        "last_cast_end",
+        "lat",
+        "lon",
+        "address",
+        "lat_adj",
+        "midnight",
+        "school",
+        "cast_devices",
+        "scan_in_progress",
+        "local_ip",
+        "boot_epoch",
+        "device_name",
+        "hostname",
+        "version",
+        "_subs",
+        "_snap",
+    )
+
+    def __init__(self):
+        self.prayer_times = None  # packed day, see timetable
+        self.times_source = None  # "live", "calendar" or "stale"
+        self.next_prayer = None
+        self.next_prayer_time = None
+        self.cast_host = None
+        self.cast_port = None
+        self.last_cast_ok = None
+        self.last_cast_label = None
+        self.last_cast_end = None  # why playback ended, see receiver.watch()
+        self.lat = None
+        self.lon = None
+        self.address = None
+        self.lat_adj = 1
+        self.midnight = 0
+        self.school = 0
+        self.cast_devices = []
+        self.scan_in_progress = False
+        self.local_ip = None
+        self.boot_epoch = 0
+        self.device_name = None
+        self.hostname = "bilalcast"
+        self.version = 0
+        self._subs = {}
+        self._snap = None
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def set(self, key, value):
+        """Set one field. Returns True if the value changed."""
+        if key not in State.__slots__ or key[0] == "_" or key == "version":
+            raise KeyError(key)
+        old = getattr(self, key)
+        # Containers are compared by identity: callers replace them rather
+        # than mutating in place, and deep equality is costly on the Pico.
+        if old is value or (not isinstance(value, (dict, list)) and old == value):
+            return False
+        setattr(self, key, value)
+        self.version += 1
+        self._snap = None
+        self._notify(key, value)
+        return True
+
+    def update(self, **fields):
+        """Set several fields at once. Returns the list of keys that changed."""
+        changed = []
+        for key, value in fields.items():
+            if self.set(key, value):
+                changed.append(key)
+        return changed
+
+    def subscribe(self, keys, callback):
+        """Call ``callback(key, value)`` whenever one of ``keys`` changes.
+
+        ``keys`` is a field name, a sequence of names, or ``"*"`` for all.
+        """
+        if isinstance(keys, str):
+            keys = (keys,)
+        for key in keys:
+            self._subs.setdefault(key, []).append(callback)
+
+    def _notify(self, key, value):
+        for cb in self._subs.get(key, []) + self._subs.get("*", []):
+            try:
+                cb(key, value)
+            except Exception as e:
+                print("state subscriber failed:", key, e)
+
+    def snapshot(self):
+        """Return a dict of all public fields. Reused until the next change."""
+        if self._snap is None:
+            snap = {}
+            for key in State.__slots__:
+                if key[0] != "_":
+                    snap[key] = getattr(self, key)
+            self._snap = snap
+        return self._snap
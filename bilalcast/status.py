@@ -1,14 +1,19 @@
 import asyncio
 import json
 import os
-import time
 import machine  # pyright: ignore[reportMissingImports]
 import network  # pyright: ignore[reportMissingImports]
 
+import bilalcast.persist as persist
+import bilalcast.timetable as timetable
+import bilalcast.tz as tz
 from bilalcast.phew import server
 from bilalcast.phew.template import render_template
 from bilalcast.prayer import ATHANS_ORDER
 
+# Templates ship inside the active OTA slot, next to the bilalcast package
+_WWW = __file__[: __file__.rfind("bilalcast/")] + "www/"
+
 
 def _rssi_svg(dbm_str):
     try:
@@ -36,20 +41,122 @@ def _rssi_svg(dbm_str):
 
 def _label_12h(label):
     if label and len(label) >= 5 and label[-3] == ":":
-        return label[:-5] + _fmt12(label[-5:])
+        return label[:-5] + _fmt12(timetable.minutes(label[-5:]))
     return label
 
 
-def _fmt12(hhmm):
-    h, m = hhmm.split(":")
-    h = int(h)
+def _fmt12(t):
+    h, m = divmod(t, 60)
     suffix = "AM" if h < 12 else "PM"
     h12 = h % 12 or 12
-    return "{}:{:02d} {}".format(h12, int(m), suffix)
+    return "{}:{:02d} {}".format(h12, m, suffix)
+
+
+def _boot_profile():
+    from bilalcast import boottime
+
+    rows = ""
+    for label, ms in boottime.marks():
+        rows += "<tr><td>" + label + "</td><td>{} ms</td></tr>".format(ms)
+    for name, self_ms, total_ms, heap in boottime.slowest(8):
+        rows += "<tr><td>import " + name + "</td><td>{} ms &middot; {} KB</td></tr>".format(
+            self_ms, heap // 1024
+        )
+    if not rows:
+        return ""
+    return "<details><summary>Boot profile</summary><table>" + rows + "</table></details>"
+
+
+def _fetch_stats():
+    from bilalcast import fetch
+
+    rows = ""
+    for b in fetch.breakers():
+        rows += "<tr><td>{}</td><td>{}</td><td>{} calls &middot; {} retries &middot; {} errors &middot; {} fallbacks</td></tr>".format(
+            b.name, b.state(), b.calls, b.retries, b.errors, b.fallbacks
+        )
+        if b.last_error and b.state() != "closed":
+            rows += "<tr><td></td><td colspan=2>" + b.last_error + "</td></tr>"
+    if not rows:
+        return ""
+    return "<details><summary>Network fetches</summary><table>" + rows + "</table></details>"
+
+
+def _audio_stats():
+    from bilalcast import audiocache as c
+
+    if not (c.hits or c.misses or c.downloads):
+        return ""
+    files, size = c.stats()
+    looked_up = c.hits + c.misses
+    return (
+        "<details><summary>Audio cache</summary><table>"
+        "<tr><td>Hit ratio</td><td>{}% ({} hits &middot; {} misses)</td></tr>"
+        "<tr><td>Served</td><td>{} KB</td></tr>"
+        "<tr><td>Stored</td><td>{} files &middot; {} KB</td></tr>"
+        "<tr><td>Fetched</td><td>{} downloads &middot; {} not modified &middot; {} evicted</td></tr>"
+        "</table></details>"
+    ).format(
+        c.hits * 100 // looked_up if looked_up else 0,
+        c.hits,
+        c.misses,
+        c.bytes_served // 1024,
+        files,
+        size // 1024,
+        c.downloads,
+        c.revalidated,
+        c.evictions,
+    )
+
+
+def _times_source(state):
+    source = state["times_source"]
+    if source == "calendar":
+        from bilalcast import offline
+
+        last = offline.last_day()
+        until = " through {:04d}-{:02d}-{:02d}".format(*tz.from_days(last)) if last else ""
+        return "<p style='margin:6px 0 0;font-size:.8rem;color:#888'>From offline calendar" + until + "</p>"
+    if source == "stale":
+        return "<p class=fl style='margin:6px 0 0;font-size:.8rem'>Stale source: last known times, prayer API unreachable</p>"
+    return ""
+
+
+def _prayer_rows(s, now_mins):
+    rows = ""
+    times = s["prayer_times"] or timetable.empty()
+    for i, p in enumerate(ATHANS_ORDER):
+        t = times[i]
+        display = _fmt12(t) if t != timetable.NONE else "&mdash;"
+        if p == s["next_prayer"]:
+            css = " class=nx"
+        elif t != timetable.NONE:
+            css = " class=ps" if t <= now_mins else ""
+        else:
+            css = ""
+        rows += "<tr" + css + "><td>" + p + "</td><td>" + display + "</td></tr>"
+    return rows
+
+
+def _last_cast(s):
+    end = s["last_cast_end"]
+    if s["last_cast_ok"] is True and end and end != "finished":
+        return "<span class=fl>" + _label_12h(s["last_cast_label"] or "") + " &#10007;</span> (" + end + ")"
+    if s["last_cast_ok"] is True:
+        return "<span class=ok>" + _label_12h(s["last_cast_label"] or "") + " &#10003;</span>"
+    if s["last_cast_ok"] is False:
+        return "<span class=fl>" + _label_12h(s["last_cast_label"] or "") + " &#10007;</span>"
+    return "none yet"
+
+
+# ((state version, minute of day), prayer rows, last cast) of the last render;
+# the page is polled far more often than either changes
+_fragments = (None, "", "")
 
 
 def render_status(state):
-    now = time.localtime()
+    global _fragments
+    now = tz.localtime()
     hour = now[3]
     suffix = "AM" if hour < 12 else "PM"
     hour12 = hour % 12 or 12
@@ -60,45 +167,40 @@ def render_status(state):
         rssi = str(network.WLAN(network.STA_IF).status("rssi"))
     except Exception:
         rssi = "?"
+    # Every field from one state version, and no dict built per request
+    s = state.snapshot()
     now_mins = now[3] * 60 + now[4]
-    rows = ""
-    for p in ATHANS_ORDER:
-        t = state["prayer_times"].get(p, "")
-        display = _fmt12(t) if t else "&mdash;"
-        if p == state["next_prayer"]:
-            css = " class=nx"
-        elif t:
-            h, m = t.split(":")
-            css = " class=ps" if int(h) * 60 + int(m) <= now_mins else ""
-        else:
-            css = ""
-        rows += "<tr" + css + "><td>" + p + "</td><td>" + display + "</td></tr>"
-    if state["last_cast_ok"] is True:
-        lc = "<span class=ok>" + _label_12h(state["last_cast_label"] or "") + " &#10003;</span>"
-    elif state["last_cast_ok"] is False:
-        lc = "<span class=fl>" + _label_12h(state["last_cast_label"] or "") + " &#10007;</span>"
-    else:
-        lc = "none yet"
-    if state["cast_host"]:
-        cast_status = "<span class=ok>Found &#10003;</span>"
+    key = (s["version"], now_mins)
+    if _fragments[0] != key:
+        _fragments = (key, _prayer_rows(s, now_mins), _last_cast(s))
+    _, rows, lc = _fragments
+    from bilalcast import health
+
+    if s["cast_host"] and health.failures:
+        cast_status = "<span class=fl>Unreachable &#9888;</span>"
+    elif s["cast_host"]:
+        rtt = " {} ms".format(health.rtt_ms) if health.rtt_ms is not None else ""
+        cast_status = "<span class=ok>Found &#10003;</span>" + rtt
     else:
         cast_status = "<span class=fl>Not found &#9888;</span>"
-    try:
-        with open("ota_version.txt") as _f:
-            ota_version = _f.read().strip()
-    except Exception:
-        ota_version = "unknown"
+    from bilalcast.ota import current_version
+
+    ota_version = current_version() or "unknown"
     return render_template(
-        "www/status.html",
-        device_name=state["device_name"] or "Bilal Cast",
+        _WWW + "status.html",
+        device_name=s["device_name"] or "Bilal Cast",
         cast_status=cast_status,
         local_time=local_time,
-        local_ip=state["local_ip"] or "?",
+        local_ip=s["local_ip"] or "?",
         rssi_svg=_rssi_svg(rssi),
         rows=rows,
         lc=lc,
-        hostname=state["hostname"] or "bilalcast",
+        hostname=s["hostname"] or "bilalcast",
         ota_version=ota_version,
+        boot_profile=_boot_profile(),
+        fetch_stats=_fetch_stats(),
+        audio_stats=_audio_stats(),
+        times_source=_times_source(s),
     )
 
 
@@ -107,7 +209,7 @@ def render_settings(state, pre_athan_mins, calc_method, prayer_volumes):
     for p in ["Fajr", "Dhuhr", "Asr", "Maghrib", "Isha"]:
         vols[p] = str(round(prayer_volumes.get(p, 0.5) * 100))
     return render_template(
-        "www/settings.html",
+        _WWW + "settings.html",
         address=str(state.get("address") or ""),
         lat=str(state["lat"] or ""),
         lon=str(state["lon"] or ""),
@@ -163,10 +265,7 @@ def save_settings(form, config_file):
     if new_name:
         cfg["cast_device_name"] = new_name
         if new_name != old_name:
-            try:
-                os.remove("cast_device.json")
-            except Exception:
-                pass
+            persist.delete("cast_device")
     cast_host = form.get("cast_device_host", "").strip()
     cast_port_str = form.get("cast_device_port", "").strip()
     if cast_host and cast_port_str:
@@ -175,12 +274,12 @@ def save_settings(form, config_file):
             _save_cast_cache(cast_host, int(cast_port_str))
         except Exception:
             pass
-    with open(config_file, "w") as f:
-        json.dump(cfg, f)
+    persist.write_atomic(config_file, json.dumps(cfg))
+    persist.flush()
     machine.Timer(-1).init(
         period=1000,
         mode=machine.Timer.ONE_SHOT,
-        callback=lambda t: machine.reset(),
+        callback=lambda t: persist.reboot(),
     )
 
 
@@ -207,6 +306,18 @@ def start_status_server(
 
         return DATA, 200, "image/png"
 
+    @app.route("/audio/<name>", methods=["GET", "HEAD"])
+    def audio_route(request, name):
+        from bilalcast import audio
+
+        return audio.serve(app, request, name)
+
+    @app.route("/cache/<name>", methods=["GET", "HEAD"])
+    def audio_cache_route(request, name):
+        from bilalcast import audiocache
+
+        return audiocache.serve(app, request, name)
+
     @app.route("/settings", methods=["GET"])
     def settings_page(request):
         return render_settings(state, pre_athan_mins, calc_method, prayer_volumes)
@@ -215,11 +326,17 @@ def start_status_server(
     def settings_save(request):
         return save_settings(request.form, config_file)
 
+    @app.route("/metrics", methods=["GET"])
+    def metrics_route(request):
+        from bilalcast import metrics
+
+        return metrics.export(), 200, "text/plain; version=0.0.4"
+
     @app.route("/cast-devices", methods=["GET"])
     def cast_devices_route(request):
         return json.dumps({
-            "devices": state.get("cast_devices") or [],
-            "scanning": state.get("scan_in_progress", False),
+            "devices": state.cast_devices or [],
+            "scanning": state.scan_in_progress,
         }), 200, "application/json"
 
     @app.route("/scan-cast-devices", methods=["POST"])
@@ -227,27 +344,27 @@ def start_status_server(
         from bilalcast.discovery import list_cast_devices
 
         async def _scan():
-            state["scan_in_progress"] = True
+            state.set("scan_in_progress", True)
             new_devices = await list_cast_devices(local_ip)
-            existing = state.get("cast_devices") or []
-            existing_names = [d["name"] for d in existing]
+            # Build a new list so subscribers see the change
+            devices = list(state.cast_devices or [])
+            existing_names = [d["name"] for d in devices]
             for d in new_devices:
                 if d["name"] not in existing_names:
-                    existing.append(d)
+                    devices.append(d)
                     existing_names.append(d["name"])
-            state["cast_devices"] = existing
-            state["scan_in_progress"] = False
+            state.update(cast_devices=devices, scan_in_progress=False)
 
         asyncio.create_task(_scan())
         return "ok", 200
 
     @app.route("/factory-reset", methods=["POST"])
     def factory_reset_route(request):
-        for f in (config_file, "cast_device.json", "cast_state.json"):
-            try:
-                os.remove(f)
-            except Exception:
-                pass
+        try:
+            os.remove(config_file)
+        except Exception:
+            pass
+        persist.wipe()
         machine.Timer(-1).init(
             period=1000,
             mode=machine.Timer.ONE_SHOT,
@@ -0,0 +1,107 @@
+"""
+Packed prayer timetables.
+
+A day is an array('H') of ATHANS_ORDER minutes since local midnight, with
+NONE for a missing prayer; "HH:MM" strings only appear at the edges (API
+parsing, logs, the status page). A year of days lives in a flash file of
+fixed-size records, so looking up any day is one seek and one 10-byte read
+and costs no heap for the days that are not in use.
+
+For a year (365 x 5 times) that is one 3.7 KB array, or just the 10-byte
+record read from flash, instead of 365 dicts and 1825 small strings
+(bench/timetable_mem.py measures both).
+"""
+from array import array
+import struct
+
+PRAYERS = ("Fajr", "Dhuhr", "Asr", "Maghrib", "Isha")
+NONE = 0xFFFF
+
+# File header: magic, record count, first day (days since 1970-01-01)
+_MAGIC = b"BTT1"
+_HEADER = "<4sHi"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_RECORD = 2 * len(PRAYERS)
+
+
+def minutes(hhmm):
+    """Minutes since midnight for an "HH:MM" string (seconds or suffixes ignored)."""
+    return int(hhmm[:2]) * 60 + int(hhmm[3:5])
+
+
+def hhmm(mins):
+    return "{:02d}:{:02d}".format((mins // 60) % 24, mins % 60)
+
+
+def empty():
+    return array("H", [NONE] * len(PRAYERS))
+
+
+def pack(timings):
+    """Pack an Aladhan-style ``{"Fajr": "05:12", ...}`` dict into a day array."""
+    day = empty()
+    for i, p in enumerate(PRAYERS):
+        t = timings.get(p)
+        if t:
+            day[i] = minutes(t)
+    return day
+
+
+def to_dict(day):
+    """``{"Fajr": "05:12", ...}`` for display and logs."""
+    d = {}
+    for i, p in enumerate(PRAYERS):
+        if day[i] != NONE:
+            d[p] = hhmm(day[i])
+    return d
+
+
+def has_times(day):
+    if not day:
+        return False
+    for m in day:
+        if m != NONE:
+            return True
+    return False
+
+
+def write(path, first_day, days):
+    """Write ``days`` (day arrays, consecutive from ``first_day``) as a timetable file."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(struct.pack(_HEADER, _MAGIC, len(days), first_day))
+        for day in days:
+            f.write(day)
+    import os
+
+    os.rename(tmp, path)
+
+
+def info(path):
+    """(first_day, count) for a timetable file, or None if missing or invalid."""
+    try:
+        with open(path, "rb") as f:
+            magic, count, first = struct.unpack(_HEADER, f.read(_HEADER_SIZE))
+    except (OSError, ValueError):
+        return None
+    if magic != _MAGIC:
+        return None
+    return first, count
+
+
+def read_day(path, day_num):
+    """The day array for ``day_num`` (days since 1970-01-01), or None if not covered."""
+    try:
+        with open(path, "rb") as f:
+            magic, count, first = struct.unpack(_HEADER, f.read(_HEADER_SIZE))
+            i = day_num - first
+            if magic != _MAGIC or not 0 <= i < count:
+                return None
+            f.seek(_HEADER_SIZE + i * _RECORD)
+            day = empty()
+            # MicroPython's array is a writable buffer; its stub says otherwise
+            if f.readinto(day) != _RECORD:  # type: ignore[arg-type]
+                return None
+            return day
+    except (OSError, ValueError):
+        return None
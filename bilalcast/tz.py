@@ -0,0 +1,196 @@
+"""
+Local time from a UTC RTC and a POSIX TZ rule.
+
+The RTC always holds UTC. set_zone() picks the rule for the IANA name that
+ip-api reports (see tzdb.py), falling back to its fixed offset for names not
+in the table, and localtime()/mktime() apply whichever offset is in force at
+the instant being converted, so DST changes take effect on time.
+"""
+import sys
+import utime as time  # pyright: ignore[reportMissingImports]
+
+# Days from 1970-01-01 to this port's time.time() epoch
+_EPOCH_DAYS = 10957 if time.gmtime(0)[0] == 2000 else 0
+
+zone = ""
+rule = ""
+# (std_offset, dst_offset, start, end); offsets in seconds east of UTC,
+# start/end are parsed date rules or None when the zone has no DST
+_rule = (0, 0, None, None)
+# year -> (dst_start_utc, dst_end_utc)
+_cache = {}
+
+
+def days(y, m, d):
+    """Days from 1970-01-01 to the given civil date."""
+    y -= m <= 2
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m + (-3 if m > 2 else 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _name_end(spec, i):
+    if spec[i] == "<":
+        return spec.index(">", i) + 1
+    while i < len(spec) and spec[i].isalpha():
+        i += 1
+    return i
+
+
+def _hms(spec, i):
+    """Parse ``[+-]hh[:mm[:ss]]`` at ``i``; returns (seconds, end index)."""
+    sign = 1
+    if i < len(spec) and spec[i] in "+-":
+        sign = -1 if spec[i] == "-" else 1
+        i += 1
+    j = i
+    while j < len(spec) and (spec[j].isdigit() or spec[j] == ":"):
+        j += 1
+    secs = 0
+    scale = 3600
+    for part in spec[i:j].split(":"):
+        secs += int(part) * scale
+        scale //= 60
+    return sign * secs, j
+
+
+def _date_rule(s):
+    if "/" in s:
+        s, t = s.split("/")
+        at = _hms(t, 0)[0]
+    else:
+        at = 7200
+    if s[0] == "M":
+        m, w, d = s[1:].split(".")
+        return ("M", int(m), int(w), int(d), at)
+    if s[0] == "J":
+        return ("J", int(s[1:]), 0, 0, at)
+    return ("N", int(s), 0, 0, at)
+
+
+def parse(spec):
+    """Parse a POSIX TZ rule such as ``EST5EDT,M3.2.0,M11.1.0``.
+
+    Returns (std_offset, dst_offset, start, end) with offsets in seconds east
+    of UTC (POSIX writes them west-positive).
+    """
+    i = _name_end(spec, 0)
+    std, i = _hms(spec, i)
+    std = -std
+    if i >= len(spec):
+        return std, std, None, None
+    i = _name_end(spec, i)
+    dst = std + 3600
+    if i < len(spec) and spec[i] != ",":
+        dst, i = _hms(spec, i)
+        dst = -dst
+    # A DST name without dates means the POSIX default (US) rules
+    start, end = (spec[i + 1 :] if i < len(spec) else "M3.2.0,M11.1.0").split(",")
+    return std, dst, _date_rule(start), _date_rule(end)
+
+
+def _rule_day(y, r):
+    kind, a, w, d, _ = r
+    if kind == "J":
+        # 1..365, Feb 29 never counted
+        leap = y % 4 == 0 and (y % 100 != 0 or y % 400 == 0)
+        return days(y, 1, 1) + a - 1 + (1 if leap and a >= 60 else 0)
+    if kind == "N":
+        return days(y, 1, 1) + a
+    first = days(y, a, 1)
+    month_len = (days(y + 1, 1, 1) if a == 12 else days(y, a + 1, 1)) - first
+    day = (d - (first + 4)) % 7  # 1970-01-01 was a Thursday
+    day += (w - 1) * 7
+    while day >= month_len:
+        day -= 7
+    return first + day
+
+
+def _transitions(y):
+    t = _cache.get(y)
+    if t is None:
+        # Only reached from utc_offset once it has seen a DST rule, so start
+        # and end are not None here
+        std, dst, start, end = _rule
+        t = (
+            (_rule_day(y, start) - _EPOCH_DAYS) * 86400 + start[4] - std,  # type: ignore[index]
+            (_rule_day(y, end) - _EPOCH_DAYS) * 86400 + end[4] - dst,  # type: ignore[index]
+        )
+        _cache[y] = t
+    return t
+
+
+def set_zone(name, fallback_offset=0):
+    """Use the rule for IANA zone ``name``, or a fixed ``fallback_offset`` if unknown."""
+    global zone, rule, _rule
+    import bilalcast.tzdb
+
+    spec = bilalcast.tzdb.lookup(name)
+    # The table is only needed for this lookup; unlink it so it can be freed
+    del sys.modules["bilalcast.tzdb"]
+    del bilalcast.tzdb
+    _cache.clear()
+    zone = name
+    if spec:
+        rule = spec
+        _rule = parse(spec)
+    else:
+        rule = ""
+        _rule = (fallback_offset, fallback_offset, None, None)
+    return rule
+
+
+def utc_offset(t=None):
+    """Seconds east of UTC in force at UTC epoch ``t`` (default now)."""
+    if t is None:
+        t = time.time()
+    std, dst, start, _ = _rule
+    if start is None:
+        return std
+    s, e = _transitions(time.gmtime(t + std)[0])
+    if s < e:
+        in_dst = s <= t < e
+    else:
+        # Southern hemisphere: DST spans the new year
+        in_dst = not (e <= t < s)
+    return dst if in_dst else std
+
+
+def day_number(t=None):
+    """Local date at UTC epoch ``t`` (default now), as days since 1970-01-01."""
+    lt = localtime(t)
+    return days(lt[0], lt[1], lt[2])
+
+
+def from_days(n):
+    """(year, month, day) for a days-since-1970 number."""
+    return time.gmtime((n - _EPOCH_DAYS) * 86400)[:3]
+
+
+def localtime(t=None):
+    """Like time.localtime(), for the configured zone."""
+    if t is None:
+        t = time.time()
+    return time.gmtime(t + utc_offset(t))
+
+
+def mktime(y, m, d, hh=0, mm=0, ss=0):
+    """UTC epoch of a local wall-clock time.
+
+    A time skipped by a DST jump maps to the instant after the jump; a
+    repeated time maps to its first occurrence.
+    """
+    local = (days(y, m, d) - _EPOCH_DAYS) * 86400 + hh * 3600 + mm * 60 + ss
+    std, dst, _, _ = _rule
+    t_std = local - std
+    t_dst = local - dst
+    std_ok = utc_offset(t_std) == std
+    dst_ok = utc_offset(t_dst) == dst
+    if std_ok and dst_ok:
+        return min(t_std, t_dst)
+    if std_ok or dst_ok:
+        return t_std if std_ok else t_dst
+    # In the gap: read it with the offset from before the jump
+    return max(t_std, t_dst)
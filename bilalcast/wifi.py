@@ -0,0 +1,186 @@
+"""
+Wi-Fi station connection manager.
+
+The BSSID and channel of the last good association are kept in persist so a
+reconnect can join that AP directly instead of scanning every channel, and
+the DHCP lease from earlier in this boot is reused when the link drops. A
+failed fast join drops the hints and falls back to a normal scan + DHCP.
+Failed attempts back off exponentially with jitter; after RESET_AFTER of
+them the device resets, unless ``can_reset()`` says an athan is due.
+"""
+import asyncio
+import network  # pyright: ignore[reportMissingImports]
+import random
+import ubinascii  # pyright: ignore[reportMissingImports]
+import utime as time  # pyright: ignore[reportMissingImports]
+
+import bilalcast.persist as persist
+from bilalcast.logger import log, warn
+
+HINT_KEY = "wifi_hint"
+POLL_MS = 100
+FAST_TIMEOUT_MS = 4000
+TIMEOUT_MS = 20000
+BACKOFF_MIN_MS = 500
+BACKOFF_MAX_MS = 60000
+RESET_AFTER = 10
+
+_ssid = None
+_password = None
+_hostname = None
+_can_reset = None
+# ifconfig() tuple from this boot's DHCP lease
+_lease = None
+_lock = asyncio.Lock()
+
+
+def configure(ssid, password, hostname=None, can_reset=None):
+    """Set credentials. ``can_reset()`` returning False postpones the give-up reset."""
+    global _ssid, _password, _hostname, _can_reset
+    _ssid = ssid
+    _password = password
+    _hostname = hostname
+    _can_reset = can_reset
+
+
+def _wlan():
+    return network.WLAN(network.STA_IF)
+
+
+def ip():
+    """Current station IP, or None when not connected."""
+    w = _wlan()
+    return w.ifconfig()[0] if w.isconnected() else None
+
+
+def gateway():
+    """Default gateway address, or None when not connected."""
+    w = _wlan()
+    return w.ifconfig()[2] if w.isconnected() else None
+
+
+def _failed(status):
+    return status in (network.STAT_WRONG_PASSWORD, network.STAT_NO_AP_FOUND, network.STAT_CONNECT_FAIL)
+
+
+async def _wait(w, timeout_ms):
+    deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+    while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+        if w.isconnected() and w.status() == network.STAT_GOT_IP:
+            return True
+        if _failed(w.status()):
+            return False
+        await asyncio.sleep_ms(POLL_MS)
+    return False
+
+
+def _start(w, hint, lease):
+    if _hostname:
+        try:
+            network.hostname(_hostname)
+        except Exception:
+            pass
+    w.active(True)
+    try:
+        # A static lease skips DHCP; "dhcp" undoes one left by a fast join
+        w.ifconfig(lease or "dhcp")
+    except Exception:
+        pass
+    if hint:
+        try:
+            w.connect(
+                _ssid, _password, bssid=ubinascii.unhexlify(hint["bssid"]), channel=hint["channel"]
+            )
+            return
+        except (TypeError, ValueError, KeyError):
+            pass  # firmware without bssid/channel support, or a bad hint
+    w.connect(_ssid, _password)
+
+
+async def _fast_join(w, hint):
+    """Join the remembered AP, reusing this boot's lease if there is one."""
+    _start(w, hint, _lease)
+    if await _wait(w, FAST_TIMEOUT_MS):
+        return True
+    w.disconnect()
+    return False
+
+
+async def _full_join(w):
+    global _lease
+    # Power-cycle the radio, as a wedged CYW43 otherwise never recovers
+    w.active(False)
+    await asyncio.sleep_ms(200)
+    _start(w, None, None)
+    if await _wait(w, TIMEOUT_MS):
+        _lease = w.ifconfig()
+        return True
+    print("Wi-Fi join failed, status", w.status())
+    w.disconnect()
+    return False
+
+
+def _learn_hint(w):
+    """Remember the strongest AP for our SSID; costs one scan per network change."""
+    best = None
+    try:
+        for ssid, bssid, channel, rssi, _, _ in w.scan():
+            if ssid.decode() == _ssid and (best is None or rssi > best[2]):
+                best = (bssid, channel, rssi)
+    except Exception as e:
+        print("Wi-Fi scan failed:", e)
+    if best:
+        persist.put(HINT_KEY, {"bssid": ubinascii.hexlify(best[0]).decode(), "channel": best[1]})
+
+
+async def _connect(w):
+    global _lease
+    hint = persist.get(HINT_KEY)
+    if hint or _lease:
+        t0 = time.ticks_ms()
+        if await _fast_join(w, hint):
+            print("Wi-Fi fast join in", time.ticks_diff(time.ticks_ms(), t0), "ms")
+            return True
+        persist.delete(HINT_KEY)
+        _lease = None
+    if not await _full_join(w):
+        return False
+    _learn_hint(w)
+    return True
+
+
+async def ensure():
+    """Return the station IP, (re)connecting with backoff first if needed.
+
+    Concurrent callers share one connection attempt.
+    """
+    w = _wlan()
+    if w.isconnected():
+        return w.ifconfig()[0]
+    async with _lock:
+        if w.isconnected():
+            return w.ifconfig()[0]
+        delay = BACKOFF_MIN_MS
+        failures = 0
+        while not await _connect(w):
+            failures += 1
+            if failures >= RESET_AFTER and (_can_reset is None or _can_reset()):
+                log("Wi-Fi failed after {} attempts; resetting.".format(failures))
+                time.sleep(1)
+                persist.reboot()
+            # Jitter so several devices behind one rebooting AP don't retry
+            # in lockstep
+            await asyncio.sleep_ms(delay // 2 + random.getrandbits(16) % delay)
+            delay = min(delay * 2, BACKOFF_MAX_MS)
+        local_ip = w.ifconfig()[0]
+        log("connected to wifi: " + local_ip)
+        return local_ip
+
+
+async def watch(period_ms=2000):
+    """Background task: reconnect as soon as the link drops."""
+    while True:
+        await asyncio.sleep_ms(period_ms)
+        if not _wlan().isconnected():
+            warn("WiFi dropped, reconnecting...")
+            await ensure()